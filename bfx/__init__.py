@@ -26,3 +26,26 @@ __all__ = [
     "trimmomatic",
     "vcftools"
 ]
+
+# Python Standard Modules
+import importlib
+
+# Proxy of a bfx wrapper module, imported when one of its attributes is first used,
+# so that pipeline startup (e.g. "--help") does not import the bfx wrappers of all steps
+class LazyModule(object):
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+    def __repr__(self):
+        return "<lazy module '" + self._name + "'>"
+
+# Return a lazy proxy of a bfx wrapper module, e.g. gatk = lazy_import("gatk")
+def lazy_import(name):
+    return LazyModule(__name__ + "." + name)
@@ -77,7 +77,7 @@ show-snps -rlTC \\
 
     # Mammouth does not have libgd by default. Module must be loaded explicitely
     if config.param('mummer_reference', 'module_libgd', required=False):
-        job.modules.append(config.param('mummer_reference', 'module_libgd', required=False))
+        job.modules = list(job.modules) + [config.param('mummer_reference', 'module_libgd', required=False)]
 
     return job
 
@@ -116,6 +116,6 @@ mummerplot --png --layout --filter \\
 
     # Mammouth does not have libgd by default. Module must be loaded explicitely
     if config.param('mummer_self', 'module_libgd', required=False):
-        job.modules.append(config.param('mummer_self', 'module_libgd', required=False))
+        job.modules = list(job.modules) + [config.param('mummer_self', 'module_libgd', required=False)]
 
     return job
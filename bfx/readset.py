@@ -305,8 +305,8 @@ def parse_illumina_raw_readset_files(output_dir, run_type, nanuq_readset_file, c
             reference_file = os.path.join(current_genome_folder,
                                           "genome",
                                           folder_name + ".fa")
-            if reference_file and os.path.isfile(reference_file):
-                if aligner_reference_index and (os.path.isfile(aligner_reference_index) or os.path.isdir(aligner_reference_index)):
+            if reference_file and stat_cache.isfile(reference_file):
+                if aligner_reference_index and (stat_cache.isfile(aligner_reference_index) or stat_cache.isdir(aligner_reference_index)):
                     readset._aligner_reference_index = aligner_reference_index
                     readset._annotation_files = annotation_files
                     readset._reference_file = reference_file
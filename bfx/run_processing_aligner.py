@@ -21,14 +21,16 @@
 
 from core.job import *
 from core.config import *
-from bfx import bvatools
-from bfx import snpeff
-from bfx import verify_bam_id
-from bfx import bwa
-from bfx import metrics
-from bfx import picard
-from bfx import star
-from bfx import tools
+# bfx wrappers, imported when first used by a step
+from bfx import lazy_import
+bvatools = lazy_import("bvatools")
+snpeff = lazy_import("snpeff")
+verify_bam_id = lazy_import("verify_bam_id")
+bwa = lazy_import("bwa")
+metrics = lazy_import("metrics")
+picard = lazy_import("picard")
+star = lazy_import("star")
+tools = lazy_import("tools")
 
 
 class RunProcessingAligner(object):
@@ -83,7 +85,7 @@ class BwaRunProcessingAligner(RunProcessingAligner):
     def get_annotation_files(self):
         folder_name = os.path.basename(self.genome_folder)
         ini_file = os.path.join(self.genome_folder + os.sep + folder_name + ".ini")
-        if os.path.isfile(ini_file):
+        if stat_cache.isfile(ini_file):
             genome_config = ConfigParser.SafeConfigParser()
             genome_config.read(ini_file)
 
@@ -143,7 +145,7 @@ class BwaRunProcessingAligner(RunProcessingAligner):
             full_coverage_bed = None
 
         if coverage_bed:
-            if (not os.path.exists(full_coverage_bed)) and \
+            if (not stat_cache.exists(full_coverage_bed)) and \
                     (coverage_bed not in BwaRunProcessingAligner.downloaded_bed_files):
                 # Download the bed file
                 command = config.param('DEFAULT', 'fetch_bed_file_command').format(
@@ -192,7 +194,7 @@ class BwaRunProcessingAligner(RunProcessingAligner):
             detects sample swaps.
         """
         jobs = []
-        if len(readset.annotation_files) > 0 and os.path.isfile(readset.annotation_files[0]):
+        if len(readset.annotation_files) > 0 and stat_cache.isfile(readset.annotation_files[0]):
 
             known_variants_annotated = readset.annotation_files[0]
             known_variants_annotated_filtered = known_variants_annotated
@@ -231,7 +233,7 @@ class StarRunProcessingAligner(RunProcessingAligner):
     def get_reference_index(self):
         folder_name = os.path.basename(self.genome_folder)
         ini_file = os.path.join(self.genome_folder + os.sep + folder_name + ".ini")
-        if os.path.isfile(ini_file):
+        if stat_cache.isfile(ini_file):
             genome_config = ConfigParser.SafeConfigParser()
             genome_config.read(ini_file)
 
@@ -248,7 +250,7 @@ class StarRunProcessingAligner(RunProcessingAligner):
     def get_annotation_files(self):
         folder_name = os.path.basename(self.genome_folder)
         ini_file = os.path.join(self.genome_folder + os.sep + folder_name + ".ini")
-        if os.path.isfile(ini_file):
+        if stat_cache.isfile(ini_file):
             genome_config = ConfigParser.SafeConfigParser()
             genome_config.read(ini_file)
 
@@ -296,7 +298,7 @@ class StarRunProcessingAligner(RunProcessingAligner):
             rg_center=rg_center if rg_center else ""
         )
         # we clean the output of the star job since we move the file, and the moved file is the output of the move job
-        star_job._output_files = []
+        star_job.output_files = []
 
         job = concat_jobs([
             star_job,
@@ -327,7 +329,7 @@ class StarRunProcessingAligner(RunProcessingAligner):
         output_directory = os.path.join(input_bam_directory, "rnaseqc_" + readset.sample.name + "." + readset.library)
         ribosomal_interval_file = os.path.join(output_directory, "empty.list")
 
-        if len(readset.annotation_files) > 0 and os.path.isfile(readset.annotation_files[0]):
+        if len(readset.annotation_files) > 0 and stat_cache.isfile(readset.annotation_files[0]):
             gtf_transcript_id = readset.annotation_files[0]
             reference = readset.reference_file
             job = concat_jobs([
@@ -369,7 +371,7 @@ class StarRunProcessingAligner(RunProcessingAligner):
         job.name = "picard_collect_multiple_metrics." + readset.name + ".met" + "." + readset.run + "." + readset.lane
         jobs.append(job)
 
-        if len(readset.annotation_files) > 2 and os.path.isfile(readset.annotation_files[2]):
+        if len(readset.annotation_files) > 2 and stat_cache.isfile(readset.annotation_files[2]):
             job = picard.collect_rna_metrics(alignment_file,
                                              os.path.join(output_directory, sample.name),
                                              readset.annotation_files[2],
@@ -391,7 +393,7 @@ class StarRunProcessingAligner(RunProcessingAligner):
         """
 
         jobs = []
-        if len(readset.annotation_files) > 1 and os.path.isfile(readset.annotation_files[0]) and os.path.isfile(
+        if len(readset.annotation_files) > 1 and stat_cache.isfile(readset.annotation_files[0]) and stat_cache.isfile(
                 readset.annotation_files[1]):
             readset_bam = readset.bam + ".bam"
             readset_metrics_bam = readset.bam + ".rRNA.bam"
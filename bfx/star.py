@@ -139,7 +139,9 @@ STAR --runMode alignReads \\
 def index(
     genome_index_folder,
     junction_file,
-    gtf = config.param('star_align', 'gtf', type='filepath', required=False),
+    # No GTF by default: the former default config.param('star_align', 'gtf') was evaluated at import time,
+    # before config files were parsed, hence always empty
+    gtf = None,
     ):
     #STAR --runMode genomeGenerate --genomeDir $odir --genomeFastaFiles $genome --runThreadN $runThreadN --limitGenomeGenerateRAM $limitGenomeGenerateRAM --sjdbOverhang $sjdbOverhang  --sjdbFileChrStartEnd "
 
@@ -24,7 +24,9 @@
 # MUGQIC Modules
 from core.config import *
 from core.job import *
-from bfx import blast
+# bfx wrappers, imported when first used by a step
+from bfx import lazy_import
+blast = lazy_import("blast")
 
 # Identifies candidate coding regions within transcript sequences using [Transdecoder](http://transdecoder.github.io/).
 def transdecoder(trinity_fasta, transdecoder_directory, transdecoder_subdirectory):
@@ -117,7 +119,7 @@ def blastp_transdecoder_uniprot(blast_directory, transdecoder_fasta, db):
     cpu = config.param('blastp_transdecoder_uniprot', 'cpu')
     program = "blastp"
 
-    if not glob.glob(db + ".*phr"):
+    if not stat_cache.glob(db + ".*phr"):
         raise Exception("Error: " + db + " BLAST db files do not exist!")
 
     query = os.path.join(blast_directory, os.path.basename(transdecoder_fasta) + "_" + os.path.basename(db) + ".tsv")
@@ -21,20 +21,84 @@
 
 # Python Standard Modules
 import ConfigParser
-import glob
+import hashlib
 import logging
 import os
 import re
 import subprocess
 import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+# MUGQIC Modules
+from stat_cache import *
 
 log = logging.getLogger(__name__)
 
+# Cache of successful module checks, shared by all pipeline runs of the user
+MODULE_CHECK_CACHE = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser("~"), ".cache"), "mugqic_pipelines", "module_check.tsv")
+
+# Return 'module show' output of a module
+def module_show(module):
+    # Bash shell must be invoked in order to find "module" cmd
+    return subprocess.check_output(["bash", "-c", "module show " + module], stderr=subprocess.STDOUT)
+
+# Fingerprint of the module files a module may resolve to: MODULEPATH, and modification times of
+# MODULEPATH directories and module directories, which change when a module version is installed or removed
+def module_fingerprint(module):
+    module_dirs = [module_dir for module_dir in os.environ.get('MODULEPATH', "").split(":") if module_dir]
+    paths = module_dirs + [os.path.join(module_dir, module.split("/")[0]) for module_dir in module_dirs]
+    return hashlib.md5("\n".join([path + "\t" + (repr(os.path.getmtime(path)) if os.path.exists(path) else "") for path in paths])).hexdigest()
+
+# Config values are resolved once: param() results are memoized by (section, option, required, type)
+# until the config is modified, so that repeated lookups of the same parameter by bfx wrappers
+# skip interpolation, type conversion and file system checks.
 class Config(ConfigParser.SafeConfigParser):
 
     def __init__(self):
+        self._params = {}
+        self._param_lookups = 0
+        self._param_cache_hits = 0
         ConfigParser.SafeConfigParser.__init__(self)
 
+    # Number of param() calls
+    @property
+    def param_lookups(self):
+        return self._param_lookups
+
+    # Number of param() calls answered from the memoized values
+    @property
+    def param_cache_hits(self):
+        return self._param_cache_hits
+
+    # Any config modification invalidates memoized param() values
+    def _invalidate(self):
+        self._params = {}
+
+    def readfp(self, fp, filename=None):
+        self._invalidate()
+        ConfigParser.SafeConfigParser.readfp(self, fp, filename)
+
+    def set(self, section, option, value=None):
+        self._invalidate()
+        ConfigParser.SafeConfigParser.set(self, section, option, value)
+
+    def add_section(self, section):
+        self._invalidate()
+        ConfigParser.SafeConfigParser.add_section(self, section)
+
+    def remove_option(self, section, option):
+        self._invalidate()
+        return ConfigParser.SafeConfigParser.remove_option(self, section, option)
+
+    def remove_section(self, section):
+        self._invalidate()
+        return ConfigParser.SafeConfigParser.remove_section(self, section)
+
+    # Same as has_option(), without DEFAULT section fallback
+    def has_section_option(self, section, option):
+        return self.has_section(section) and option in self._sections[section]
+
     @property
     def filepath(self):
         return self._filepath
@@ -45,8 +109,28 @@ class Config(ConfigParser.SafeConfigParser):
         for config_file in config_files:
             self.readfp(config_file)
         self.check_modules()
+        self.prefetch_paths()
+
+    # Fill the stat cache with all absolute paths of config values in one concurrent pass,
+    # using 'stat_prefetch_threads' threads (default: 4), so that path type checks are answered from the cache
+    def prefetch_paths(self):
+        paths = set()
+        for section in ['DEFAULT'] + self.sections():
+            try:
+                items = self.items(section)
+            except ConfigParser.Error:
+                # Invalid interpolations are reported when the parameter is used
+                items = self.items(section, raw=True)
+            for name, value in items:
+                value = os.path.expandvars(value)
+                if os.path.isabs(value):
+                    paths.add(os.path.normpath(value))
+        stat_cache.prefetch(paths, self.param('DEFAULT', 'stat_prefetch_threads', required=False, type='posint') or 4)
 
-    # Check by a system call if all modules defined in config files are available
+    # Check by a system call if all modules defined in config files are available.
+    # Modules are checked concurrently by 'check_modules_threads' threads (default: 8).
+    # Successful checks are cached in $XDG_CACHE_HOME/mugqic_pipelines/module_check.tsv (default: ~/.cache/...)
+    # for 'check_modules_cache_ttl' seconds (default: 86400, 0 to disable the cache), as long as the module fingerprint is unchanged.
     def check_modules(self):
         modules = []
 
@@ -58,18 +142,78 @@ class Config(ConfigParser.SafeConfigParser):
                     modules.append(value)
 
         log.info("Check modules...")
+        cache_ttl = self.param('DEFAULT', 'check_modules_cache_ttl', required=False, type='int')
+        cache_ttl = 86400 if cache_ttl == "" else cache_ttl
+        cache = self._read_module_check_cache() if cache_ttl > 0 else {}
+        fingerprints = dict([(module, module_fingerprint(module)) for module in modules])
+        unchecked_modules = [module for module in modules if cache.get((module, fingerprints[module]), 0) + cache_ttl <= time.time()]
+
+        module_show_outputs = {}
+        if unchecked_modules:
+            pool = ThreadPool(min(len(unchecked_modules), self.param('DEFAULT', 'check_modules_threads', required=False, type='posint') or 8))
+            try:
+                module_show_outputs = dict(zip(unchecked_modules, pool.map(module_show, unchecked_modules)))
+            finally:
+                pool.close()
+                pool.join()
+
         for module in modules:
-            # Bash shell must be invoked in order to find "module" cmd
-            module_show_output = subprocess.check_output(["bash", "-c", "module show " + module], stderr=subprocess.STDOUT)
-            if re.search("Error", module_show_output, re.IGNORECASE):
-                raise Exception("Error in config file(s) with " + module + ":\n" + module_show_output)
+            if module in module_show_outputs:
+                module_show_output = module_show_outputs[module]
+                if re.search("Error", module_show_output, re.IGNORECASE):
+                    raise Exception("Error in config file(s) with " + module + ":\n" + module_show_output)
+                else:
+                    cache[(module, fingerprints[module])] = time.time()
+                    log.info("Module " + module + " OK")
             else:
-                log.info("Module " + module + " OK")
+                log.info("Module " + module + " OK (cached)")
+
+        if cache_ttl > 0 and unchecked_modules:
+            self._write_module_check_cache(cache, cache_ttl)
         log.info("Module check finished\n")
 
+    # Return the dict of module check times by (module, fingerprint) from the module check cache file
+    def _read_module_check_cache(self):
+        cache = {}
+        if os.path.isfile(MODULE_CHECK_CACHE):
+            with open(MODULE_CHECK_CACHE) as cache_file:
+                for line in cache_file:
+                    fields = line.rstrip("\n").split("\t")
+                    try:
+                        cache[(fields[0], fields[1])] = float(fields[2])
+                    except (IndexError, ValueError):
+                        log.debug("Invalid module check cache line ignored: " + line)
+        return cache
+
+    # Write unexpired module checks, replacing the cache file atomically since several pipelines may run at the same time
+    def _write_module_check_cache(self, cache, cache_ttl):
+        try:
+            if not os.path.isdir(os.path.dirname(MODULE_CHECK_CACHE)):
+                os.makedirs(os.path.dirname(MODULE_CHECK_CACHE))
+            tmp_file = MODULE_CHECK_CACHE + "." + str(os.getpid()) + ".tmp"
+            with open(tmp_file, 'w') as cache_file:
+                for (module, fingerprint), check_time in sorted(cache.items()):
+                    if check_time + cache_ttl > time.time():
+                        cache_file.write("\t".join([module, fingerprint, repr(check_time)]) + "\n")
+            os.rename(tmp_file, MODULE_CHECK_CACHE)
+        except (IOError, OSError) as e:
+            log.warning("Module check cache " + MODULE_CHECK_CACHE + " not written: " + str(e))
+
     # Retrieve param in config files with optional definition check and type validation
     # By default, parameter is required to be defined in one of the config file
     def param(self, section, option, required=True, type='string'):
+        self._param_lookups += 1
+        key = (section, option, required, type)
+        if key in self._params:
+            self._param_cache_hits += 1
+            value = self._params[key]
+        else:
+            value = self._param(section, option, required, type)
+            self._params[key] = value
+        # Lists are copied since callers may modify them
+        return list(value) if isinstance(value, list) else value
+
+    def _param(self, section, option, required, type):
         # Store original section for future error message, in case 'DEFAULT' section is used eventually
         original_section = section
 
@@ -92,19 +236,19 @@ class Config(ConfigParser.SafeConfigParser):
                     return self.getboolean(section, option)
                 elif type == 'filepath':
                     value = os.path.expandvars(self.get(section, option))
-                    if os.path.isfile(value):
+                    if stat_cache.isfile(value):
                         return value
                     else:
                         raise Exception("File path \"" + value + "\" does not exist or is not a valid regular file!")
                 elif type == 'dirpath':
                     value = os.path.expandvars(self.get(section, option))
-                    if os.path.isdir(value):
+                    if stat_cache.isdir(value):
                         return value
                     else:
                         raise Exception("Directory path \"" + value + "\" does not exist or is not a valid directory!")
                 elif type == 'prefixpath':
                     value = os.path.expandvars(self.get(section, option))
-                    if glob.glob(value + "*"):
+                    if stat_cache.has_prefix(value):
                         return value
                     else:
                         raise Exception("Prefix path \"" + value + "\" does not match any file!")
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import hashlib
+import logging
+import os
+import stat
+import threading
+from multiprocessing.pool import ThreadPool
+
+# MUGQIC Modules
+from stat_cache import *
+
+log = logging.getLogger(__name__)
+
+# Checksum cache and job input fingerprint files, relative to the pipeline output directory
+CHECKSUM_CACHE = os.path.join("job_output", "checksums.tsv")
+JOB_FINGERPRINTS = os.path.join("job_output", "job_fingerprints.tsv")
+
+# Files bigger than this size are not fully read: only evenly spaced chunks are hashed with their size
+FULL_CHECKSUM_MAX_SIZE = 64 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+SAMPLED_CHUNKS = 64
+
+# Content checksum of a regular file, or of the file names and sizes of a directory tree
+def file_checksum(path):
+    md5 = hashlib.md5()
+    if os.path.isdir(path):
+        for directory, subdirectories, files in os.walk(path):
+            subdirectories.sort()
+            for file in sorted(files):
+                file_path = os.path.join(directory, file)
+                md5.update(os.path.relpath(file_path, path) + "\t" + str(os.lstat(file_path).st_size) + "\n")
+    else:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as file:
+            if size <= FULL_CHECKSUM_MAX_SIZE:
+                for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                    md5.update(chunk)
+            else:
+                md5.update(str(size))
+                for i in range(SAMPLED_CHUNKS):
+                    file.seek((size - CHUNK_SIZE) * i // (SAMPLED_CHUNKS - 1))
+                    md5.update(file.read(CHUNK_SIZE))
+    return md5.hexdigest()
+
+# Store of job input fingerprints, used instead of modification times to check if jobs are up to date.
+# At completion time, a job writes in its .done file a unique stamp followed by the size and modification time of its input files.
+# When the job is planned again with input files still matching them, the fingerprint of their contents is recorded with the stamp.
+# Later on, as long as the .done file stamp is the same, the job is up to date only if its input file contents are unchanged,
+# even if files were touched, copied or restored with new modification times.
+# Jobs completed before fingerprint mode have a .done file created with 'touch', which is never rewritten:
+# its modification time is used as stamp, and its fingerprint is recorded once up to date according to modification times.
+# Otherwise, without a matching record, the usual modification time check is used.
+class JobFingerprints(object):
+
+    def __init__(self):
+        self._enabled = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    def load(self, output_dir, threads=1):
+        self._enabled = True
+        self._output_dir = output_dir
+        self._threads = threads
+        self._pool = None
+
+        # Checksums by (device, inode, size, modification time), so that each file is hashed at most once
+        self._checksums = {}
+        for fields in self._read(CHECKSUM_CACHE, 5):
+            self._checksums[tuple(fields[0:4])] = fields[4]
+
+        self._fingerprints = {}
+        for fields in self._read(JOB_FINGERPRINTS, 3):
+            self._fingerprints[fields[0]] = (fields[1], fields[2])
+
+        self._modified = False
+
+    def _read(self, relative_path, nb_fields):
+        path = os.path.join(self._output_dir, relative_path)
+        if os.path.isfile(path):
+            with open(path) as tsv:
+                return [fields for fields in [line.rstrip("\n").split("\t") for line in tsv] if len(fields) == nb_fields]
+        else:
+            return []
+
+    def _write(self, relative_path, lines):
+        path = os.path.join(self._output_dir, relative_path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path + ".tmp", 'w') as tsv:
+            for fields in lines:
+                tsv.write("\t".join(fields) + "\n")
+        os.rename(path + ".tmp", path)
+
+    def save(self):
+        if self.enabled:
+            if self._pool:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+            if self._modified:
+                self._write(CHECKSUM_CACHE, [key + (checksum,) for key, checksum in self._checksums.items()])
+                self._write(JOB_FINGERPRINTS, [(done,) + fingerprint for done, fingerprint in self._fingerprints.items()])
+                self._modified = False
+
+    def _checksum_key(self, path):
+        path_stat = stat_cache.stat(path)
+        return (str(path_stat.st_dev), str(path_stat.st_ino), str(path_stat.st_size), repr(path_stat.st_mtime))
+
+    def _checksum(self, path):
+        key = self._checksum_key(path)
+        if key not in self._checksums:
+            log.debug("Compute checksum of " + path)
+            checksum = file_checksum(path)
+            with self._lock:
+                self._checksums[key] = checksum
+                self._modified = True
+        return self._checksums[key]
+
+    # Global fingerprint of a list of input files, computed with a pool of threads for files not hashed yet
+    def fingerprint(self, paths):
+        paths = sorted(set(paths))
+        if self._threads > 1 and len([path for path in paths if self._checksum_key(path) not in self._checksums]) > 1:
+            if not self._pool:
+                self._pool = ThreadPool(self._threads)
+            checksums = self._pool.map(self._checksum, paths)
+        else:
+            checksums = [self._checksum(path) for path in paths]
+        return hashlib.md5("\n".join([path + "\t" + checksum for path, checksum in zip(paths, checksums)])).hexdigest()
+
+    # .done file stamp written by the job at completion time, with the size and modification time of its input files by file.
+    # The stamp of .done files created with 'touch' is their modification time.
+    def _done_stamp(self, abspath_done):
+        with open(abspath_done) as done:
+            lines = done.read().splitlines()
+        if not lines:
+            return "mtime:" + repr(stat_cache.mtime(abspath_done)), {}
+
+        files = {}
+        for line in lines[1:]:
+            try:
+                size, mtime, file = line.split(":", 2)
+                files[file] = (int(size), int(mtime))
+            except ValueError:
+                log.debug("Invalid .done file line ignored: " + line)
+        return lines[0], files
+
+    # Bash command run by a successful job to create its .done file with a unique stamp and the state of its input files
+    def done_command(self, job, done="$JOB_DONE"):
+        command = "date +%FT%H:%M:%S.%N"
+        if job.input_files:
+            # Missing input files are not fatal: the job is then checked with modification times
+            command = "{ " + command + " ; stat -c '%s:%Y:%n' " + " ".join(job.input_files) + " 2> /dev/null ; true ; }"
+        return command + " > " + done
+
+    def is_up2date(self, job, abspath_done, abspath_input_files, mtime_up2date):
+        done_stamp, done_input_files = self._done_stamp(abspath_done)
+        recorded_fingerprint = self._fingerprints.get(job.done)
+
+        if recorded_fingerprint and recorded_fingerprint[0] == done_stamp:
+            if recorded_fingerprint[1] == self.fingerprint(abspath_input_files):
+                return True
+            else:
+                log.debug("Job " + job.name + " NOT up to date")
+                log.debug("Input file contents changed since job completion\n")
+                return False
+
+        # No fingerprint recorded for this job completion yet: if input files are the ones of job completion,
+        # their current fingerprint is the one at completion time
+        if done_input_files:
+            for input_file, abspath_input_file in zip(job.input_files, abspath_input_files):
+                input_file_stat = stat_cache.lstat(abspath_input_file)
+                if done_input_files.get(os.path.expandvars(input_file)) != (input_file_stat.st_size, int(input_file_stat.st_mtime)):
+                    log.debug("Job " + job.name + " input file " + input_file + " changed since job completion")
+                    break
+            else:
+                self._record(job, done_stamp, abspath_input_files)
+                return True
+
+        # Otherwise rely on modification times, and record the fingerprint of .done files created with 'touch' only
+        if mtime_up2date and done_stamp.startswith("mtime:"):
+            self._record(job, done_stamp, abspath_input_files)
+        return mtime_up2date
+
+    def _record(self, job, done_stamp, abspath_input_files):
+        self._fingerprints[job.done] = (done_stamp, self.fingerprint(abspath_input_files))
+        self._modified = True
+
+# Global job fingerprint object used throughout the whole pipeline
+job_fingerprints = JobFingerprints()
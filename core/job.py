@@ -24,76 +24,151 @@ import collections
 import datetime
 import logging
 import os
+import zlib
 
 # MUGQIC Modules
 from config import *
+from fingerprint import *
+from job_state import *
+from module_snapshot import *
+from stat_cache import *
 
 log = logging.getLogger(__name__)
 
-class Job:
+# Commands longer than this size are stored compressed
+COMPRESSED_COMMAND_MIN_SIZE = 1024
+
+# Return an immutable tuple of strings (file paths, module names), interned so that strings shared by many jobs are stored only once
+def intern_strings(strings):
+    return tuple([intern(string) if isinstance(string, str) else string for string in strings])
+
+# Jobs use slots and tuples instead of instance dictionaries and lists to reduce memory usage of pipelines with many jobs.
+# File lists can be replaced but not modified in place.
+class Job(object):
+
+    __slots__ = ['_id', '_name', '_output_dir', '_input_files', '_output_files', '_report_files', '_removable_files', '_done', '_dependency_jobs', '_modules', '_command', '_compressed_command', '_priority']
 
     def __init__(self, input_files=[], output_files=[], module_entries = [], name="", command="", report_files=[], removable_files=[]):
         # Remove undefined input/output/removable files if any
-        self._input_files = filter(None, input_files)
-        self._output_files = filter(None, output_files)
-        self._report_files = filter(None, report_files)
-        self._removable_files = filter(None, removable_files)
+        self.input_files = filter(None, input_files)
+        self.output_files = filter(None, output_files)
+        self.report_files = filter(None, report_files)
+        self.removable_files = filter(None, removable_files)
 
         # Retrieve modules from config, removing duplicates but keeping the order
-        self._modules = list(collections.OrderedDict.fromkeys([config.param(section, option) for section, option in module_entries]))
+        self.modules = list(collections.OrderedDict.fromkeys([config.param(section, option) for section, option in module_entries]))
 
-        self._name = name
-        self._command = command
+        self.name = name
+        self.command = command
+        self.priority = None
 
     @property
     def id(self):
         return self._id
 
+    @id.setter
+    def id(self, value):
+        self._id = value
+
     @property
     def name(self):
         return self._name
 
+    @name.setter
+    def name(self, value):
+        self._name = value
+
     @property
     def output_dir(self):
         return self._output_dir
 
+    @output_dir.setter
+    def output_dir(self, value):
+        self._output_dir = value
+
     @property
     def input_files(self):
         return self._input_files
 
+    @input_files.setter
+    def input_files(self, value):
+        self._input_files = intern_strings(value)
+
     @property
     def output_files(self):
         return self._output_files
 
+    @output_files.setter
+    def output_files(self, value):
+        self._output_files = intern_strings(value)
+
     @property
     def report_files(self):
         return self._report_files
 
+    @report_files.setter
+    def report_files(self, value):
+        self._report_files = intern_strings(value)
+
     @property
     def removable_files(self):
         return self._removable_files
 
+    @removable_files.setter
+    def removable_files(self, value):
+        self._removable_files = intern_strings(value)
+
     @property
     def done(self):
         return self._done
 
+    @done.setter
+    def done(self, value):
+        self._done = value
+
     @property
     def dependency_jobs(self):
         return self._dependency_jobs
 
+    @dependency_jobs.setter
+    def dependency_jobs(self, value):
+        self._dependency_jobs = tuple(value)
+
     @property
     def modules(self):
         return self._modules
 
+    @modules.setter
+    def modules(self, value):
+        self._modules = intern_strings(value)
+
+    # Job scheduler priority from 0 (lowest) to 1023 (highest), or None if jobs are not prioritized
+    @property
+    def priority(self):
+        return self._priority
+
+    @priority.setter
+    def priority(self, value):
+        self._priority = value
+
     @property
     def command(self):
-        return self._command
+        if self._compressed_command:
+            return zlib.decompress(self._command)
+        else:
+            return self._command
+
+    @command.setter
+    def command(self, value):
+        # Only byte strings are compressed, so that the command type is unchanged
+        self._compressed_command = isinstance(value, str) and len(value) >= COMPRESSED_COMMAND_MIN_SIZE
+        self._command = zlib.compress(value, 1) if self._compressed_command else value
 
     @property
     def command_with_modules(self):
         command = self.command
         if self.modules:
-            command = "module load " + " ".join(self.modules) + " && \\\n" + command
+            command = module_snapshots.load_command(self.modules) + " && \\\n" + command
         return command
 
     def abspath(self, file):
@@ -110,6 +185,10 @@ class Job:
             log.debug("Dependency jobs:\n  " + "\n  ".join([job.name for job in self.dependency_jobs]) + "\n")
             return False
 
+        # If job files match its last job state ledger record, job is up to date without further checks
+        if job_state_ledger.enabled and job_state_ledger.is_up2date(self):
+            return True
+
         # Retrieve absolute paths for .done, input and output files to avoid redundant OS function calls
         abspath_done = self.abspath(self.done)
         abspath_input_files = [self.abspath(input_file) for input_file in self.input_files]
@@ -118,22 +197,28 @@ class Job:
         # If any .done, input or output file is missing, job is not up to date
         for file in [abspath_done] + abspath_input_files + abspath_output_files:
             # Use 'exists' instead of 'isfile' since input/output files can be directories
-            if not os.path.exists(file):
+            if not stat_cache.exists(file):
                 log.debug("Job " + self.name + " NOT up to date")
                 log.debug("Input, output or .done file missing: " + file)
                 return False
 
         # Retrieve latest input file by modification time i.e. maximum stat mtime
         # Use lstat to avoid following symbolic links
-        latest_input_file = max(abspath_input_files, key=lambda input_file: os.lstat(input_file).st_mtime)
-        latest_input_time = os.lstat(latest_input_file).st_mtime
+        latest_input_file = max(abspath_input_files, key=stat_cache.mtime)
+        latest_input_time = stat_cache.mtime(latest_input_file)
 
         # Same with earliest output file by modification time
-        earliest_output_file = min(abspath_output_files, key=lambda output_file:os.lstat(output_file).st_mtime)
-        earliest_output_time = os.lstat(earliest_output_file).st_mtime
+        earliest_output_file = min(abspath_output_files, key=stat_cache.mtime)
+        earliest_output_time = stat_cache.mtime(earliest_output_file)
 
         # If any input file is strictly more recent than all output files, job is not up to date
-        if latest_input_time > earliest_output_time:
+        mtime_up2date = latest_input_time <= earliest_output_time
+
+        # In fingerprint mode, input file contents decide instead of modification times, once a job fingerprint is recorded
+        if job_fingerprints.enabled:
+            return job_fingerprints.is_up2date(self, abspath_done, abspath_input_files, mtime_up2date)
+
+        if not mtime_up2date:
             log.debug("Job " + self.name + " NOT up to date")
             log.debug("Latest input file modification time: " + latest_input_file + " " + datetime.datetime.fromtimestamp(latest_input_time).isoformat() + " > earliest output file modification time: " + earliest_output_file + " " + datetime.datetime.fromtimestamp(earliest_output_time).isoformat() + "\n")
             return False
@@ -142,29 +227,50 @@ class Job:
         return True
 
 
-# Create a new job by concatenating a list of jobs together
-def concat_jobs(jobs, name=""):
+# Incremental concatenation of jobs, to append jobs one by one without merging previous jobs again.
+# Files and modules are merged with ordered sets, keeping their first occurrence order:
+# input files produced by a previous job are not inputs of the concatenated job.
+class ConcatJobBuilder(object):
 
-    # Merge all input/output/report/removable files and modules
-    input_files = []
-    output_files = []
-    report_files = []
-    removable_files = []
-    modules = []
-    for job_item in jobs:
-        input_files.extend([input_file for input_file in job_item.input_files if input_file not in input_files and input_file not in output_files])
-        output_files.extend([output_file for output_file in job_item.output_files if output_file not in output_files])
-        report_files.extend([report_file for report_file in job_item.report_files if report_file not in report_files])
-        removable_files.extend([removable_file for removable_file in job_item.removable_files if removable_file not in removable_files])
-        modules.extend([module for module in job_item.modules if module not in modules])
+    def __init__(self, jobs=[]):
+        self._input_files = collections.OrderedDict()
+        self._output_files = collections.OrderedDict()
+        self._report_files = collections.OrderedDict()
+        self._removable_files = collections.OrderedDict()
+        self._modules = collections.OrderedDict()
+        self._commands = []
 
-    job = Job(input_files, output_files, name=name, report_files=report_files, removable_files=removable_files)
-    job.modules = modules
+        for job in jobs:
+            self.add(job)
 
-    # Merge commands
-    job.command = " && \\\n".join([job_item.command for job_item in jobs])
+    def add(self, job):
+        for input_file in job.input_files:
+            if input_file not in self._output_files:
+                self._input_files[input_file] = None
+        for output_file in job.output_files:
+            self._output_files[output_file] = None
+        for report_file in job.report_files:
+            self._report_files[report_file] = None
+        for removable_file in job.removable_files:
+            self._removable_files[removable_file] = None
+        for module in job.modules:
+            self._modules[module] = None
+        self._commands.append(job.command)
 
-    return job
+        return self
+
+    def build(self, name=""):
+        job = Job(self._input_files.keys(), self._output_files.keys(), name=name, report_files=self._report_files.keys(), removable_files=self._removable_files.keys())
+        job.modules = self._modules.keys()
+
+        # Merge commands
+        job.command = " && \\\n".join(self._commands)
+
+        return job
+
+# Create a new job by concatenating a list of jobs together
+def concat_jobs(jobs, name=""):
+    return ConcatJobBuilder(jobs).build(name)
 
 # Create a new job by piping a list of jobs together
 def pipe_jobs(jobs, name=""):
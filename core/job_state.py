@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import logging
+import os
+import re
+
+# MUGQIC Modules
+from stat_cache import *
+
+log = logging.getLogger(__name__)
+
+# Ledger file path, relative to the pipeline output directory
+JOB_STATE_LEDGER = os.path.join("job_output", "job_states.tsv")
+
+# Bundle jobs of packed jobs are named "<job name prefix>.pack<N>", see Pipeline.pack_jobs()
+BUNDLE_JOB_NAME_INFIX = ".pack"
+BUNDLE_JOB_NAME_REGEX = re.compile(r"^[^.]+" + re.escape(BUNDLE_JOB_NAME_INFIX) + r"\d+$")
+
+# Append-only ledger of successful jobs, written by the job scheduler scripts.
+# Each line is a TAB-separated record:
+#   <job .done file> <start time> <end time> <size>:<mtime>:<file> [<size>:<mtime>:<file> ...]
+# where .done file name contains the job command checksum, times are in seconds since epoch
+# and files are the job input and output files at completion time.
+# If a job has several records, the last one wins. Invalid lines (e.g. from concurrent appends) are ignored.
+class JobStateLedger(object):
+
+    def __init__(self):
+        self._records = {}
+        self._prefix_runtimes = {}
+        self._enabled = False
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    # Whether the job scheduler script of a job records it in the ledger:
+    # bundle jobs are not, since their packed jobs record themselves
+    def records(self, job):
+        return self.enabled and not BUNDLE_JOB_NAME_REGEX.match(job.name)
+
+    def load(self, ledger_file):
+        self._enabled = True
+        self._records = {}
+        self._prefix_runtimes = {}
+        if os.path.isfile(ledger_file):
+            log.info("Load job state ledger " + ledger_file + " ...")
+            with open(ledger_file) as ledger:
+                for line in ledger:
+                    fields = line.rstrip("\n").split("\t")
+                    try:
+                        done, start_time, end_time = fields[0], int(fields[1]), int(fields[2])
+                        files = {}
+                        for file_fingerprint in [field for field in fields[3:] if field]:
+                            size, mtime, file = file_fingerprint.split(":", 2)
+                            files[file] = (int(size), int(mtime))
+                        self._records[done] = {'start_time': start_time, 'end_time': end_time, 'files': files}
+                        # .done file name is "<job name>.<md5>.mugqic.done", and job name starts with the job name prefix.
+                        # Bundle job records, if any, are ignored since their runtime adds up the ones of their packed jobs.
+                        job_name = os.path.basename(done).rsplit(".", 3)[0]
+                        if not BUNDLE_JOB_NAME_REGEX.match(job_name):
+                            self._prefix_runtimes.setdefault(job_name.split(".")[0], []).append(end_time - start_time)
+                    except (IndexError, ValueError):
+                        log.debug("Invalid job state ledger line ignored: " + line)
+            log.info(str(len(self._records)) + " job states loaded\n")
+
+    def record(self, job):
+        return self._records.get(job.done)
+
+    # Runtime in seconds of the last successful run of the job command, or None if not recorded
+    def runtime(self, job):
+        record = self.record(job)
+        return record['end_time'] - record['start_time'] if record else None
+
+    # Mean runtime in seconds of recorded jobs with a job name prefix, or None if not recorded
+    def mean_runtime(self, job_name_prefix):
+        runtimes = self._prefix_runtimes.get(job_name_prefix)
+        return sum(runtimes) // len(runtimes) if runtimes else None
+
+    # A job is up to date if its .done file exists and its input and output files
+    # have not changed since the job completed, according to the last ledger record of the job command
+    def is_up2date(self, job):
+        record = self.record(job)
+        if not record or not stat_cache.exists(job.abspath(job.done)):
+            return False
+
+        for file in job.input_files + job.output_files:
+            file_fingerprint = record['files'].get(os.path.expandvars(file))
+            file_stat = stat_cache.lstat(job.abspath(file))
+            if not file_fingerprint or not file_stat or file_fingerprint != (file_stat.st_size, int(file_stat.st_mtime)):
+                log.debug("Job " + job.name + " file " + file + " changed since job state ledger record")
+                return False
+
+        return True
+
+    # Bash command run before the job command, to record the job start time
+    def start_command(self, job):
+        # Exported since job commands may run in a child shell e.g. with job telemetry, and packed jobs append their own records
+        return "export MUGQIC_START=$(date +%s)"
+
+    # Bash command run after a successful job command, to append a job record to the ledger
+    def append_command(self, job):
+        return "printf '%s\\t%s\\t%s\\t%s\\n' \"{job.done}\" \"$MUGQIC_START\" \"$(date +%s)\" \"$(stat -c '%s:%Y:%n' {files} 2> /dev/null | paste -s -)\" >> {ledger}".format(
+            job=job,
+            files=" ".join(job.input_files + job.output_files),
+            ledger=JOB_STATE_LEDGER
+        )
+
+# Global job state ledger object used throughout the whole pipeline
+job_state_ledger = JobStateLedger()
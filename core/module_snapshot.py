@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import hashlib
+import logging
+import os
+import pipes
+import re
+import subprocess
+
+log = logging.getLogger(__name__)
+
+# Snapshot directory, relative to the pipeline output directory
+MODULE_SNAPSHOT_DIR = os.path.join("job_output", "module_snapshots")
+
+# Environment variables set by the shell itself, not by modules
+MODULE_SNAPSHOT_IGNORED_VARIABLES = ["_", "OLDPWD", "PWD", "SHLVL"]
+
+# Separator between environment listings in 'module load' subprocess output
+MODULE_SNAPSHOT_SEPARATOR = "MUGQIC_MODULE_SNAPSHOT"
+
+# Snapshots of the environment set by 'module load', sourced by jobs instead of loading their modules one by one.
+# Each distinct list of job modules is loaded once at planning time, and the environment variables it sets or unsets
+# are written in a Bash script $OUTPUT_DIR/job_output/module_snapshots/<checksum>.sh, where checksum is computed
+# from the module list and MODULEPATH. Snapshots are reused by later pipeline runs, unless a MODULEPATH directory
+# or module directory was modified since (e.g. new module installed).
+# At run time, a snapshot falls back to 'module load' if MODULEPATH is different or the snapshot file is missing.
+# Shell aliases and functions defined by modules are not part of snapshots.
+class ModuleSnapshots(object):
+
+    def __init__(self):
+        self._snapshots = {}
+        self._enabled = False
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    def _file(self, modules):
+        return os.path.join(MODULE_SNAPSHOT_DIR, hashlib.md5("\n".join(modules) + "\n" + os.environ.get('MODULEPATH', "")).hexdigest() + ".sh")
+
+    # Create snapshots of a list of module lists, or reuse them if still valid
+    def create(self, output_dir, module_lists):
+        self._enabled = True
+        self._snapshots = {}
+        snapshot_dir = os.path.join(output_dir, MODULE_SNAPSHOT_DIR)
+        if not os.path.isdir(snapshot_dir):
+            os.makedirs(snapshot_dir)
+
+        nb_created = 0
+        for modules in set([tuple(modules) for modules in module_lists if modules]):
+            snapshot_file = self._file(modules)
+            abspath_snapshot_file = os.path.join(output_dir, snapshot_file)
+            if self._is_stale(modules, abspath_snapshot_file):
+                try:
+                    self._write(modules, abspath_snapshot_file)
+                    nb_created += 1
+                except Exception as e:
+                    log.warning("Module snapshot of " + " ".join(modules) + " failed, modules will be loaded by jobs: " + str(e))
+                    continue
+            self._snapshots[modules] = snapshot_file
+
+        log.info("Module snapshots: " + str(len(self._snapshots)) + " module lists, " + str(nb_created) + " snapshots created\n")
+
+    # A snapshot is stale if missing or older than any MODULEPATH directory or module directory
+    def _is_stale(self, modules, abspath_snapshot_file):
+        if not os.path.isfile(abspath_snapshot_file):
+            return True
+        snapshot_time = os.path.getmtime(abspath_snapshot_file)
+        module_dirs = [module_dir for module_dir in os.environ.get('MODULEPATH', "").split(":") if module_dir]
+        for path in module_dirs + [os.path.join(module_dir, module.split("/")[0]) for module_dir in module_dirs for module in modules]:
+            if os.path.exists(path) and os.path.getmtime(path) > snapshot_time:
+                log.debug("Module snapshot " + abspath_snapshot_file + " older than " + path)
+                return True
+        return False
+
+    def _write(self, modules, abspath_snapshot_file):
+        # Bash shell must be invoked in order to find "module" cmd
+        process = subprocess.Popen(["bash", "-c", "env -0 && printf '" + MODULE_SNAPSHOT_SEPARATOR + "\\0' && module load " + " ".join(modules) + " 1>&2 && env -0"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output, errors = process.communicate()
+        before, separator, after = output.partition(MODULE_SNAPSHOT_SEPARATOR + "\0")
+        # Like check_modules(), module errors do not always change the exit status
+        if process.returncode != 0 or not separator or re.search("Error", errors, re.IGNORECASE):
+            raise Exception("exit status " + str(process.returncode) + ": " + errors.strip())
+
+        before_variables = self._variables(before)
+        after_variables = self._variables(after)
+        lines = [
+            "# MUGQIC module snapshot: module load " + " ".join(modules),
+            "if [ \"$MODULEPATH\" != " + pipes.quote(os.environ.get('MODULEPATH', "")) + " ] ; then module load " + " ".join(modules) + " ; return $? ; fi"
+        ]
+        lines.extend(["export " + name + "=" + self._value(value, before_variables.get(name), name) for name, value in sorted(after_variables.items()) if before_variables.get(name) != value])
+        lines.extend(["unset " + name for name in sorted(before_variables) if name not in after_variables])
+
+        with open(abspath_snapshot_file + ".tmp", 'w') as snapshot:
+            snapshot.write("\n".join(lines) + "\n")
+        os.rename(abspath_snapshot_file + ".tmp", abspath_snapshot_file)
+        log.debug("Module snapshot " + abspath_snapshot_file + " created for " + " ".join(modules))
+
+    # Quoted variable value, relative to the run time value for paths prepended or appended to a path list e.g. PATH,
+    # so that the job environment is kept
+    def _value(self, value, before_value, name):
+        if before_value and value.endswith(":" + before_value):
+            return pipes.quote(value[:-len(before_value)]) + "\"$" + name + "\""
+        elif before_value and value.startswith(before_value + ":"):
+            return "\"$" + name + "\"" + pipes.quote(value[len(before_value):])
+        else:
+            return pipes.quote(value)
+
+    # Return a dict of environment variables from a NUL-separated 'env -0' output, except shell and exported function variables
+    def _variables(self, env_output):
+        variables = {}
+        for variable in env_output.split("\0"):
+            name, separator, value = variable.partition("=")
+            if separator and re.search("^[A-Za-z_]\w*$", name) and name not in MODULE_SNAPSHOT_IGNORED_VARIABLES:
+                variables[name] = value
+        return variables
+
+    # Bash command setting up job modules: source the module list snapshot if any, else 'module load'
+    def load_command(self, modules):
+        module_load = "module load " + " ".join(modules)
+        snapshot_file = self._snapshots.get(tuple(modules)) if self.enabled else None
+        if snapshot_file:
+            return "if [ -f " + snapshot_file + " ] ; then source " + snapshot_file + " ; else " + module_load + " ; fi"
+        else:
+            return module_load
+
+# Global module snapshot object used throughout the whole pipeline
+module_snapshots = ModuleSnapshots()
@@ -30,18 +30,42 @@ import collections
 import datetime
 import hashlib
 import logging
+import multiprocessing
 import os
 import re
 import textwrap
+import time
 
 # MUGQIC Modules
 from config import *
+from fingerprint import *
 from job import *
+from job_state import *
+from module_snapshot import *
+from plan_cache import *
+from planning_profile import *
 from scheduler import *
+from stat_cache import *
 from step import *
+from telemetry import *
 
 log = logging.getLogger(__name__)
 
+# Item job creation function and items of the current parallel job creation, inherited by forked worker processes
+parallel_job_context = None
+
+# Create the jobs of one item in a worker process, returning them with file system probes if recorded
+def create_parallel_item_jobs(index):
+    create_item_jobs, items = parallel_job_context
+    if stat_cache.recording:
+        stat_cache.start_recording()
+        jobs = create_item_jobs(items[index])
+        probes = stat_cache.stop_recording()
+        stat_cache.start_recording()
+        return jobs, probes
+    else:
+        return create_item_jobs(items[index]), None
+
 class Pipeline(object):
     def __init__(self):
         self._timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
@@ -110,6 +134,11 @@ Usage
             else:
                 self.argparser.error("argument -s/--steps is required!")
 
+            if self.args.plan_cache:
+                self._plan_cache = PlanCache(self)
+
+            planning_profile.enabled = self.args.profile
+
             # For job reporting, all jobs must be created first, no matter whether they are up to date or not
             if self.args.report:
                 self._force_jobs = True
@@ -123,7 +152,13 @@ Usage
             else:
                 self._force_jobs = self.args.force
                 self.create_jobs()
+                submit_start = time.time()
                 self.submit_jobs()
+                planning_profile.submit_seconds = time.time() - submit_start
+
+            if planning_profile.enabled:
+                sys.stderr.write("\nPlanning profile:\n" + planning_profile.table() + "\n")
+                planning_profile.write_json(self.__class__.__name__ + ".profile.json")
 
     # Pipeline command line arguments parser
     @property
@@ -145,10 +180,12 @@ Steps:
             self._argparser.add_argument("-c", "--config", help="config INI-style list of files; config parameters are overwritten based on files order", nargs="+", type=file)
             self._argparser.add_argument("-s", "--steps", help="step range e.g. '1-5', '3,6,7', '2,4-8'")
             self._argparser.add_argument("-o", "--output-dir", help="output directory (default: current)", default=os.getcwd())
-            self._argparser.add_argument("-j", "--job-scheduler", help="job scheduler type (default: pbs)", choices=["pbs", "batch"], default="pbs")
+            self._argparser.add_argument("-j", "--job-scheduler", help="job scheduler type; 'local' runs jobs directly on the local machine (default: pbs)", choices=["pbs", "batch", "slurm", "direct", "local"], default="pbs")
             self._argparser.add_argument("-f", "--force", help="force creation of jobs even if up to date (default: false)", action="store_true")
             self._argparser.add_argument("--report", help="create 'pandoc' command to merge all job markdown report files in the given step range into HTML, if they exist; if --report is set, --job-scheduler, --force, --clean options and job up-to-date status are ignored (default: false)", action="store_true")
             self._argparser.add_argument("--clean", help="create 'rm' commands for all job removable files in the given step range, if they exist; if --clean is set, --job-scheduler, --force options and job up-to-date status are ignored (default: false)", action="store_true")
+            self._argparser.add_argument("--plan-cache", help="reuse jobs created by a previous run with the same config, arguments, input files and pipeline code, stored in <Pipeline>.plan.cache; job up-to-date status is still checked (default: false)", action="store_true")
+            self._argparser.add_argument("--profile", help="report wall time, jobs created, file system calls, config lookups and peak memory of each step on stderr and in <Pipeline>.profile.json (default: false)", action="store_true")
             self._argparser.add_argument("-l", "--log", help="log level (default: info)", choices=["debug", "info", "warning", "error", "critical"], default="info")
 
         return self._argparser
@@ -178,6 +215,13 @@ Steps:
     def force_jobs(self):
         return self._force_jobs
 
+    # Optional cache of created jobs, None if disabled
+    @property
+    def plan_cache(self):
+        if not hasattr(self, "_plan_cache"):
+            self._plan_cache = None
+        return self._plan_cache
+
     @property
     def steps(self):
         # Needs to be defined in pipeline child class
@@ -198,9 +242,28 @@ Steps:
             jobs.extend(step.jobs)
         return jobs
 
+    # Index of all created jobs by output file, incrementally updated each time a job is added to a step.
+    # Each output file maps to the list of (creation order, job) pairs producing it.
+    @property
+    def output_file_index(self):
+        if not hasattr(self, "_output_file_index"):
+            self._output_file_index = {}
+            self._indexed_job_count = 0
+        return self._output_file_index
+
+    def index_job(self, job):
+        output_file_index = self.output_file_index
+        self._indexed_job_count += 1
+        for output_file in job.output_files:
+            output_file_index.setdefault(output_file, []).append((self._indexed_job_count, job))
+
     # Given a list of lists of input files, return the first valid list of input files which can be found either in previous jobs output files or on file system.
     # Thus, a job with several candidate lists of input files can find out the first valid one.
     def select_input_files(self, candidate_input_files):
+        with planning_profile.phase("select_input_files"):
+            return self._select_input_files(candidate_input_files)
+
+    def _select_input_files(self, candidate_input_files):
         log.debug("candidate_input_files: \n" + str(candidate_input_files))
 
         selected_input_files = []
@@ -208,7 +271,6 @@ Steps:
         # Create a reversed copy to pop the candidates ordered by priority
         remaining_candidate_input_files = list(candidate_input_files)
         remaining_candidate_input_files.reverse()
-        previous_jobs_output_files = set([output_file for job in self.jobs for output_file in job.output_files])
 
         while not selected_input_files and remaining_candidate_input_files:
             input_files = filter(None, remaining_candidate_input_files.pop())
@@ -232,15 +294,16 @@ Steps:
                 " neither found in dependencies nor on file system!")
 
     def dependency_jobs(self, current_job):
-        dependency_jobs = []
+        # Look up previous jobs producing current job input files in the output file index,
+        # then sort them by creation order to keep the same order as step jobs
+        dependency_jobs = {}
         dependency_input_files = set()
-        for step in self.step_range:
-            for step_job in step.jobs:
-                # If current job input files intersect with step job output files, step job is a dependency
-                shared_files = set(current_job.input_files).intersection(set(step_job.output_files))
-                if shared_files:
-                    dependency_jobs.append(step_job)
-                    dependency_input_files.update(shared_files)
+        output_file_index = self.output_file_index
+        for input_file in set(current_job.input_files):
+            if input_file in output_file_index:
+                dependency_jobs.update(output_file_index[input_file])
+                dependency_input_files.add(input_file)
+        dependency_jobs = [dependency_jobs[order] for order in sorted(dependency_jobs)]
 
         # Check if job input files not found in dependencies are on file system
         missing_input_files = set()
@@ -248,7 +311,7 @@ Steps:
         # where first command output becomes second command input
         for remaining_input_file in set(current_job.input_files).difference(dependency_input_files).difference(set(current_job.output_files)):
             # Use 'exists' instead of 'isfile' since input file can be a directory
-            if not os.path.exists(current_job.abspath(remaining_input_file)):
+            if not stat_cache.exists(current_job.abspath(remaining_input_file)):
                 missing_input_files.add(remaining_input_file)
         if missing_input_files:
             raise Exception("Error: missing input files for job " + current_job.name + ": " +
@@ -256,10 +319,72 @@ Steps:
 
         return dependency_jobs
 
+    # Create jobs of a list of independent items (e.g. readsets or samples), calling create_item_jobs(item) which returns a list of jobs.
+    # If 'planning_processes' > 1, items are dispatched to a pool of forked processes: job order is kept.
+    def parallel_jobs(self, create_item_jobs, items):
+        planning_processes = config.param('DEFAULT', 'planning_processes', required=False, type='posint') or 1
+        jobs = []
+        if planning_processes > 1 and len(items) > 1:
+            global parallel_job_context
+            parallel_job_context = (create_item_jobs, items)
+            pool = multiprocessing.Pool(min(planning_processes, len(items)))
+            try:
+                results = pool.map(create_parallel_item_jobs, range(len(items)), max(1, len(items) // (planning_processes * 4)))
+            finally:
+                pool.close()
+                pool.join()
+                parallel_job_context = None
+
+            for item_jobs, probes in results:
+                jobs.extend(item_jobs)
+                if probes:
+                    stat_cache.add_probes(probes)
+        else:
+            for item in items:
+                jobs.extend(create_item_jobs(item))
+        return jobs
+
     def create_jobs(self):
+        # Optional number of threads used to prefetch job file metadata, useful on network file systems
+        stat_prefetch_threads = config.param('DEFAULT', 'stat_prefetch_threads', required=False, type='posint')
+
+        # Optional ledger of successful jobs, used to check job up-to-date status and appended by job scheduler scripts
+        if config.param('DEFAULT', 'job_state_ledger', required=False, type='boolean'):
+            job_state_ledger.load(os.path.join(self.output_dir, JOB_STATE_LEDGER))
+
+        # Optional per-job runtime telemetry, written by PBS and batch job scripts next to job output files
+        job_telemetry.enabled = config.param('DEFAULT', 'job_telemetry', required=False, type='boolean')
+        # Interpreter of the telemetry helper, if 'python' is not in compute node PATH (e.g. 'python3' or an absolute path)
+        job_telemetry.python = config.param('DEFAULT', 'job_telemetry_python', required=False) or "python"
+
+        # In fingerprint mode, job up-to-date status is based on input file contents instead of modification times
+        up2date_mode = config.param('DEFAULT', 'up2date_mode', required=False)
+        if up2date_mode == "fingerprint":
+            job_fingerprints.load(self.output_dir, config.param('DEFAULT', 'fingerprint_threads', required=False, type='posint') or 1)
+        elif up2date_mode and up2date_mode != "mtime":
+            raise Exception("Error: up2date_mode \"" + up2date_mode + "\" is invalid (should be \"mtime\" or \"fingerprint\")!")
+
+        # Jobs of each step are created by step methods, or loaded from the plan cache if still valid
+        cached_step_jobs = self.plan_cache.load() if self.plan_cache else None
+        step_jobs = {}
+        probes = {}
+
         for step in self.step_range:
-            log.info("Create jobs for step " + step.name + "...")
-            jobs = step.create_jobs()
+            planning_profile.start_step(step.name)
+            with planning_profile.phase("create"):
+                if cached_step_jobs is not None:
+                    log.info("Load jobs for step " + step.name + " from plan cache...")
+                    jobs = cached_step_jobs[step.name]
+                else:
+                    log.info("Create jobs for step " + step.name + "...")
+                    if self.plan_cache:
+                        stat_cache.start_recording()
+                        jobs = step.create_jobs()
+                        probes.update(stat_cache.stop_recording())
+                    else:
+                        jobs = step.create_jobs()
+            step_jobs[step.name] = jobs
+
             for job in jobs:
                 # Job name is mandatory to create job .done file name
                 if not job.name:
@@ -273,15 +398,219 @@ Steps:
                 # Thus, if the command is modified, the job is not up-to-date anymore.
                 job.done = os.path.join("job_output", step.name, job.name + "." + hashlib.md5(job.command_with_modules).hexdigest() + ".mugqic.done")
                 job.output_dir = self.output_dir
-                job.dependency_jobs = self.dependency_jobs(job)
-                if not self.force_jobs and job.is_up2date():
+
+            if stat_prefetch_threads and not self.force_jobs:
+                with planning_profile.phase("stat_prefetch"):
+                    stat_cache.prefetch([job.abspath(file) for job in jobs for file in (job.done,) + job.input_files + job.output_files], stat_prefetch_threads)
+
+            for job in jobs:
+                with planning_profile.phase("dependency_jobs"):
+                    job.dependency_jobs = self.dependency_jobs(job)
+                with planning_profile.phase("is_up2date"):
+                    is_up2date = not self.force_jobs and job.is_up2date()
+                if is_up2date:
                     log.info("Job " + job.name + " up to date... skipping")
                 else:
                     step.add_job(job)
+                    self.index_job(job)
+            job_fingerprints.save()
+            planning_profile.end_step(len(jobs), len(step.jobs))
             log.info("Step " + step.name + ": " + str(len(step.jobs)) + " job" + ("s" if len(step.jobs) > 1 else "") + " created" + ("" if step.jobs else "... skipping") + "\n")
+
+        if self.plan_cache and cached_step_jobs is None:
+            self.plan_cache.save(step_jobs, probes)
+
         log.info("TOTAL: " + str(len(self.jobs)) + " job" + ("s" if len(self.jobs) > 1 else "") + " created" + ("" if self.jobs else "... skipping") + "\n")
+        log.info("Stat cache: " + str(stat_cache.hits) + " hits, " + str(stat_cache.misses) + " misses\n")
+        log.info("Config: " + str(config.param_lookups) + " param lookups, " + str(config.param_cache_hits) + " cache hits\n")
+
+    # Remove dependency edges implied by other dependencies, e.g. when a job depends on both a job and its upstream job.
+    # Jobs are in creation order, which is a topological order since dependency jobs are always created first.
+    # Job ancestor sets are integer bitsets of job positions, released as soon as all dependent jobs are processed.
+    def reduce_dependencies(self):
+        jobs = self.jobs
+        positions = dict([(job, position) for position, job in enumerate(jobs)])
+
+        remaining_dependents = [0] * len(jobs)
+        for job in jobs:
+            for dependency_job in job.dependency_jobs:
+                remaining_dependents[positions[dependency_job]] += 1
+
+        ancestors = {}
+        nb_edges = 0
+        nb_removed_edges = 0
+        for position, job in enumerate(jobs):
+            dependency_positions = [positions[dependency_job] for dependency_job in job.dependency_jobs]
+
+            # A dependency is redundant if it is an ancestor of another dependency
+            implied_ancestors = 0
+            for dependency_position in dependency_positions:
+                implied_ancestors |= ancestors[dependency_position]
+            reduced_dependency_positions = [dependency_position for dependency_position in dependency_positions if not (implied_ancestors >> dependency_position) & 1]
+            nb_edges += len(dependency_positions)
+            nb_removed_edges += len(dependency_positions) - len(reduced_dependency_positions)
+            if len(reduced_dependency_positions) < len(dependency_positions):
+                job.dependency_jobs = [jobs[dependency_position] for dependency_position in reduced_dependency_positions]
+
+            if remaining_dependents[position]:
+                job_ancestors = implied_ancestors
+                for dependency_position in dependency_positions:
+                    job_ancestors |= 1 << dependency_position
+                ancestors[position] = job_ancestors
+
+            for dependency_position in dependency_positions:
+                remaining_dependents[dependency_position] -= 1
+                if not remaining_dependents[dependency_position]:
+                    del ancestors[dependency_position]
+
+        log.info("Transitive reduction: " + str(nb_removed_edges) + " of " + str(nb_edges) + " dependency edges removed\n")
+
+    # Pack short jobs of each step into bundle jobs running them one after the other, up to 'job_packing_target_runtime' seconds.
+    # Job runtimes are estimated by the 'estimated_runtime' parameter (in seconds) of the job name prefix config section,
+    # e.g. "[md5] estimated_runtime=10": jobs without estimated runtime are never packed.
+    # Only jobs with the same name prefix, hence the same cluster settings, are packed together, in creation order.
+    # A job joins a bundle only if its dependencies are in the bundle or created before the bundle first job,
+    # so that no dependency path can leave the bundle and come back to it.
+    # Each packed job still creates its own .done file, so that it is up to date when the pipeline is run again.
+    def pack_jobs(self):
+        target_runtime = config.param('DEFAULT', 'job_packing_target_runtime', type='posint')
+        positions = dict([(job, position) for position, job in enumerate(self.jobs)])
+        bundle_jobs = {}
+        nb_packed_jobs = 0
+        nb_bundles = 0
+
+        for step in self.step_range:
+            # Open bundle of each job name prefix
+            open_bundles = {}
+            bundles = []
+            for job in step.jobs:
+                job_name_prefix = job.name.split(".")[0]
+                runtime = config.param(job_name_prefix, 'estimated_runtime', required=False, type='posint')
+                if not runtime or runtime >= target_runtime:
+                    continue
+
+                bundle = open_bundles.get(job_name_prefix)
+                if not bundle or bundle['runtime'] + runtime > target_runtime or \
+                    [dependency_job for dependency_job in job.dependency_jobs if dependency_job not in bundle['job_set'] and positions[dependency_job] > bundle['position']]:
+                    bundle = {'prefix': job_name_prefix, 'position': positions[job], 'runtime': 0, 'jobs': [], 'job_set': set()}
+                    open_bundles[job_name_prefix] = bundle
+                    bundles.append(bundle)
+                bundle['runtime'] += runtime
+                bundle['jobs'].append(job)
+                bundle['job_set'].add(job)
+
+            step_bundle_jobs = {}
+            for bundle in [bundle for bundle in bundles if len(bundle['jobs']) > 1]:
+                nb_bundles += 1
+                bundle_job = self.bundle_job(step, bundle['jobs'], bundle['prefix'] + BUNDLE_JOB_NAME_INFIX + str(nb_bundles))
+                for job in bundle['jobs']:
+                    bundle_jobs[job] = bundle_job
+                step_bundle_jobs[bundle['jobs'][0]] = bundle_job
+                nb_packed_jobs += len(bundle['jobs'])
+
+            # Replace each bundle first job by the bundle job and remove other packed jobs, then renumber step jobs
+            if step_bundle_jobs:
+                jobs = [step_bundle_jobs.get(job, job) for job in step.jobs if job in step_bundle_jobs or job not in bundle_jobs]
+                del step.jobs[:]
+                for job in jobs:
+                    step.add_job(job)
+
+        # Replace packed job dependencies by their bundle job
+        if bundle_jobs:
+            for job in self.jobs:
+                dependency_jobs = collections.OrderedDict()
+                for dependency_job in job.dependency_jobs:
+                    dependency_job = bundle_jobs.get(dependency_job, dependency_job)
+                    if dependency_job is not job:
+                        dependency_jobs[dependency_job] = None
+                job.dependency_jobs = dependency_jobs.keys()
+
+        log.info("Job packing: " + str(nb_packed_jobs) + " jobs packed into " + str(nb_bundles) + " bundle jobs\n")
+
+    # Return a job running a list of jobs one after the other, each of them creating its own .done file
+    def bundle_job(self, step, jobs, name):
+        job_builder = ConcatJobBuilder()
+        commands = []
+        for job in jobs:
+            job_builder.add(job)
+            done_command = job_fingerprints.done_command(job, job.done) if job_fingerprints.enabled else "touch " + job.done
+            start_command = ""
+            # Each packed job records its own start time, so that its ledger runtime does not include previous packed jobs
+            if job_state_ledger.enabled:
+                start_command = job_state_ledger.start_command(job) + " && \\\n"
+                done_command += " && " + job_state_ledger.append_command(job)
+            commands.append("rm -f " + job.done + " && \\\n" + start_command + job.command + " && \\\n" + done_command)
+
+        bundle_job = job_builder.build(name)
+        bundle_job.command = " && \\\n".join(commands)
+        bundle_job.done = os.path.join("job_output", step.name, bundle_job.name + "." + hashlib.md5(bundle_job.command_with_modules).hexdigest() + ".mugqic.done")
+        bundle_job.output_dir = self.output_dir
+        bundle_job.dependency_jobs = [dependency_job for job in jobs for dependency_job in job.dependency_jobs]
+        return bundle_job
+
+    # Estimated runtime of a job in seconds: 'estimated_runtime' parameter of the job name prefix config section,
+    # else the job state ledger runtime of the same job command or the mean runtime of jobs with the same name prefix,
+    # else the job walltime from 'cluster_walltime', else 1 second
+    def job_runtime(self, job):
+        job_name_prefix = job.name.split(".")[0]
+        runtime = config.param(job_name_prefix, 'estimated_runtime', required=False, type='posint')
+        if runtime:
+            return runtime
+
+        if job_state_ledger.enabled:
+            runtime = job_state_ledger.runtime(job)
+            if runtime is None:
+                runtime = job_state_ledger.mean_runtime(job_name_prefix)
+            if runtime is not None:
+                return runtime
+
+        walltime = job_walltime(job)
+        return walltime if walltime is not None else 1
+
+    # Set job priorities from critical path lengths, so that job schedulers start first the jobs delaying the pipeline end the most.
+    # The critical path length of a job is its runtime plus the longest critical path length of its dependent jobs,
+    # computed in reverse creation order. Priorities are scaled from 0 to 1023 (longest critical path).
+    # Jobs of each step are then sorted by decreasing critical path length, which keeps a topological order
+    # since a dependency job always has a longer critical path than its dependent jobs (or equal, with zero runtime).
+    def prioritize_jobs(self):
+        jobs = self.jobs
+        critical_paths = {}
+        dependent_critical_paths = dict([(job, 0) for job in jobs])
+        for job in reversed(jobs):
+            critical_paths[job] = self.job_runtime(job) + dependent_critical_paths[job]
+            for dependency_job in job.dependency_jobs:
+                dependent_critical_paths[dependency_job] = max(dependent_critical_paths[dependency_job], critical_paths[job])
+
+        max_critical_path = max(critical_paths.values() + [1])
+        for job in jobs:
+            job.priority = int(round(1023.0 * critical_paths[job] / max_critical_path))
+
+        # Sort step jobs, stable for equal critical paths, then renumber them
+        for step in self.step_range:
+            step_jobs = sorted(step.jobs, key=lambda job: -critical_paths[job])
+            del step.jobs[:]
+            for job in step_jobs:
+                step.add_job(job)
+
+        if jobs:
+            log.info("Critical path priorities: longest critical path " + str(datetime.timedelta(seconds=max_critical_path)) + "\n")
 
     def submit_jobs(self):
+        # Optional packing of short jobs into bundle jobs, to submit fewer jobs to the job scheduler
+        if config.param('DEFAULT', 'job_packing_target_runtime', required=False):
+            self.pack_jobs()
+
+        # Optional transitive reduction of job dependencies, to submit fewer dependency edges to the job scheduler
+        if config.param('DEFAULT', 'transitive_reduction', required=False, type='boolean'):
+            self.reduce_dependencies()
+
+        # Optional job priorities and job order based on critical path lengths
+        if config.param('DEFAULT', 'critical_path_priority', required=False, type='boolean'):
+            self.prioritize_jobs()
+
+        # Optional module environment snapshots sourced by jobs instead of 'module load', once job .done files are computed
+        if config.param('DEFAULT', 'module_snapshots', required=False, type='boolean'):
+            module_snapshots.create(self.output_dir, [job.modules for job in self.jobs])
         self.scheduler.submit(self)
 
     def report_jobs(self, output_dir=None):
@@ -292,7 +621,7 @@ Steps:
             # Retrieve absolute paths of report files
             for report_file in job.report_files:
                 if report_file not in report_files:
-                    if os.path.exists(os.path.join(output_dir, report_file)) :
+                    if stat_cache.exists(os.path.join(output_dir, report_file)):
                         report_files.append(report_file)
                     else:
                         log.warn("Report file: " + report_file + " not found!... skipping")  
@@ -346,7 +675,7 @@ pandoc \\
             abspath_removable_files.extend([job.abspath(removable_file) for removable_file in job.removable_files])
         # Remove removable file duplicates but keep the order
         for removable_file in list(collections.OrderedDict.fromkeys(abspath_removable_files)):
-            if os.path.exists(removable_file):
+            if stat_cache.exists(removable_file):
                 print("rm -rf " + removable_file)
 
 # Return a range list given a string.
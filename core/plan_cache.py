@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import cPickle
+import hashlib
+import logging
+import os
+import StringIO
+import sys
+
+# MUGQIC Modules
+from config import *
+from stat_cache import *
+
+log = logging.getLogger(__name__)
+
+# Increment when the cache content format changes
+PLAN_CACHE_VERSION = 1
+
+# Command line arguments which do not change created jobs
+PLAN_CACHE_IGNORED_ARGS = ["log", "plan_cache", "profile"]
+
+# Return the MD5 checksum of a file content
+def file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+# Cache of the jobs created by each step, before job up-to-date checks, written next to the config trace file.
+# The cache key is a checksum of the merged config, the command line arguments (with readset, design and config file contents),
+# the genome dictionary and the pipeline source code.
+# File system probes made while creating jobs (e.g. existence of candidate input files) are stored with the jobs:
+# if any of them changed, jobs are created again.
+class PlanCache(object):
+
+    def __init__(self, pipeline):
+        self._file = pipeline.__class__.__name__ + ".plan.cache"
+        self._key = self._checksum(pipeline)
+
+    @property
+    def file(self):
+        return self._file
+
+    @property
+    def key(self):
+        return self._key
+
+    def _checksum(self, pipeline):
+        md5 = hashlib.md5()
+        md5.update(str(PLAN_CACHE_VERSION) + "\n" + pipeline.__class__.__name__ + "\n")
+
+        # Merged config values
+        config_values = StringIO.StringIO()
+        config.write(config_values)
+        md5.update(config_values.getvalue())
+
+        # Command line arguments, using file contents for file arguments
+        for name, value in sorted(vars(pipeline.args).items()):
+            if name not in PLAN_CACHE_IGNORED_ARGS:
+                items = value if isinstance(value, list) else [value]
+                md5.update(name + "=" + "\t".join([item.name + ":" + file_md5(item.name) if isinstance(item, file) else repr(item) for item in items]) + "\n")
+
+        # Genome dictionary, used by some pipelines to scatter jobs by chromosome
+        genome_dictionary = config.param('DEFAULT', 'genome_dictionary', required=False)
+        if genome_dictionary and os.path.isfile(os.path.expandvars(genome_dictionary)):
+            md5.update("genome_dictionary:" + file_md5(os.path.expandvars(genome_dictionary)) + "\n")
+
+        # Pipeline source code, including the pipeline class file in case it is outside the source tree
+        # (found from its module rather than with inspect, which is slow to import)
+        source_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        pipeline_file = sys.modules[pipeline.__class__.__module__].__file__
+        source_files = [pipeline_file[:-1] if pipeline_file.endswith((".pyc", ".pyo")) else pipeline_file]
+        for package in ["core", "bfx", "pipelines"]:
+            for directory, subdirectories, files in os.walk(os.path.join(source_dir, package)):
+                subdirectories.sort()
+                source_files.extend([os.path.join(directory, source_file) for source_file in sorted(files) if source_file.endswith(".py")])
+        for source_file in source_files:
+            md5.update(source_file + ":" + file_md5(source_file) + "\n")
+
+        return md5.hexdigest()
+
+    # Return the list of jobs of each step by step name, or None if the cache is missing, outdated or invalid
+    def load(self):
+        if not os.path.isfile(self.file):
+            return None
+
+        log.info("Load plan cache " + self.file + " ...")
+        try:
+            with open(self.file, 'rb') as plan_cache:
+                if cPickle.load(plan_cache) != self.key:
+                    log.info("Plan cache key changed... creating jobs\n")
+                    return None
+                probes = cPickle.load(plan_cache)
+                if not stat_cache.probes_unchanged(probes):
+                    log.info("Plan cache file system probes changed... creating jobs\n")
+                    return None
+                step_jobs = cPickle.load(plan_cache)
+        except Exception as e:
+            log.warning("Invalid plan cache " + self.file + " ignored: " + str(e))
+            return None
+
+        log.info("Plan cache loaded\n")
+        return step_jobs
+
+    # Save the list of jobs of each step by step name, with file system probes made while creating them
+    def save(self, step_jobs, probes):
+        with open(self.file + ".tmp", 'wb') as plan_cache:
+            cPickle.dump(self.key, plan_cache, 2)
+            cPickle.dump(probes, plan_cache, 2)
+            cPickle.dump(step_jobs, plan_cache, 2)
+        os.rename(self.file + ".tmp", self.file)
+        log.info("Plan cache " + self.file + " saved\n")
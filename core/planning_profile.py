@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import collections
+import contextlib
+import json
+import logging
+import resource
+import time
+
+# MUGQIC Modules
+from config import *
+from stat_cache import *
+
+log = logging.getLogger(__name__)
+
+# Timed planning phases, in table column order
+PLANNING_PHASES = ["create", "select_input_files", "dependency_jobs", "is_up2date", "stat_prefetch"]
+
+# Maximum resident set size of the pipeline process in MB (ru_maxrss is in KB on Linux)
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+# Profile of job creation, step by step: wall time of each planning phase, number of jobs,
+# file system calls (stat cache misses), stat cache hits, config lookups and peak memory.
+# Phases are nested in step wall time: "create" is the step method run (or plan cache load),
+# which includes "select_input_files"; "dependency_jobs" and "is_up2date" are dependency and up-to-date checks of created jobs.
+# Work done by planning worker processes (see 'planning_processes') is part of step wall time only.
+class PlanningProfile(object):
+
+    def __init__(self):
+        self._enabled = False
+        self._steps = []
+        self._current_step = None
+        self._submit_seconds = None
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        self._enabled = value
+
+    @property
+    def steps(self):
+        return self._steps
+
+    def start_step(self, step_name):
+        if self.enabled:
+            self._current_step = collections.OrderedDict([
+                ('step', step_name),
+                ('wall_seconds', time.time()),
+                ('phase_seconds', collections.OrderedDict([(phase, 0.0) for phase in PLANNING_PHASES])),
+                ('jobs_created', 0),
+                ('jobs', 0),
+                ('fs_calls', stat_cache.misses),
+                ('stat_cache_hits', stat_cache.hits),
+                ('config_lookups', config.param_lookups),
+                ('peak_rss_mb', None)
+            ])
+
+    def end_step(self, nb_jobs_created, nb_jobs):
+        if self.enabled:
+            step = self._current_step
+            step['wall_seconds'] = time.time() - step['wall_seconds']
+            step['jobs_created'] = nb_jobs_created
+            step['jobs'] = nb_jobs
+            step['fs_calls'] = stat_cache.misses - step['fs_calls']
+            step['stat_cache_hits'] = stat_cache.hits - step['stat_cache_hits']
+            step['config_lookups'] = config.param_lookups - step['config_lookups']
+            step['peak_rss_mb'] = peak_rss_mb()
+            self._steps.append(step)
+            self._current_step = None
+
+    # Add the wall time of a block to a phase of the current step, if any
+    @contextlib.contextmanager
+    def phase(self, name):
+        if self.enabled and self._current_step:
+            start = time.time()
+            try:
+                yield
+            finally:
+                self._current_step['phase_seconds'][name] += time.time() - start
+        else:
+            yield
+
+    @property
+    def submit_seconds(self):
+        return self._submit_seconds
+
+    @submit_seconds.setter
+    def submit_seconds(self, value):
+        self._submit_seconds = value
+
+    # Human-readable table of step profiles, with a total line
+    def table(self):
+        header = ["Step", "Wall (s)"] + [phase + " (s)" for phase in PLANNING_PHASES] + ["Jobs created", "Jobs", "FS calls", "Stat cache hits", "Config lookups", "Peak RSS (MB)"]
+        rows = [[step['step'], "%.3f" % step['wall_seconds']] + ["%.3f" % step['phase_seconds'][phase] for phase in PLANNING_PHASES] +
+            [str(step[name]) for name in ['jobs_created', 'jobs', 'fs_calls', 'stat_cache_hits', 'config_lookups']] + ["%.1f" % step['peak_rss_mb']] for step in self.steps]
+        rows.append(["TOTAL", "%.3f" % sum([step['wall_seconds'] for step in self.steps])] +
+            ["%.3f" % sum([step['phase_seconds'][phase] for step in self.steps]) for phase in PLANNING_PHASES] +
+            [str(sum([step[name] for step in self.steps])) for name in ['jobs_created', 'jobs', 'fs_calls', 'stat_cache_hits', 'config_lookups']] +
+            ["%.1f" % max([step['peak_rss_mb'] for step in self.steps] + [peak_rss_mb()])])
+
+        widths = [max([len(row[i]) for row in [header] + rows]) for i in range(len(header))]
+        lines = ["  ".join([value.ljust(width) if i == 0 else value.rjust(width) for i, (value, width) in enumerate(zip(row, widths))]) for row in [header] + rows]
+        lines.insert(1, "-" * len(lines[0]))
+        lines.insert(len(lines) - 1, "-" * len(lines[0]))
+        if self.submit_seconds is not None:
+            lines.append("Job submission: %.3f s" % self.submit_seconds)
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, profile_file):
+        with open(profile_file, 'w') as profile:
+            json.dump(collections.OrderedDict([('steps', self.steps), ('submit_seconds', self.submit_seconds), ('peak_rss_mb', peak_rss_mb())]), profile, indent=2)
+            profile.write("\n")
+        log.info("Planning profile written in " + profile_file)
+
+# Global planning profile object used throughout the whole pipeline
+planning_profile = PlanningProfile()
@@ -20,15 +20,39 @@
 ################################################################################
 
 # Python Standard Modules
+import bisect
+import collections
+import datetime
+import errno
+import hashlib
 import json
+import multiprocessing
 import os
+import pipes
+import re
+import shlex
+import signal
+import StringIO
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 
 # MUGQIC Modules
 from config import *
+from fingerprint import *
+from job import *
+from job_state import *
+from telemetry import *
 
 # Output comment separator line
 separator_line = "#" + "-" * 79
 
+# Escape a bash command to be embedded in a double-quoted string and evaluated later
+def escape_double_quotes(command):
+    return command.replace("\\", "\\\\").replace("\"", "\\\"").replace("$", "\\$").replace("`", "\\`")
+
 def create_scheduler(type):
     if type == "pbs":
         return PBSScheduler()
@@ -36,14 +60,118 @@ def create_scheduler(type):
         return BatchScheduler()
     elif type == "daemon":
         return DaemonScheduler()
+    elif type == "slurm":
+        return SlurmScheduler()
+    elif type == "direct":
+        return DirectScheduler()
+    elif type == "local":
+        return LocalScheduler()
     else:
         raise Exception("Error: scheduler type \"" + type + "\" is invalid!")
 
+# Walltime of barrier jobs, which only run "true"
+BARRIER_WALLTIME = "00:05:00"
+
+# Return a cluster setting of a job name prefix.
+# Unless set in a [barrier] config section, barrier jobs get BARRIER_WALLTIME and 1 core instead of the DEFAULT ones,
+# e.g. "-l walltime=00:05:00" and "-l nodes=1:ppn=1" (PBS) or "--time=00:05:00" and "-N 1 --cpus-per-task=1" (SLURM).
+def cluster_setting(job_name_prefix, name):
+    setting = config.param(job_name_prefix, name)
+    if job_name_prefix == "barrier" and not config.has_section_option("barrier", name):
+        if name == 'cluster_walltime':
+            setting = re.sub(r"walltime=\d+(?::\d+)*", "walltime=" + BARRIER_WALLTIME, setting)
+            setting = re.sub(r"(^|\s)(--time[= ]|-t ?)(?:\d+-)?\d+(?::\d+){0,2}(?=\s|$)", r"\g<1>\g<2>" + BARRIER_WALLTIME, setting)
+        elif name == 'cluster_cpu':
+            setting = re.sub(r"(nodes=|ppn=)\d+", r"\g<1>1", setting)
+            setting = re.sub(r"(^|\s)(--nodes[= ]|-N ?|--ntasks[= ]|-n ?|--cpus-per-task[= ]|-c ?)\d+(?=\s|$)", r"\g<1>\g<2>1", setting)
+    return setting
+
 class Scheduler:
+    def __init__(self):
+        # Barrier jobs by dependency job IDs
+        self._barrier_jobs = {}
+        # Dependency jobs and new barrier jobs to submit by job, if created before submission
+        self._submitted_dependency_jobs = {}
+
     def submit(self, pipeline):
         # Needs to be defined in scheduler child class
         raise NotImplementedError
 
+    @property
+    def nb_barrier_jobs(self):
+        return len(self._barrier_jobs)
+
+    # Return the dependency jobs to submit for a job, with the list of new barrier jobs to submit before it.
+    # If a job has more dependencies than 'cluster_max_dependencies', its dependencies are split into chunks
+    # and each chunk is replaced by a barrier job depending on it, recursively.
+    # Barrier jobs are shared by all jobs with the same dependency chunk: N producer jobs and M consumer jobs
+    # depending on all of them use about N + M dependency edges instead of N x M.
+    # Barrier job cluster settings can be set in a [barrier] config section.
+    # A barrier job has the highest priority of the jobs depending on it, directly or through other barrier jobs.
+    def submitted_dependency_jobs(self, job, step):
+        if job in self._submitted_dependency_jobs:
+            return self._submitted_dependency_jobs.pop(job)
+        return self.create_barrier_jobs(job, step)
+
+    # Create the barrier jobs of all pipeline jobs before any of them is submitted,
+    # so that barrier job priorities account for all their dependent jobs
+    def create_pipeline_barrier_jobs(self, pipeline):
+        for step in pipeline.step_range:
+            for job in step.jobs:
+                self._submitted_dependency_jobs[job] = self.create_barrier_jobs(job, step)
+
+    def create_barrier_jobs(self, job, step):
+        dependency_jobs = list(job.dependency_jobs)
+        barrier_jobs = []
+        max_dependencies = config.param('DEFAULT', 'cluster_max_dependencies', required=False, type='posint')
+        if max_dependencies and max_dependencies < 2:
+            raise Exception("Error: cluster_max_dependencies must be at least 2!")
+
+        while max_dependencies and len(dependency_jobs) > max_dependencies:
+            chunks = [dependency_jobs[i:i + max_dependencies] for i in range(0, len(dependency_jobs), max_dependencies)]
+            dependency_jobs = [self.barrier_job(chunk, step, barrier_jobs, job.priority) for chunk in chunks]
+
+        return dependency_jobs, barrier_jobs
+
+    # Return the barrier job of a dependency chunk, creating it if needed and appending it to new barrier jobs
+    def barrier_job(self, dependency_jobs, step, new_barrier_jobs, priority=None):
+        # A single dependency needs no barrier
+        if len(dependency_jobs) == 1:
+            return dependency_jobs[0]
+
+        key = tuple([dependency_job.id for dependency_job in dependency_jobs])
+        if key not in self._barrier_jobs:
+            barrier_number = str(len(self._barrier_jobs) + 1)
+            barrier_job = Job(name="barrier." + step.name + "." + barrier_number, command="true")
+            barrier_job.id = step.name + "_BARRIER_" + barrier_number + "_JOB_ID"
+            barrier_job.done = os.path.join("job_output", step.name, barrier_job.name + "." + hashlib.md5(" ".join(key)).hexdigest() + ".mugqic.done")
+            barrier_job.output_dir = dependency_jobs[0].output_dir
+            barrier_job.dependency_jobs = dependency_jobs
+            self._barrier_jobs[key] = barrier_job
+            new_barrier_jobs.append(barrier_job)
+
+        barrier_job = self._barrier_jobs[key]
+        if priority is not None and (barrier_job.priority is None or priority > barrier_job.priority):
+            barrier_job.priority = priority
+        return barrier_job
+
+    # Return the wave number of each job: jobs of a wave only depend on jobs of previous waves
+    def job_wave_numbers(self, pipeline):
+        job_wave_numbers = {}
+        for job in pipeline.jobs:
+            # Dependency jobs are always created before their dependent jobs
+            job_wave_numbers[job] = max([job_wave_numbers[dependency_job] + 1 for dependency_job in job.dependency_jobs] + [0])
+        return job_wave_numbers
+
+    # Return the list of job waves: each wave contains (step, job) pairs, in creation order
+    def job_waves(self, pipeline):
+        job_wave_numbers = self.job_wave_numbers(pipeline)
+        waves = [[] for wave_number in range(max(job_wave_numbers.values() + [-1]) + 1)]
+        for step in pipeline.step_range:
+            for job in step.jobs:
+                waves[job_wave_numbers[job]].append((step, job))
+        return waves
+
     def print_header(self, pipeline):
         print("""\
 #!/bin/bash
@@ -94,21 +222,34 @@ mkdir -p $JOB_OUTPUT_DIR/$STEP
 class PBSScheduler(Scheduler):
     def submit(self, pipeline):
         self.print_header(pipeline)
+        self.create_pipeline_barrier_jobs(pipeline)
         for step in pipeline.step_range:
             if step.jobs:
                 self.print_step(step)
                 for job in step.jobs:
-                    if job.dependency_jobs:
-                        # Chunk JOB_DEPENDENCIES on multiple lines to avoid lines too long
-                        max_dependencies_per_line = 50
-                        dependency_chunks = [job.dependency_jobs[i:i + max_dependencies_per_line] for i in range(0, len(job.dependency_jobs), max_dependencies_per_line)]
-                        job_dependencies = "JOB_DEPENDENCIES=" + ":".join(["$" + dependency_job.id for dependency_job in dependency_chunks[0]])
-                        for dependency_chunk in dependency_chunks[1:]:
-                            job_dependencies += "\nJOB_DEPENDENCIES=$JOB_DEPENDENCIES:" + ":".join(["$" + dependency_job.id for dependency_job in dependency_chunk])
-                    else:
-                        job_dependencies = "JOB_DEPENDENCIES="
+                    dependency_jobs, barrier_jobs = self.submitted_dependency_jobs(job, step)
+                    for barrier_job in barrier_jobs:
+                        self.print_job(barrier_job, barrier_job.dependency_jobs)
+                    self.print_job(job, dependency_jobs)
 
-                    print("""
+        # Check cluster maximum job submission
+        cluster_max_jobs = config.param('DEFAULT', 'cluster_max_jobs', type='posint', required=False)
+        nb_jobs = len(pipeline.jobs) + self.nb_barrier_jobs
+        if cluster_max_jobs and nb_jobs > cluster_max_jobs:
+            log.warning("Number of jobs: " + str(nb_jobs) + " > Cluster maximum number of jobs: " + str(cluster_max_jobs) + "!")
+
+    def print_job(self, job, dependency_jobs):
+        if dependency_jobs:
+            # Chunk JOB_DEPENDENCIES on multiple lines to avoid lines too long
+            max_dependencies_per_line = 50
+            dependency_chunks = [dependency_jobs[i:i + max_dependencies_per_line] for i in range(0, len(dependency_jobs), max_dependencies_per_line)]
+            job_dependencies = "JOB_DEPENDENCIES=" + ":".join(["$" + dependency_job.id for dependency_job in dependency_chunks[0]])
+            for dependency_chunk in dependency_chunks[1:]:
+                job_dependencies += "\nJOB_DEPENDENCIES=$JOB_DEPENDENCIES:" + ":".join(["$" + dependency_job.id for dependency_job in dependency_chunk])
+        else:
+            job_dependencies = "JOB_DEPENDENCIES="
+
+        print("""
 {separator_line}
 # JOB: {job.id}: {job.name}
 {separator_line}
@@ -118,58 +259,313 @@ JOB_DONE={job.done}
 JOB_OUTPUT_RELATIVE_PATH=$STEP/${{JOB_NAME}}_$TIMESTAMP.o
 JOB_OUTPUT=$JOB_OUTPUT_DIR/$JOB_OUTPUT_RELATIVE_PATH
 COMMAND=$(cat << '{limit_string}'
-{job.command_with_modules}
+{command}
 {limit_string}
 )""".format(
-                            job=job,
-                            job_dependencies=job_dependencies,
-                            separator_line=separator_line,
-                            limit_string=os.path.basename(job.done)
-                        )
-                    )
+                job=job,
+                job_dependencies=job_dependencies,
+                separator_line=separator_line,
+                # With job telemetry, the command is quoted as an argument of the telemetry helper
+                command=pipes.quote(job.command_with_modules) if job_telemetry.enabled else job.command_with_modules,
+                limit_string=os.path.basename(job.done)
+            )
+        )
 
-                    cmd = """\
-echo "rm -f $JOB_DONE && $COMMAND
+        cmd = """\
+echo "{job_start}rm -f $JOB_DONE && {telemetry}$COMMAND
 MUGQIC_STATE=\$PIPESTATUS
 echo MUGQICexitStatus:\$MUGQIC_STATE
-if [ \$MUGQIC_STATE -eq 0 ] ; then touch $JOB_DONE ; fi
+if [ \$MUGQIC_STATE -eq 0 ] ; then {job_done}{job_state} ; fi
 exit \$MUGQIC_STATE" | \\
-""".format(job=job)
-
-                    # Cluster settings section must match job name prefix before first "."
-                    # e.g. "[trimmomatic] cluster_cpu=..." for job name "trimmomatic.readset1"
-                    job_name_prefix = job.name.split(".")[0]
-                    cmd += \
-                        config.param(job_name_prefix, 'cluster_submit_cmd') + " " + \
-                        config.param(job_name_prefix, 'cluster_other_arg') + " " + \
-                        config.param(job_name_prefix, 'cluster_work_dir_arg') + " $OUTPUT_DIR " + \
-                        config.param(job_name_prefix, 'cluster_output_dir_arg') + " $JOB_OUTPUT " + \
-                        config.param(job_name_prefix, 'cluster_job_name_arg') + " $JOB_NAME " + \
-                        config.param(job_name_prefix, 'cluster_walltime') + " " + \
-                        config.param(job_name_prefix, 'cluster_queue') + " " + \
-                        config.param(job_name_prefix, 'cluster_cpu')
-                    if job.dependency_jobs:
-                        cmd += " " + config.param(job_name_prefix, 'cluster_dependency_arg') + "$JOB_DEPENDENCIES"
-                    cmd += " " + config.param(job_name_prefix, 'cluster_submit_cmd_suffix')
-
-                    if config.param(job_name_prefix, 'cluster_cmd_produces_job_id'):
-                        cmd = job.id + "=$(" + cmd + ")"
-                    else:
-                        cmd += "\n" + job.id + "=" + job.name
-
-                    # Write job parameters in job list file
-                    cmd += "\necho \"$" + job.id + "\t$JOB_NAME\t$JOB_DEPENDENCIES\t$JOB_OUTPUT_RELATIVE_PATH\" >> $JOB_LIST\n"
-
-                    print cmd
+""".format(
+            telemetry=job_telemetry.prefix(job_telemetry.file()) if job_telemetry.enabled else "",
+            job_done=escape_double_quotes(job_fingerprints.done_command(job, job.done)) if job_fingerprints.enabled else "touch $JOB_DONE",
+            job_start=escape_double_quotes(job_state_ledger.start_command(job)) + "\n" if job_state_ledger.records(job) else "",
+            job_state=" ; " + escape_double_quotes(job_state_ledger.append_command(job)) if job_state_ledger.records(job) else ""
+        )
+
+        # Cluster settings section must match job name prefix before first "."
+        # e.g. "[trimmomatic] cluster_cpu=..." for job name "trimmomatic.readset1"
+        job_name_prefix = job.name.split(".")[0]
+        cmd += \
+            config.param(job_name_prefix, 'cluster_submit_cmd') + " " + \
+            config.param(job_name_prefix, 'cluster_other_arg') + " " + \
+            config.param(job_name_prefix, 'cluster_work_dir_arg') + " $OUTPUT_DIR " + \
+            config.param(job_name_prefix, 'cluster_output_dir_arg') + " $JOB_OUTPUT " + \
+            config.param(job_name_prefix, 'cluster_job_name_arg') + " $JOB_NAME " + \
+            cluster_setting(job_name_prefix, 'cluster_walltime') + " " + \
+            config.param(job_name_prefix, 'cluster_queue') + " " + \
+            cluster_setting(job_name_prefix, 'cluster_cpu')
+        if job.priority is not None:
+            cmd += " " + (config.param(job_name_prefix, 'cluster_priority_arg', required=False) or "-p ") + str(job.priority)
+        if dependency_jobs:
+            cmd += " " + config.param(job_name_prefix, 'cluster_dependency_arg') + "$JOB_DEPENDENCIES"
+        cmd += " " + config.param(job_name_prefix, 'cluster_submit_cmd_suffix')
+
+        if config.param(job_name_prefix, 'cluster_cmd_produces_job_id'):
+            cmd = job.id + "=$(" + cmd + ")"
+        else:
+            cmd += "\n" + job.id + "=" + job.name
+
+        # Write job parameters in job list file
+        cmd += "\necho \"$" + job.id + "\t$JOB_NAME\t$JOB_DEPENDENCIES\t$JOB_OUTPUT_RELATIVE_PATH\" >> $JOB_LIST\n"
+
+        print cmd
+
+# Submit jobs directly from the pipeline process instead of printing a job submission script.
+# Submission commands are built from the same cluster settings as PBS scripts, with environment variables expanded,
+# and job scripts are given on their standard input. The job ID is the last output line containing a digit.
+# Jobs are submitted by waves of jobs whose dependencies are already submitted,
+# with 'direct_submit_threads' concurrent submissions (default: 4)
+# and at most 'direct_submit_rate' submissions per second (default: unlimited).
+# A failed submission is retried 'direct_submit_retries' times (default: 0) with an exponential backoff
+# starting at 'direct_submit_retry_delay' seconds (default: 2). If it still fails, no other job is submitted.
+# Retries may submit duplicate jobs, since a submission may fail or time out after the job was queued:
+# if 'cluster_queue_cmd' is set and lists job names, a job found in the queue before a retry is not submitted again.
+# Job IDs are appended to the job list file as soon as jobs are submitted, so that a partial submission can be cancelled.
+# If the number of jobs exceeds 'cluster_max_jobs', jobs are fed progressively to the cluster queue
+# if 'cluster_queue_cmd' is set, otherwise no job is submitted at all.
+class DirectScheduler(Scheduler):
+    def submit(self, pipeline):
+        if not pipeline.jobs:
+            log.info("No job to submit")
+            return
+
+        # List submitted jobs in creation order, including barrier jobs, with their dependency jobs
+        submitted_jobs = []
+        for step in pipeline.step_range:
+            for job in step.jobs:
+                dependency_jobs, barrier_jobs = self.submitted_dependency_jobs(job, step)
+                submitted_jobs.extend([(step, barrier_job, barrier_job.dependency_jobs) for barrier_job in barrier_jobs])
+                submitted_jobs.append((step, job, dependency_jobs))
 
-        # Check cluster maximum job submission
         cluster_max_jobs = config.param('DEFAULT', 'cluster_max_jobs', type='posint', required=False)
-        if cluster_max_jobs and len(pipeline.jobs) > cluster_max_jobs:
-            log.warning("Number of jobs: " + str(len(pipeline.jobs)) + " > Cluster maximum number of jobs: " + str(cluster_max_jobs) + "!")
+        cluster_queue_cmd = config.param('DEFAULT', 'cluster_queue_cmd', required=False)
+        if cluster_max_jobs and len(submitted_jobs) > cluster_max_jobs and not cluster_queue_cmd:
+            raise Exception("Error: number of jobs: " + str(len(submitted_jobs)) + " > Cluster maximum number of jobs: " + str(cluster_max_jobs) + ", no job submitted (set cluster_queue_cmd to submit jobs progressively)!")
+
+        self._output_dir = pipeline.output_dir
+        self._timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H.%M.%S")
+        self._job_list = os.path.join(pipeline.output_dir, "job_output", pipeline.__class__.__name__ + "_job_list_" + self._timestamp)
+        self._job_ids = {}
+        self._lock = threading.Lock()
+        self._rate = config.param('DEFAULT', 'direct_submit_rate', required=False, type='float')
+        self._next_submission_time = 0
+        self._retries = config.param('DEFAULT', 'direct_submit_retries', required=False, type='int')
+        self._retries = 0 if self._retries == "" else self._retries
+        self._retry_delay = config.param('DEFAULT', 'direct_submit_retry_delay', required=False, type='float') or 2
+        self._queue_retries = config.param('DEFAULT', 'cluster_queue_retries', required=False, type='int')
+        self._queue_retries = 3 if self._queue_retries == "" else self._queue_retries
+        self._queue_cmd = cluster_queue_cmd if self._retries else None
+        # Jobs queued before submission, e.g. by a previous pipeline run, are not mistaken for the ones of failed submissions
+        self._previously_queued_job_ids = self.queued_job_ids(self._queue_cmd) if self._queue_cmd else set()
+
+        log.info("Submit " + str(len(submitted_jobs)) + " jobs, job list: " + self._job_list)
+        if not os.path.isdir(os.path.dirname(self._job_list)):
+            os.makedirs(os.path.dirname(self._job_list))
+        self._pool = ThreadPool(config.param('DEFAULT', 'direct_submit_threads', required=False, type='posint') or 4)
+        try:
+            if cluster_max_jobs and len(submitted_jobs) > cluster_max_jobs:
+                self.feed_jobs(submitted_jobs, cluster_max_jobs, cluster_queue_cmd)
+            else:
+                self.submit_batch(submitted_jobs)
+        finally:
+            self._pool.close()
+            self._pool.join()
+        log.info(str(len(self._job_ids)) + " jobs submitted")
+
+    # Submit a list of jobs by waves: jobs of a wave only depend on jobs of previous waves or already submitted jobs
+    def submit_batch(self, submitted_jobs):
+        job_wave_numbers = {}
+        waves = []
+        for submitted_job in submitted_jobs:
+            step, job, dependency_jobs = submitted_job
+            wave_number = max([job_wave_numbers[dependency_job] + 1 for dependency_job in dependency_jobs if dependency_job in job_wave_numbers] + [0])
+            job_wave_numbers[job] = wave_number
+            if wave_number == len(waves):
+                waves.append([])
+            waves[wave_number].append(submitted_job)
+
+        for wave in waves:
+            # Submit jobs with the highest priority first
+            wave.sort(key=lambda submitted_job: -(submitted_job[1].priority or 0))
+            # A timeout lets KeyboardInterrupt through
+            self._pool.map_async(self.submit_job, wave).get(365 * 24 * 3600)
+
+    # Return the output lines of 'cluster_queue_cmd' e.g. "qstat -u $USER" or "squeue -h -u $USER -o '%i %j'"
+    # A failed queue command is retried 'cluster_queue_retries' times (default: 3) with the same backoff as submissions
+    def queue_lines(self, cluster_queue_cmd):
+        for attempt in range(self._queue_retries + 1):
+            try:
+                output = subprocess.check_output(os.path.expandvars(cluster_queue_cmd), shell=True)
+                return [line for line in output.splitlines() if line.strip()]
+            except subprocess.CalledProcessError as e:
+                error = "exit status " + str(e.returncode)
+
+            if attempt < self._queue_retries:
+                delay = self._retry_delay * 2 ** attempt
+                log.warning("Cluster queue command failed (" + error + "), retry in " + str(delay) + "s...")
+                time.sleep(delay)
+        raise Exception("Error: cluster queue command \"" + cluster_queue_cmd + "\" failed after " + str(self._queue_retries + 1) + " attempts (" + error + ")!")
+
+    # Return the set of job IDs in the cluster queue
+    # Job IDs are the first word of output lines, without server name e.g. "1234" for "1234.server"
+    def queued_job_ids(self, cluster_queue_cmd):
+        return set([line.split()[0].split(".")[0] for line in self.queue_lines(cluster_queue_cmd)])
+
+    # Return the ID of a job queued since submission start with the same name as a job, or None if not found
+    # Job names must be listed in full in cluster queue output lines, after job IDs
+    def queued_job_id(self, job, cluster_queue_cmd):
+        for line in self.queue_lines(cluster_queue_cmd):
+            if job.name in line.split()[1:] and line.split()[0].split(".")[0] not in self._previously_queued_job_ids:
+                return line.split()[0]
+        return None
+
+    # Submit jobs progressively in creation order, so that at most 'cluster_max_jobs' submitted jobs are in the cluster queue.
+    # The queue is polled every 'cluster_queue_poll_interval' seconds (default: 60) to release further submissions.
+    # A dependency job which has left the queue is not a submitted dependency anymore if its .done file exists.
+    # Otherwise it failed: jobs depending on it are not submitted.
+    def feed_jobs(self, submitted_jobs, max_jobs, cluster_queue_cmd):
+        if not config.param('DEFAULT', 'cluster_cmd_produces_job_id', type='boolean'):
+            raise Exception("Error: cluster_cmd_produces_job_id must be true to submit jobs progressively!")
+        poll_interval = config.param('DEFAULT', 'cluster_queue_poll_interval', required=False, type='posint') or 60
+
+        pending_jobs = collections.deque(submitted_jobs)
+        queued_jobs = set()
+        left_jobs = set()
+        blocked_jobs = set()
+        log.info("Submit at most " + str(max_jobs) + " jobs at a time...")
+
+        while pending_jobs:
+            queued_job_ids = self.queued_job_ids(cluster_queue_cmd)
+            for job in list(queued_jobs):
+                if self._job_ids[job].split(".")[0] not in queued_job_ids:
+                    queued_jobs.remove(job)
+                    left_jobs.add(job)
+
+            batch = []
+            while pending_jobs and len(queued_jobs) + len(batch) < max_jobs:
+                step, job, dependency_jobs = pending_jobs.popleft()
+                failed_dependency_jobs = [dependency_job for dependency_job in dependency_jobs if dependency_job in blocked_jobs or (dependency_job in left_jobs and not os.path.exists(dependency_job.abspath(dependency_job.done)))]
+                if failed_dependency_jobs:
+                    log.error("Job " + job.name + " not submitted since dependency job " + failed_dependency_jobs[0].name + " failed or was not submitted")
+                    blocked_jobs.add(job)
+                else:
+                    batch.append((step, job, [dependency_job for dependency_job in dependency_jobs if dependency_job not in left_jobs]))
+
+            self.submit_batch(batch)
+            queued_jobs.update([job for step, job, dependency_jobs in batch])
+            if pending_jobs:
+                log.info(str(len(self._job_ids)) + " jobs submitted, " + str(len(queued_jobs)) + " in queue, " + str(len(pending_jobs)) + " pending...")
+                time.sleep(poll_interval)
+
+        if blocked_jobs:
+            raise Exception("Error: " + str(len(blocked_jobs)) + " job(s) not submitted since their dependency jobs failed!")
+
+    # Wait until the next submission is allowed by the rate limit
+    def wait_rate_limit(self):
+        if self._rate:
+            with self._lock:
+                delay = self._next_submission_time - time.time()
+                self._next_submission_time = max(self._next_submission_time, time.time()) + 1.0 / self._rate
+            if delay > 0:
+                time.sleep(delay)
+
+    # Split a cluster setting into command arguments, after environment variable expansion
+    def arguments(self, setting):
+        expanded_setting = os.path.expandvars(setting)
+        if re.search("\$\w|\$\{", expanded_setting):
+            raise Exception("Error: undefined environment variable in cluster setting \"" + setting + "\"!")
+        return shlex.split(expanded_setting)
+
+    def submit_job(self, submitted_job):
+        step, job, dependency_jobs = submitted_job
+        dependency_ids = [self._job_ids[dependency_job] for dependency_job in dependency_jobs]
+        job_output_relative_path = os.path.join(step.name, job.name + "_" + self._timestamp + ".o")
+        job_output = os.path.join(self._output_dir, "job_output", job_output_relative_path)
+        if not os.path.isdir(os.path.dirname(job_output)):
+            try:
+                os.makedirs(os.path.dirname(job_output))
+            except OSError as e:
+                # Directory created meanwhile by another thread
+                if e.errno != errno.EEXIST:
+                    raise
+
+        # Cluster settings section must match job name prefix before first "."
+        job_name_prefix = job.name.split(".")[0]
+        command = \
+            self.arguments(config.param(job_name_prefix, 'cluster_submit_cmd')) + \
+            self.arguments(config.param(job_name_prefix, 'cluster_other_arg')) + \
+            self.arguments(config.param(job_name_prefix, 'cluster_work_dir_arg')) + [self._output_dir] + \
+            self.arguments(config.param(job_name_prefix, 'cluster_output_dir_arg')) + [job_output] + \
+            self.arguments(config.param(job_name_prefix, 'cluster_job_name_arg')) + [job.name] + \
+            self.arguments(cluster_setting(job_name_prefix, 'cluster_walltime')) + \
+            self.arguments(config.param(job_name_prefix, 'cluster_queue')) + \
+            self.arguments(cluster_setting(job_name_prefix, 'cluster_cpu'))
+        if job.priority is not None:
+            command += self.arguments((config.param(job_name_prefix, 'cluster_priority_arg', required=False) or "-p ") + str(job.priority))
+        if dependency_ids:
+            command += self.arguments(config.param(job_name_prefix, 'cluster_dependency_arg') + ":".join(dependency_ids))
+
+        job_script = """\
+#!/bin/bash
+JOB_NAME={job.name}
+JOB_DONE={job.done}
+{job_start}rm -f $JOB_DONE && \\
+{job.command_with_modules}
+MUGQIC_STATE=$PIPESTATUS
+echo MUGQICexitStatus:$MUGQIC_STATE
+if [ $MUGQIC_STATE -eq 0 ] ; then {job_done}{job_state} ; fi
+exit $MUGQIC_STATE
+""".format(
+            job=job,
+            job_done=job_fingerprints.done_command(job) if job_fingerprints.enabled else "touch $JOB_DONE",
+            job_start=job_state_ledger.start_command(job) + "\n" if job_state_ledger.records(job) else "",
+            job_state=" ; " + job_state_ledger.append_command(job) if job_state_ledger.records(job) else ""
+        )
+
+        produces_job_id = config.param(job_name_prefix, 'cluster_cmd_produces_job_id', type='boolean')
+        for attempt in range(self._retries + 1):
+            # A failed submission may have queued the job anyway
+            if attempt > 0 and self._queue_cmd:
+                queued_job_id = self.queued_job_id(job, self._queue_cmd)
+                if queued_job_id:
+                    log.warning("Job " + job.name + " found in cluster queue after failed submission: " + queued_job_id)
+                    job_id_lines = [queued_job_id]
+                    break
+            self.wait_rate_limit()
+            try:
+                process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                stdout, stderr = process.communicate(job_script)
+                job_id_lines = [line.strip() for line in stdout.splitlines() if re.search("[0-9]", line)]
+                if process.returncode == 0 and (job_id_lines or not produces_job_id):
+                    break
+                error = "exit status " + str(process.returncode) + ": " + (stderr.strip() or stdout.strip())
+            except OSError as e:
+                error = str(e)
+
+            if attempt < self._retries:
+                delay = self._retry_delay * 2 ** attempt
+                log.warning("Submission of job " + job.name + " failed (" + error + "), retry in " + str(delay) + "s...")
+                time.sleep(delay)
+        else:
+            raise Exception("Error: submission of job " + job.name + " failed after " + str(self._retries + 1) + " attempts (" + error + ")!")
+
+        job_id = job_id_lines[-1] if produces_job_id else job.name
+        with self._lock:
+            self._job_ids[job] = job_id
+            with open(self._job_list, 'a') as job_list:
+                job_list.write("\t".join([job_id, job.name, ":".join(dependency_ids), job_output_relative_path]) + "\n")
+        log.debug("Job " + job.name + " submitted: " + job_id)
 
 class BatchScheduler(Scheduler):
     def submit(self, pipeline):
         self.print_header(pipeline)
+        max_concurrent_jobs = config.param('DEFAULT', 'batch_max_concurrent_jobs', required=False, type='posint')
+        if max_concurrent_jobs and max_concurrent_jobs > 1:
+            self.print_concurrent_jobs(pipeline, max_concurrent_jobs)
+            return
+
         if pipeline.jobs:
             print("SEPARATOR_LINE=`seq -s - 80 | sed 's/[0-9]//g'`")
         for step in pipeline.step_range:
@@ -183,49 +579,570 @@ class BatchScheduler(Scheduler):
 JOB_NAME={job.name}
 JOB_DONE={job.done}
 printf "\\n$SEPARATOR_LINE\\n"
-echo "Begin MUGQIC Job $JOB_NAME at `date +%FT%H:%M:%S`" && \\
+{job_start}echo "Begin MUGQIC Job $JOB_NAME at `date +%FT%H:%M:%S`" && \\
 rm -f $JOB_DONE && \\
-{job.command_with_modules}
+{command}
 MUGQIC_STATE=$PIPESTATUS
 echo "End MUGQIC Job $JOB_NAME at `date +%FT%H:%M:%S`"
 echo MUGQICexitStatus:$MUGQIC_STATE
-if [ $MUGQIC_STATE -eq 0 ] ; then touch $JOB_DONE ; else exit $MUGQIC_STATE ; fi
+if [ $MUGQIC_STATE -eq 0 ] ; then {job_done}{job_state} ; else exit $MUGQIC_STATE ; fi
 """.format(
                             job=job,
-                            separator_line=separator_line
+                            command=job_telemetry.command(job.command_with_modules, job_telemetry.file()) if job_telemetry.enabled else job.command_with_modules,
+                            job_done=job_fingerprints.done_command(job) if job_fingerprints.enabled else "touch $JOB_DONE",
+                            separator_line=separator_line,
+                            job_start=job_state_ledger.start_command(job) + "\n" if job_state_ledger.records(job) else "",
+                            job_state=" ; " + job_state_ledger.append_command(job) if job_state_ledger.records(job) else ""
                         )
                     )
 
+    # Run the jobs of each wave concurrently as background subshells, at most 'batch_max_concurrent_jobs' at a time.
+    # Each job output is written to its own file in $JOB_OUTPUT_DIR/<step>/.
+    # After a job failure, no new job is launched, running jobs are waited for, then the script exits.
+    def print_concurrent_jobs(self, pipeline, max_concurrent_jobs):
+        if not pipeline.jobs:
+            return
+
+        print("""\
+MUGQIC_PIDS=""
+MUGQIC_FAILED=0
+
+# Wait for all background jobs, then exit if any job failed
+mugqic_wait_all_jobs() {
+  for MUGQIC_PID in $MUGQIC_PIDS ; do
+    wait $MUGQIC_PID || MUGQIC_FAILED=$((MUGQIC_FAILED + 1))
+  done
+  MUGQIC_PIDS=""
+  if [ $MUGQIC_FAILED -gt 0 ] ; then
+    echo "$MUGQIC_FAILED MUGQIC Job(s) failed, see $JOB_OUTPUT_DIR/*/*_$TIMESTAMP.o"
+    exit 1
+  fi
+}
+
+# Wait until fewer than $1 background jobs are running (bash < 4.3 has no 'wait -n')
+mugqic_wait_jobs() {
+  while true ; do
+    MUGQIC_RUNNING_PIDS=""
+    MUGQIC_RUNNING=0
+    for MUGQIC_PID in $MUGQIC_PIDS ; do
+      if kill -0 $MUGQIC_PID 2> /dev/null ; then
+        MUGQIC_RUNNING_PIDS="$MUGQIC_RUNNING_PIDS $MUGQIC_PID"
+        MUGQIC_RUNNING=$((MUGQIC_RUNNING + 1))
+      else
+        wait $MUGQIC_PID || MUGQIC_FAILED=$((MUGQIC_FAILED + 1))
+      fi
+    done
+    MUGQIC_PIDS=$MUGQIC_RUNNING_PIDS
+    # Do not launch any new job after a job failure
+    if [ $MUGQIC_FAILED -gt 0 ] ; then
+      mugqic_wait_all_jobs
+    elif [ $MUGQIC_RUNNING -lt $1 ] ; then
+      break
+    fi
+    sleep 1
+  done
+}""")
+
+        for wave_number, wave in enumerate(self.job_waves(pipeline)):
+            print("""
+{separator_line}
+# WAVE {wave_number}: {nb_jobs} job{plural}
+{separator_line}""".format(separator_line=separator_line, wave_number=wave_number + 1, nb_jobs=len(wave), plural="s" if len(wave) > 1 else ""))
+
+            for step, job in wave:
+                print("""
+# JOB: {step.name} {job.name}
+JOB_NAME={job.name}
+JOB_DONE={job.done}
+mugqic_wait_jobs {max_concurrent_jobs}
+mkdir -p $JOB_OUTPUT_DIR/{step.name}
+echo "Launch MUGQIC Job $JOB_NAME at `date +%FT%H:%M:%S`"
+(
+{job_start}echo "Begin MUGQIC Job $JOB_NAME at `date +%FT%H:%M:%S`" && \\
+rm -f $JOB_DONE && \\
+{command}
+MUGQIC_STATE=$PIPESTATUS
+echo "End MUGQIC Job $JOB_NAME at `date +%FT%H:%M:%S`"
+echo MUGQICexitStatus:$MUGQIC_STATE
+if [ $MUGQIC_STATE -eq 0 ] ; then {job_done}{job_state} ; else exit $MUGQIC_STATE ; fi
+) > $JOB_OUTPUT_DIR/{step.name}/${{JOB_NAME}}_$TIMESTAMP.o 2>&1 &
+MUGQIC_PIDS="$MUGQIC_PIDS $!\"""".format(
+                        step=step,
+                        job=job,
+                        command=job_telemetry.command(job.command_with_modules, job_telemetry.file(step.name)) if job_telemetry.enabled else job.command_with_modules,
+                        max_concurrent_jobs=max_concurrent_jobs,
+                        job_done=job_fingerprints.done_command(job) if job_fingerprints.enabled else "touch $JOB_DONE",
+                        job_start=job_state_ledger.start_command(job) + "\n" if job_state_ledger.records(job) else "",
+                        job_state=" ; " + job_state_ledger.append_command(job) if job_state_ledger.records(job) else ""
+                    )
+                )
+
+            print("""
+# Wait for all jobs of wave {wave_number}
+mugqic_wait_all_jobs""".format(wave_number=wave_number + 1))
+
+# Jobs of a step submitted as one SLURM job array, task i running jobs[i].
+# Each task depends on the shared dependency jobs and on the task with the same index of each corresponding array.
+class JobArray(object):
+
+    def __init__(self, id, name, jobs, dependency_jobs, corresponding_arrays):
+        self.id = id
+        self.name = name
+        self.jobs = jobs
+        self.dependency_jobs = dependency_jobs
+        self.corresponding_arrays = corresponding_arrays
+
+# SLURM job scheduler, submitting similar jobs of each step as job arrays instead of one sbatch call per job.
+# Cluster settings are the same as for PBS, with sbatch options e.g. in a site config file:
+#   cluster_submit_cmd=sbatch
+#   cluster_other_arg=--mail-type=FAIL --mail-user=$JOB_MAIL -A $RAP_ID
+#   cluster_work_dir_arg=-D
+#   cluster_output_dir_arg=-o
+#   cluster_job_name_arg=-J
+#   cluster_walltime=--time=24:00:00
+#   cluster_queue=-p main
+#   cluster_cpu=-N 1 --cpus-per-task=4 --mem=16G
+# Job IDs are read from 'sbatch --parsable' output, and dependencies are written with '--dependency'.
+# Jobs of a step with the same name prefix (hence the same cluster settings), the same modules and the same wave
+# (so that they do not depend on each other) are candidates for an array of at most 'slurm_max_array_size' tasks (default: 1000).
+# All tasks of an array must share their dependencies ('afterok'), except dependencies on the task with the same index
+# of another array of the same size ('aftercorr'), e.g. per-readset jobs depending on per-readset jobs of a previous step.
+# Otherwise, candidate jobs are split into arrays of jobs sharing the same dependencies.
+# Each job command is written in its own task script $JOB_OUTPUT_DIR/<step>/<job array>_$TIMESTAMP.<task>.sh
+# and dependent jobs refer to individual array tasks, or to a whole array if they depend on all its tasks.
+class SlurmScheduler(Scheduler):
+    def submit(self, pipeline):
+        self.print_header(pipeline)
+        max_array_size = config.param('DEFAULT', 'slurm_max_array_size', required=False, type='posint') or 1000
+        job_wave_numbers = self.job_wave_numbers(pipeline)
+
+        # Submitted array and task index of each job
+        job_tasks = {}
+        nb_arrays = 0
+        nb_submissions = 0
+        for step in pipeline.step_range:
+            if step.jobs:
+                self.print_step(step)
+
+                # Candidate arrays in wave order, so that arrays are submitted after the arrays they depend on
+                candidate_arrays = collections.OrderedDict()
+                for job in step.jobs:
+                    candidate_arrays.setdefault((job_wave_numbers[job], job.name.split(".")[0], tuple(job.modules)), []).append(job)
+
+                for key in sorted(candidate_arrays, key=lambda key: key[0]):
+                    jobs = candidate_arrays[key]
+                    for chunk in [jobs[i:i + max_array_size] for i in range(0, len(jobs), max_array_size)]:
+                        for array_jobs, dependency_jobs, corresponding_arrays in self.split_job_array(chunk, job_tasks):
+                            if len(array_jobs) > 1:
+                                nb_arrays += 1
+                                array = JobArray(step.name + "_ARRAY_" + str(nb_arrays) + "_JOB_ID", key[1] + ".array" + str(nb_arrays), array_jobs, dependency_jobs, corresponding_arrays)
+                            else:
+                                # A single job is submitted as a regular job
+                                array = JobArray(array_jobs[0].id, array_jobs[0].name, array_jobs, dependency_jobs, corresponding_arrays)
+                            for index, job in enumerate(array.jobs):
+                                job_tasks[job] = (array, index)
+                            self.print_array(array, job_tasks)
+                            nb_submissions += 1
+
+        if pipeline.jobs:
+            log.info(str(len(pipeline.jobs)) + " jobs submitted with " + str(nb_submissions) + " sbatch calls")
+
+        # Check cluster maximum job submission, array tasks being counted as jobs by SLURM
+        cluster_max_jobs = config.param('DEFAULT', 'cluster_max_jobs', type='posint', required=False)
+        if cluster_max_jobs and len(pipeline.jobs) > cluster_max_jobs:
+            log.warning("Number of jobs: " + str(len(pipeline.jobs)) + " > Cluster maximum number of jobs: " + str(cluster_max_jobs) + "!")
+
+    # Split candidate array jobs into a list of (jobs, shared dependency jobs, corresponding arrays)
+    def split_job_array(self, jobs, job_tasks):
+        dependency_tasks = [set([job_tasks[dependency_job] for dependency_job in job.dependency_jobs]) for job in jobs]
+        shared_dependency_tasks = set.intersection(*dependency_tasks)
+
+        # Other dependencies must be the task with the same index of the same arrays for all jobs
+        corresponding_arrays = None
+        for index, tasks in enumerate(dependency_tasks):
+            other_tasks = tasks - shared_dependency_tasks
+            arrays = set([array for array, task_index in other_tasks])
+            if [task_index for array, task_index in other_tasks if task_index != index] or \
+                [array for array in arrays if len(array.jobs) != len(jobs)] or \
+                (corresponding_arrays is not None and arrays != corresponding_arrays):
+                break
+            corresponding_arrays = arrays
+        else:
+            shared_dependency_jobs = [dependency_job for dependency_job in jobs[0].dependency_jobs if job_tasks[dependency_job] in shared_dependency_tasks]
+            return [(jobs, shared_dependency_jobs, sorted(corresponding_arrays, key=lambda array: array.id))]
+
+        # Group jobs with the same dependencies, in creation order
+        job_groups = collections.OrderedDict()
+        for job, tasks in zip(jobs, dependency_tasks):
+            job_groups.setdefault(frozenset(tasks), []).append(job)
+        return [(group_jobs, group_jobs[0].dependency_jobs, []) for group_jobs in job_groups.values()]
+
+    # Return the list of dependency job IDs of an array: whole array IDs if all their tasks are dependencies
+    def dependency_ids(self, dependency_jobs, job_tasks):
+        dependency_ids = []
+        dependency_arrays = collections.Counter([job_tasks[dependency_job][0] for dependency_job in dependency_jobs])
+        for dependency_job in dependency_jobs:
+            array = job_tasks[dependency_job][0]
+            if len(array.jobs) > 1 and dependency_arrays[array] == len(array.jobs):
+                if array.id not in dependency_ids:
+                    dependency_ids.append(array.id)
+            else:
+                dependency_ids.append(dependency_job.id)
+        return dependency_ids
+
+    def print_array(self, array, job_tasks):
+        # Chunk JOB_DEPENDENCIES on multiple lines to avoid lines too long
+        max_dependencies_per_line = 50
+        dependency_ids = self.dependency_ids(array.dependency_jobs, job_tasks)
+        dependency_lines = []
+        for dependency_type, ids in [("afterok", dependency_ids), ("aftercorr", [corresponding_array.id for corresponding_array in array.corresponding_arrays])]:
+            for i in range(0, len(ids), max_dependencies_per_line):
+                if i > 0:
+                    separator = "$JOB_DEPENDENCIES:"
+                elif dependency_lines:
+                    separator = "$JOB_DEPENDENCIES," + dependency_type + ":"
+                else:
+                    separator = dependency_type + ":"
+                dependency_lines.append("JOB_DEPENDENCIES=" + separator + ":".join(["$" + id for id in ids[i:i + max_dependencies_per_line]]))
+        job_dependencies = "\n".join(dependency_lines) if dependency_lines else "JOB_DEPENDENCIES="
+
+        is_array = len(array.jobs) > 1
+        print("""
+{separator_line}
+# JOB{array_label}: {array.id}: {array.name}
+{separator_line}
+JOB_NAME={array.name}
+{job_dependencies}
+JOB_SCRIPT_PREFIX=$JOB_OUTPUT_DIR/$STEP/${{JOB_NAME}}_$TIMESTAMP""".format(
+                separator_line=separator_line,
+                array_label=" ARRAY (" + str(len(array.jobs)) + " tasks)" if is_array else "",
+                array=array,
+                job_dependencies=job_dependencies
+            )
+        )
+
+        for index, job in enumerate(array.jobs):
+            print("""\
+cat > $JOB_SCRIPT_PREFIX{task}.sh << '{limit_string}'
+#!/bin/bash
+JOB_NAME={job.name}
+JOB_DONE={job.done}
+{job_start}rm -f $JOB_DONE && \\
+{job.command_with_modules}
+MUGQIC_STATE=$PIPESTATUS
+echo MUGQICexitStatus:$MUGQIC_STATE
+if [ $MUGQIC_STATE -eq 0 ] ; then {job_done}{job_state} ; fi
+exit $MUGQIC_STATE
+{limit_string}""".format(
+                    task="." + str(index) if is_array else "",
+                    job=job,
+                    limit_string=os.path.basename(job.done),
+                    job_done=job_fingerprints.done_command(job) if job_fingerprints.enabled else "touch $JOB_DONE",
+                    job_start=job_state_ledger.start_command(job) + "\n" if job_state_ledger.records(job) else "",
+                    job_state=" ; " + job_state_ledger.append_command(job) if job_state_ledger.records(job) else ""
+                )
+            )
+
+        # Cluster settings section must match job name prefix before first "."
+        job_name_prefix = array.jobs[0].name.split(".")[0]
+        cmd = array.id + "=$(" + \
+            config.param(job_name_prefix, 'cluster_submit_cmd') + " --parsable " + \
+            config.param(job_name_prefix, 'cluster_other_arg') + " " + \
+            config.param(job_name_prefix, 'cluster_work_dir_arg') + " $OUTPUT_DIR " + \
+            config.param(job_name_prefix, 'cluster_output_dir_arg') + " $JOB_SCRIPT_PREFIX" + (".%a" if is_array else "") + ".o " + \
+            config.param(job_name_prefix, 'cluster_job_name_arg') + " $JOB_NAME " + \
+            config.param(job_name_prefix, 'cluster_walltime') + " " + \
+            config.param(job_name_prefix, 'cluster_queue') + " " + \
+            config.param(job_name_prefix, 'cluster_cpu')
+        # SLURM nice value lowers job priority: an array gets the priority of its most critical task
+        priorities = [job.priority for job in array.jobs if job.priority is not None]
+        if priorities:
+            cmd += " --nice=" + str(1023 - max(priorities))
+        if dependency_lines:
+            cmd += " --dependency=$JOB_DEPENDENCIES"
+        if is_array:
+            cmd += " --array=0-" + str(len(array.jobs) - 1) + " --wrap=\"bash $JOB_SCRIPT_PREFIX.\\$SLURM_ARRAY_TASK_ID.sh\""
+        else:
+            cmd += " $JOB_SCRIPT_PREFIX.sh"
+        # Remove cluster name from "<job ID>;<cluster name>"
+        cmd += " | cut -d \";\" -f 1)"
+
+        # Array task IDs, used as dependencies, and job parameters in job list file
+        for index, job in enumerate(array.jobs):
+            if is_array:
+                cmd += "\n" + job.id + "=${" + array.id + "}_" + str(index)
+            cmd += "\necho \"$" + job.id + "\t" + job.name + "\t$JOB_DEPENDENCIES\t$STEP/${JOB_NAME}_$TIMESTAMP" + ("." + str(index) if is_array else "") + ".o\" >> $JOB_LIST"
+
+        print cmd
+
+# Return the number of bytes of a memory size e.g. "2700m", "4G" or "512kb"
+def parse_memory_size(size):
+    match = re.search(r"^(\d+(?:\.\d+)?)([kmgt]?)b?$", size.strip().lower())
+    if match:
+        return int(float(match.group(1)) * 1024 ** " kmgt".index(match.group(2) or " "))
+    else:
+        raise Exception("Error: memory size \"" + size + "\" is invalid!")
+
+# Return the number of CPUs and bytes of memory required by a job, from its cluster settings
+# e.g. "-l nodes=1:ppn=12 -l pmem=2700m" or "--mem-per-cpu=2700M" (memory per CPU), "-l mem=32g" or "--mem=32G" (total memory).
+# Jobs without declared memory require no memory slot.
+def job_resources(job):
+    job_name_prefix = job.name.split(".")[0]
+    cluster_settings = config.param(job_name_prefix, 'cluster_cpu', required=False) + " " + config.param(job_name_prefix, 'cluster_other_arg', required=False)
+
+    cpu_match = re.search(r"(?:ppn=|--cpus-per-task[= ])(\d+)", cluster_settings)
+    cpus = int(cpu_match.group(1)) if cpu_match else 1
+
+    memory = 0
+    memory_per_cpu_match = re.search(r"(?:pmem=|--mem-per-cpu[= ])([\d.]+[kKmMgGtT]?[bB]?)", cluster_settings)
+    memory_match = re.search(r"(?:\bmem=|--mem[= ])([\d.]+[kKmMgGtT]?[bB]?)", cluster_settings)
+    if memory_per_cpu_match:
+        memory = parse_memory_size(memory_per_cpu_match.group(1)) * cpus
+    elif memory_match:
+        memory = parse_memory_size(memory_match.group(1))
+
+    return cpus, memory
+
+# Return the number of seconds of a job walltime from its cluster settings, or None if no walltime is declared,
+# e.g. "-l walltime=24:00:0" (PBS [[hours:]minutes:]seconds)
+# or "--time=1-12:00:00" (SLURM minutes[:seconds], hours:minutes:seconds or days-hours[:minutes[:seconds]])
+def job_walltime(job):
+    cluster_walltime = config.param(job.name.split(".")[0], 'cluster_walltime', required=False)
+
+    pbs_match = re.search(r"walltime=(\d+(?::\d+)*)", cluster_walltime)
+    if pbs_match:
+        return reduce(lambda seconds, field: seconds * 60 + int(field), pbs_match.group(1).split(":"), 0)
+
+    slurm_match = re.search(r"(?:^|\s)(?:--time[= ]|-t ?)(?:(\d+)-)?(\d+(?::\d+){0,2})(?:\s|$)", cluster_walltime)
+    if slurm_match:
+        days = int(slurm_match.group(1) or 0)
+        fields = [int(field) for field in slurm_match.group(2).split(":")]
+        if days or len(fields) == 3:
+            hours, minutes, seconds = (fields + [0, 0])[:3]
+        else:
+            hours = 0
+            minutes, seconds = (fields + [0])[:2]
+        return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+    return None
+
+# Execute jobs directly on the local machine, running independent jobs in parallel.
+# Each job uses as many CPU and memory slots as declared in its cluster settings,
+# within 'local_max_cpus' (default: all CPUs) and 'local_max_memory' (default: all physical memory) limits.
+# Jobs are started by decreasing priority, then in creation order, as soon as their dependencies succeeded and enough slots are free.
+# If a job fails, no new job is started, running jobs are waited for, then the pipeline stops with an error.
+class LocalScheduler(Scheduler):
+    def submit(self, pipeline):
+        jobs = pipeline.jobs
+        if not jobs:
+            log.info("No job to run")
+            return
+
+        max_cpus = config.param('DEFAULT', 'local_max_cpus', required=False, type='posint') or multiprocessing.cpu_count()
+        max_memory = config.param('DEFAULT', 'local_max_memory', required=False)
+        max_memory = parse_memory_size(max_memory) if max_memory else os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        log.info("Run " + str(len(jobs)) + " jobs locally with " + str(max_cpus) + " CPUs and " + str(max_memory / 1024 ** 2) + " MB of memory...")
+
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H.%M.%S")
+        # Ready jobs are started by decreasing priority, then in creation order
+        positions = dict([(job, (-(job.priority or 0), position)) for position, job in enumerate(jobs)])
+        steps = dict([(job, step) for step in pipeline.step_range for job in step.jobs])
+        remaining_dependencies = dict([(job, len(job.dependency_jobs)) for job in jobs])
+        dependent_jobs = dict([(job, []) for job in jobs])
+        for job in jobs:
+            for dependency_job in job.dependency_jobs:
+                dependent_jobs[dependency_job].append(job)
+
+        # Jobs ready to run, as sorted (position, job) pairs
+        ready_jobs = [(positions[job], job) for job in jobs if not job.dependency_jobs]
+        running_jobs = {}
+        failed_jobs = []
+        free_cpus = max_cpus
+        free_memory = max_memory
+        nb_succeeded_jobs = 0
+
+        try:
+            while ready_jobs or running_jobs:
+                # Start ready jobs fitting in free slots, unless a job failed
+                if not failed_jobs:
+                    for position, job in list(ready_jobs):
+                        cpus, memory = job_resources(job)
+                        # A job requiring more than the limits runs alone
+                        cpus = min(cpus, max_cpus)
+                        memory = min(memory, max_memory)
+                        if cpus <= free_cpus and memory <= free_memory:
+                            ready_jobs.remove((position, job))
+                            process = self.start_job(pipeline, steps[job], job, timestamp)
+                            running_jobs[process.pid] = (process, job, cpus, memory, datetime.datetime.now())
+                            free_cpus -= cpus
+                            free_memory -= memory
+
+                if not running_jobs:
+                    break
+
+                # Wait for any job to finish
+                pid, status = os.wait()
+                if pid not in running_jobs:
+                    continue
+                process, job, cpus, memory, start_time = running_jobs.pop(pid)
+                process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+                free_cpus += cpus
+                free_memory += memory
+
+                if process.returncode == 0:
+                    nb_succeeded_jobs += 1
+                    log.info("Job " + job.name + " succeeded in " + str(datetime.datetime.now() - start_time) + " (" + str(nb_succeeded_jobs) + "/" + str(len(jobs)) + ")")
+                    for dependent_job in dependent_jobs[job]:
+                        remaining_dependencies[dependent_job] -= 1
+                        if not remaining_dependencies[dependent_job]:
+                            bisect.insort(ready_jobs, (positions[dependent_job], dependent_job))
+                else:
+                    failed_jobs.append(job)
+                    log.error("Job " + job.name + " failed with exit status " + str(process.returncode) + ", see " + process.job_output)
+                    if running_jobs:
+                        log.error("Waiting for " + str(len(running_jobs)) + " running jobs to finish...")
+
+        except KeyboardInterrupt:
+            log.error("Interrupted: killing " + str(len(running_jobs)) + " running jobs...")
+            for process, job, cpus, memory, start_time in running_jobs.values():
+                try:
+                    os.killpg(process.pid, signal.SIGTERM)
+                except OSError as e:
+                    if e.errno != errno.ESRCH:
+                        raise
+            for process, job, cpus, memory, start_time in running_jobs.values():
+                process.wait()
+            raise
+
+        if failed_jobs:
+            raise Exception("Error: " + str(len(failed_jobs)) + " job(s) failed: " + ", ".join([job.name for job in failed_jobs]) + "; " + str(len(jobs) - nb_succeeded_jobs - len(failed_jobs)) + " job(s) not run!")
+        log.info("All " + str(len(jobs)) + " jobs succeeded")
+
+    # Start a job as a Bash script in its own process group, using the same .done file protocol as other schedulers
+    def start_job(self, pipeline, step, job, timestamp):
+        job_output_dir = os.path.join(pipeline.output_dir, "job_output", step.name)
+        if not os.path.isdir(job_output_dir):
+            os.makedirs(job_output_dir)
+        job_script = os.path.join(job_output_dir, job.name + "_" + timestamp + ".sh")
+        job_output = os.path.join(job_output_dir, job.name + "_" + timestamp + ".o")
+
+        with open(job_script, 'w') as script:
+            script.write("""\
+#!/bin/bash
+{job_start}rm -f $JOB_DONE && \\
+{job.command_with_modules}
+MUGQIC_STATE=$PIPESTATUS
+echo MUGQICexitStatus:$MUGQIC_STATE
+if [ $MUGQIC_STATE -eq 0 ] ; then {job_done}{job_state} ; fi
+exit $MUGQIC_STATE
+""".format(
+                job=job,
+                job_done=job_fingerprints.done_command(job) if job_fingerprints.enabled else "touch $JOB_DONE",
+                job_start=job_state_ledger.start_command(job) + "\n" if job_state_ledger.records(job) else "",
+                job_state=" ; " + job_state_ledger.append_command(job) if job_state_ledger.records(job) else ""
+            ))
+
+        environment = dict(os.environ)
+        environment.update({
+            'OUTPUT_DIR': pipeline.output_dir,
+            'JOB_OUTPUT_DIR': os.path.join(pipeline.output_dir, "job_output"),
+            'STEP': step.name,
+            'JOB_NAME': job.name,
+            'JOB_DONE': job.done
+        })
+
+        log.info("Start job " + job.name + "...")
+        with open(job_output, 'w') as output:
+            process = subprocess.Popen(["bash", job_script], cwd=pipeline.output_dir, env=environment, stdout=output, stderr=subprocess.STDOUT, preexec_fn=os.setsid)
+        process.job_output = job_output
+        return process
+
+# Job description for MUGQIC daemon, written incrementally so that large pipelines are not built in memory.
+# With 'daemon_format=json' (default), a single indented JSON document is written:
+#   {"pipeline": {"output_dir": ..., "steps": [{"name": ..., "jobs": [{"job_name": ..., ...}, ...]}, ...]}}
+# With 'daemon_format=jsonl', one compact JSON record is written per line, which can be read incrementally:
+#   {"pipeline":{"output_dir":...}}
+#   {"step":{"name":...}}
+#   {"job":{"job_name":...,...}} for each job of the previous step
 class DaemonScheduler(Scheduler):
+    def __init__(self):
+        Scheduler.__init__(self)
+        # Cluster options by job name prefix
+        self._cluster_options = {}
+
     def submit(self, pipeline):
-        print self.json(pipeline)
+        daemon_format = config.param('DEFAULT', 'daemon_format', required=False)
+        if daemon_format == "jsonl":
+            self.write_jsonl(pipeline, sys.stdout)
+        elif not daemon_format or daemon_format == "json":
+            self.write_json(pipeline, sys.stdout)
+        else:
+            raise Exception("Error: daemon_format \"" + daemon_format + "\" is invalid (should be \"json\" or \"jsonl\")!")
 
+    # Return the whole JSON document as a string
     def json(self, pipeline):
-        return json.dumps(
-            {'pipeline': {
-                'output_dir': pipeline.output_dir,
-                'steps': [{
-                    'name': step.name,
-                    'jobs': [{
-                        "job_name": job.name,
-                        "job_id": job.id,
-                        "job_command": job.command_with_modules,
-                        "job_input_files": job.input_files,
-                        "job_output_files": job.output_files,
-                        "job_dependencies": [dependency_job.id for dependency_job in job.dependency_jobs],
-                        "job_cluster_options": {
-                            # Cluster settings section must match job name prefix before first "."
-                            # e.g. "[trimmomatic] cluster_cpu=..." for job name "trimmomatic.readset1"
-                            'cluster_submit_cmd': config.param(job.name.split(".")[0], 'cluster_submit_cmd'),
-                            'cluster_other_arg': config.param(job.name.split(".")[0], 'cluster_other_arg'),
-                            'cluster_work_dir_arg': config.param(job.name.split(".")[0], 'cluster_work_dir_arg') + " " + pipeline.output_dir,
-                            'cluster_output_dir_arg': config.param(job.name.split(".")[0], 'cluster_output_dir_arg') + " " + os.path.join(pipeline.output_dir, "job_output", step.name, job.name + ".o"),
-                            'cluster_job_name_arg': config.param(job.name.split(".")[0], 'cluster_job_name_arg') + " " + job.name,
-                            'cluster_walltime': config.param(job.name.split(".")[0], 'cluster_walltime'),
-                            'cluster_queue': config.param(job.name.split(".")[0], 'cluster_queue'),
-                            'cluster_cpu': config.param(job.name.split(".")[0], 'cluster_cpu')
-                        },
-                        "job_done": job.done
-                    } for job in step.jobs]
-                } for step in pipeline.step_range]
-            }}, indent=4)
+        output = StringIO.StringIO()
+        self.write_json(pipeline, output)
+        return output.getvalue()
+
+    def write_json(self, pipeline, stream):
+        stream.write("{\n    \"pipeline\": {\n        \"output_dir\": " + json.dumps(pipeline.output_dir) + ",\n        \"steps\": [")
+        for step_number, step in enumerate(pipeline.step_range):
+            stream.write(("," if step_number else "") + "\n            {\n                \"name\": " + json.dumps(step.name) + ",\n                \"jobs\": [")
+            for job_number, job_json in enumerate(self.step_job_jsons(pipeline, step)):
+                stream.write(("," if job_number else "") + "\n                    " + json.dumps(job_json, indent=4, separators=(",", ": ")).replace("\n", "\n                    "))
+            stream.write("\n                ]\n            }")
+        stream.write("\n        ]\n    }\n}\n")
+
+    def write_jsonl(self, pipeline, stream):
+        stream.write(json.dumps({'pipeline': {'output_dir': pipeline.output_dir}}, separators=(",", ":")) + "\n")
+        for step in pipeline.step_range:
+            stream.write(json.dumps({'step': {'name': step.name}}, separators=(",", ":")) + "\n")
+            for job_json in self.step_job_jsons(pipeline, step):
+                stream.write(json.dumps({'job': job_json}, separators=(",", ":")) + "\n")
+
+    # Generate the JSON objects of step jobs, preceded by their new barrier jobs
+    def step_job_jsons(self, pipeline, step):
+        for job in step.jobs:
+            dependency_jobs, barrier_jobs = self.submitted_dependency_jobs(job, step)
+            for barrier_job in barrier_jobs:
+                yield self.job_json(pipeline, step, barrier_job, barrier_job.dependency_jobs)
+            yield self.job_json(pipeline, step, job, dependency_jobs)
+
+    # Cluster settings section must match job name prefix before first "."
+    # e.g. "[trimmomatic] cluster_cpu=..." for job name "trimmomatic.readset1"
+    def cluster_options(self, job_name_prefix):
+        if job_name_prefix not in self._cluster_options:
+            self._cluster_options[job_name_prefix] = dict([(name, cluster_setting(job_name_prefix, name)) for name in [
+                'cluster_submit_cmd',
+                'cluster_other_arg',
+                'cluster_work_dir_arg',
+                'cluster_output_dir_arg',
+                'cluster_job_name_arg',
+                'cluster_walltime',
+                'cluster_queue',
+                'cluster_cpu'
+            ]])
+        return self._cluster_options[job_name_prefix]
+
+    def job_json(self, pipeline, step, job, dependency_jobs):
+        cluster_options = self.cluster_options(job.name.split(".", 1)[0])
+        return collections.OrderedDict([
+            ("job_name", job.name),
+            ("job_id", job.id),
+            ("job_command", job.command_with_modules),
+            ("job_input_files", job.input_files),
+            ("job_output_files", job.output_files),
+            ("job_dependencies", [dependency_job.id for dependency_job in dependency_jobs]),
+            ("job_cluster_options", {
+                'cluster_submit_cmd': cluster_options['cluster_submit_cmd'],
+                'cluster_other_arg': cluster_options['cluster_other_arg'],
+                'cluster_work_dir_arg': cluster_options['cluster_work_dir_arg'] + " " + pipeline.output_dir,
+                'cluster_output_dir_arg': cluster_options['cluster_output_dir_arg'] + " " + os.path.join(pipeline.output_dir, "job_output", step.name, job.name + ".o"),
+                'cluster_job_name_arg': cluster_options['cluster_job_name_arg'] + " " + job.name,
+                'cluster_walltime': cluster_options['cluster_walltime'],
+                'cluster_queue': cluster_options['cluster_queue'],
+                'cluster_cpu': cluster_options['cluster_cpu']
+            }),
+            ("job_done", job.done)
+        ])
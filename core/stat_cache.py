@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import errno
+import glob
+import logging
+import os
+import stat
+import threading
+from multiprocessing.pool import ThreadPool
+
+log = logging.getLogger(__name__)
+
+# File type bits of a stat result, or None for a missing file
+def file_type(path_stat):
+    return stat.S_IFMT(path_stat.st_mode) if path_stat else None
+
+# Cache of file system metadata shared by the whole pipeline, since files are not modified while jobs are created.
+# Each directory is listed once, so that missing files are detected without any stat call,
+# and each existing file is stat'ed once.
+class StatCache(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._directories = {}
+        self._lstats = {}
+        self._stats = {}
+        self._hits = 0
+        self._misses = 0
+        self._probes = None
+
+    # Number of metadata requests answered from the cache
+    @property
+    def hits(self):
+        return self._hits
+
+    # Number of metadata requests which required a file system call
+    @property
+    def misses(self):
+        return self._misses
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    # Return the set of directory entry names, or None if the directory can't be listed
+    def _listdir(self, directory):
+        if directory in self._directories:
+            self._count(True)
+        else:
+            self._count(False)
+            try:
+                self._directories[directory] = set(os.listdir(directory))
+            except OSError as e:
+                # A missing directory contains no entry, any other error (e.g. no read permission) requires a stat call
+                self._directories[directory] = set() if e.errno in [errno.ENOENT, errno.ENOTDIR] else None
+        return self._directories[directory]
+
+    # Return os.lstat() result of path, or None if path does not exist
+    def lstat(self, path):
+        lstat = self._lstat(path)
+        self._record("lstat", path, file_type(lstat))
+        return lstat
+
+    def _lstat(self, path):
+        if path in self._lstats:
+            self._count(True)
+            return self._lstats[path]
+
+        directory, name = os.path.split(path)
+        if name not in ["", ".", ".."]:
+            names = self._listdir(directory if directory else ".")
+            if names is not None and name not in names:
+                self._lstats[path] = None
+                return None
+
+        self._count(False)
+        try:
+            self._lstats[path] = os.lstat(path)
+        except OSError:
+            self._lstats[path] = None
+        return self._lstats[path]
+
+    # Return os.stat() result of path i.e. following symbolic links, or None if path does not exist
+    def stat(self, path):
+        path_stat = self._stat(path)
+        self._record("stat", path, file_type(path_stat))
+        return path_stat
+
+    def _stat(self, path):
+        lstat = self._lstat(path)
+        if lstat is None or not stat.S_ISLNK(lstat.st_mode):
+            return lstat
+
+        if path in self._stats:
+            self._count(True)
+        else:
+            self._count(False)
+            try:
+                self._stats[path] = os.stat(path)
+            except OSError:
+                self._stats[path] = None
+        return self._stats[path]
+
+    # Same as os.path.exists()
+    def exists(self, path):
+        return self.stat(path) is not None
+
+    # Same as os.path.isfile()
+    def isfile(self, path):
+        path_stat = self.stat(path)
+        return path_stat is not None and stat.S_ISREG(path_stat.st_mode)
+
+    # Same as os.path.isdir()
+    def isdir(self, path):
+        path_stat = self.stat(path)
+        return path_stat is not None and stat.S_ISDIR(path_stat.st_mode)
+
+    # Modification time of path itself i.e. not following symbolic links
+    def mtime(self, path):
+        return self.lstat(path).st_mtime
+
+    # Same as bool(glob.glob(prefix + "*"))
+    def has_prefix(self, prefix):
+        result = self._has_prefix(prefix)
+        self._record("prefix", prefix, result)
+        return result
+
+    def _has_prefix(self, prefix):
+        if glob.has_magic(prefix):
+            self._count(False)
+            return bool(glob.glob(prefix + "*"))
+
+        directory, name = os.path.split(prefix)
+        names = self._listdir(directory if directory else ".")
+        if not names:
+            return False
+        # Like glob, hidden files only match a prefix starting with "."
+        return any([entry.startswith(name) for entry in names if name.startswith(".") or not entry.startswith(".")])
+
+    # Same as glob.glob(pattern), not cached but recorded
+    def glob(self, pattern):
+        self._count(False)
+        result = glob.glob(pattern)
+        self._record("glob", pattern, sorted(result))
+        return result
+
+    # Record file system probe results from now on, e.g. while jobs are created
+    def start_recording(self):
+        self._probes = {}
+
+    @property
+    def recording(self):
+        return self._probes is not None
+
+    # Add probe results recorded elsewhere, e.g. by a planning worker process
+    def add_probes(self, probes):
+        if self._probes is not None:
+            with self._lock:
+                self._probes.update(probes)
+
+    # Stop recording and return the dict of recorded probe results by (probe type, path)
+    def stop_recording(self):
+        probes = self._probes
+        self._probes = None
+        return probes
+
+    def _record(self, probe_type, path, result):
+        if self._probes is not None:
+            with self._lock:
+                self._probes[(probe_type, path)] = result
+
+    # Check that recorded file system probes still give the same results
+    def probes_unchanged(self, probes):
+        probe_methods = {"lstat": lambda path: file_type(self._lstat(path)), "stat": lambda path: file_type(self._stat(path)), "prefix": self._has_prefix, "glob": lambda pattern: sorted(glob.glob(pattern))}
+        for (probe_type, path), result in probes.items():
+            if probe_methods[probe_type](path) != result:
+                log.info("File system probe " + probe_type + " " + path + " changed")
+                return False
+        return True
+
+    # Fill the cache for a list of paths using a pool of threads:
+    # first list all their directories, then stat existing paths
+    def prefetch(self, paths, threads):
+        paths = [path for path in set(paths) if path not in self._lstats]
+        if paths:
+            pool = ThreadPool(threads)
+            try:
+                pool.map(self._listdir, set([os.path.dirname(path) or "." for path in paths]))
+                pool.map(self._stat, paths)
+            finally:
+                pool.close()
+                pool.join()
+
+# Global stat cache object used throughout the whole pipeline
+stat_cache = StatCache()
@@ -22,7 +22,10 @@
 # Python Standard Modules
 import re
 
-class Step:
+class Step(object):
+
+    __slots__ = ['_name', '_create_jobs', '_jobs']
+
     def __init__(self, create_jobs):
         # Step name is used in Bash $JOB_ID variable, hence only alphanumeric and "_" characters are allowed
         step_name = create_jobs.__name__
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import os
+import pipes
+
+# Telemetry helper script run by jobs, from the pipeline source directory
+JOB_TELEMETRY_HELPER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils", "job_telemetry.py")
+
+# Per-job runtime telemetry: job commands are run by utils/job_telemetry.py, which writes start and end times, host,
+# CPU time, largest single process memory and I/O bytes of the job in a JSON file next to the job output file:
+#   $JOB_OUTPUT_DIR/<step>/<job name>_$TIMESTAMP.telemetry.json
+# Files of a pipeline run are summarized per step by: python utils/job_telemetry.py summary $JOB_OUTPUT_DIR
+class JobTelemetry(object):
+
+    def __init__(self):
+        self._enabled = False
+        self._python = "python"
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        self._enabled = value
+
+    # Python interpreter running the telemetry helper on compute nodes, before job modules are loaded
+    @property
+    def python(self):
+        return self._python
+
+    @python.setter
+    def python(self, value):
+        self._python = value
+
+    # Telemetry file of a job, as a Bash expression of job script variables
+    def file(self, step_name="$STEP"):
+        return "$JOB_OUTPUT_DIR/" + step_name + "/${JOB_NAME}_$TIMESTAMP.telemetry.json"
+
+    # Bash command prefix running a quoted job command through the telemetry helper
+    def prefix(self, telemetry_file):
+        return self.python + " " + pipes.quote(JOB_TELEMETRY_HELPER) + " run " + telemetry_file + " "
+
+    # Bash command running a job command through the telemetry helper
+    def command(self, command, telemetry_file):
+        return self.prefix(telemetry_file) + pipes.quote(command)
+
+# Global job telemetry object used throughout the whole pipeline
+job_telemetry = JobTelemetry()
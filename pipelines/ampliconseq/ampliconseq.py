@@ -38,11 +38,13 @@ from bfx.readset import *
 from bfx.sequence_dictionary import *
 
 from pipelines import common
-from bfx import tools
-from bfx import flash
-from bfx import qiime
-from bfx import vsearch
-from bfx import krona
+# bfx wrappers, imported when first used by a step
+from bfx import lazy_import
+tools = lazy_import("tools")
+flash = lazy_import("flash")
+qiime = lazy_import("qiime")
+vsearch = lazy_import("vsearch")
+krona = lazy_import("krona")
 
 log = logging.getLogger(__name__)
 
@@ -99,7 +101,7 @@ class AmpliconSeq(common.Illumina):
         """
 
         readset_merge_flash_stats = os.path.join("metrics", "mergeReadsetTable.tsv")
-        job = concat_jobs([
+        job_builder = ConcatJobBuilder([
             Job(command="mkdir -p metrics"),
             Job(command="echo 'Sample\tReadset\tTrim Paired Reads #\tMerged Paired Reads #\tMerged Paired Reads %' > " + readset_merge_flash_stats)
         ])
@@ -107,8 +109,7 @@ class AmpliconSeq(common.Illumina):
         for readset in self.readsets:
             flash_log = os.path.join("merge", readset.sample.name, readset.name + ".log")
 
-            job = concat_jobs([
-                job,
+            job_builder.add(
                 Job(command="""\
 printf '{sample}\t{readset}\t' \\
   >> {stats}""".format(
@@ -116,7 +117,7 @@ printf '{sample}\t{readset}\t' \\
                     readset=readset.name,
                     stats=readset_merge_flash_stats
                 ))
-            ])
+            )
 
             # Retrieve merge statistics using re search in python.
             python_command = """\
@@ -136,8 +137,7 @@ print "\t".join(merge_stat)'""".format(
                 flash_log=flash_log
             )
 
-            job = concat_jobs([
-                job,
+            job_builder.add(
                 Job(
                     [flash_log],
                     [readset_merge_flash_stats],
@@ -149,12 +149,12 @@ print "\t".join(merge_stat)'""".format(
                         readset_merge_flash_stats=readset_merge_flash_stats
                     )
                 )
-            ])
+            )
 
         sample_merge_flash_stats = os.path.join("metrics", "mergeSampleTable.tsv")
         report_file = os.path.join("report", "Illumina.flash_stats.md")
         return [concat_jobs([
-            job,
+            job_builder.build(),
             Job(
                 [readset_merge_flash_stats],
                 [sample_merge_flash_stats],
@@ -294,7 +294,7 @@ pandoc --to=markdown \\
         """
 
         readset_merge_uchime_stats = os.path.join("metrics", "uchimeReadsetTable.tsv")
-        job = concat_jobs([
+        job_builder = ConcatJobBuilder([
             Job(command="mkdir -p metrics"),
             Job(command="echo 'Sample\tReadset\tMerged Paired Reads #\tFiltered Paired Reads #\tFiltered Paired Reads %' > " + readset_merge_uchime_stats)
         ])
@@ -313,8 +313,7 @@ pandoc --to=markdown \\
         for readset in self.readsets:
             flash_log = os.path.join("merge", readset.sample.name, readset.name + ".log")
 
-            job = concat_jobs([
-                job,
+            job_builder.add(
                 Job(command="""\
 printf '{sample}\t{readset}\t' \\
   >> {stats}""".format(
@@ -322,10 +321,9 @@ printf '{sample}\t{readset}\t' \\
                     readset=readset.name,
                     stats=readset_merge_uchime_stats
                 ))
-            ])
+            )
 
-            job = concat_jobs([
-                job,
+            job_builder.add(
                 tools.py_ampliconSeq(
                     [filter_log, flash_log],
                     [readset_merge_uchime_stats],
@@ -342,13 +340,13 @@ printf '{sample}\t{readset}\t' \\
                     )
                 )
 
-            ])
+            )
 
         sample_merge_uchime_stats = os.path.join("metrics", "uchimeSampleTable.tsv")
         report_file = os.path.join("report", "AmpliconSeq.uchime.md")
 
         return [concat_jobs([
-            job,
+            job_builder.build(),
             Job(
                 [],
                 [sample_merge_uchime_stats],
@@ -35,9 +35,11 @@ from core.job import *
 from core.pipeline import *
 from bfx.design import *
 
-from bfx import gq_seq_utils
-from bfx import picard
-from bfx import samtools
+# bfx wrappers, imported when first used by a step
+from bfx import lazy_import
+gq_seq_utils = lazy_import("gq_seq_utils")
+picard = lazy_import("picard")
+samtools = lazy_import("samtools")
 from pipelines.dnaseq import dnaseq
 
 log = logging.getLogger(__name__)
@@ -36,9 +36,11 @@ from core.pipeline import *
 from bfx.design import *
 from bfx.readset import *
 
-from bfx import metrics
-from bfx import picard
-from bfx import trimmomatic
+# bfx wrappers, imported when first used by a step
+from bfx import lazy_import
+metrics = lazy_import("metrics")
+picard = lazy_import("picard")
+trimmomatic = lazy_import("trimmomatic")
 
 log = logging.getLogger(__name__)
 
@@ -82,7 +84,7 @@ wget "{server}?{request}" --quiet --output-document=/dev/null
 
 
     def submit_jobs(self):
-        super(MUGQICPipeline, self).scheduler.submit(self)
+        super(MUGQICPipeline, self).submit_jobs()
         if self.jobs and self.args.job_scheduler in ["pbs", "batch"]:
             self.mugqic_log()
 
@@ -127,27 +129,29 @@ class Illumina(MUGQICPipeline):
         Convert SAM/BAM files from the input readset file into FASTQ format
         if FASTQ files are not already specified in the readset file. Do nothing otherwise.
         """
-        jobs = []
-        for readset in self.readsets:
-            # If readset FASTQ files are available, skip this step
-            if not readset.fastq1:
-                if readset.bam:
-                    if readset.run_type == "PAIRED_END":
-                        fastq1 = re.sub("\.bam$", ".pair1.fastq.gz", readset.bam)
-                        fastq2 = re.sub("\.bam$", ".pair2.fastq.gz", readset.bam)
-                    elif readset.run_type == "SINGLE_END":
-                        fastq1 = re.sub("\.bam$", ".single.fastq.gz", readset.bam)
-                        fastq2 = None
-                    else:
-                        raise Exception("Error: run type \"" + readset.run_type +
-                        "\" is invalid for readset \"" + readset.name + "\" (should be PAIRED_END or SINGLE_END)!")
-
-                    job = picard.sam_to_fastq(readset.bam, fastq1, fastq2)
-                    job.name = "picard_sam_to_fastq." + readset.name
-                    jobs.append(job)
+        return self.parallel_jobs(self.picard_sam_to_fastq_readset_jobs, self.readsets)
+
+    def picard_sam_to_fastq_readset_jobs(self, readset):
+        # If readset FASTQ files are available, skip this step
+        if not readset.fastq1:
+            if readset.bam:
+                if readset.run_type == "PAIRED_END":
+                    fastq1 = re.sub("\.bam$", ".pair1.fastq.gz", readset.bam)
+                    fastq2 = re.sub("\.bam$", ".pair2.fastq.gz", readset.bam)
+                elif readset.run_type == "SINGLE_END":
+                    fastq1 = re.sub("\.bam$", ".single.fastq.gz", readset.bam)
+                    fastq2 = None
                 else:
-                    raise Exception("Error: BAM file not available for readset \"" + readset.name + "\"!")
-        return jobs
+                    raise Exception("Error: run type \"" + readset.run_type +
+                    "\" is invalid for readset \"" + readset.name + "\" (should be PAIRED_END or SINGLE_END)!")
+
+                job = picard.sam_to_fastq(readset.bam, fastq1, fastq2)
+                job.name = "picard_sam_to_fastq." + readset.name
+                return [job]
+            else:
+                raise Exception("Error: BAM file not available for readset \"" + readset.name + "\"!")
+        else:
+            return []
 
     def trimmomatic(self):
         """
@@ -163,21 +167,22 @@ class Illumina(MUGQICPipeline):
         1. FASTQ files from the readset file if available
         2. Else, FASTQ output files from previous picard_sam_to_fastq conversion of BAM files
         """
-        jobs = []
-        for readset in self.readsets:
-            trim_directory = os.path.join("trim", readset.sample.name)
-            trim_file_prefix = os.path.join(trim_directory, readset.name + ".trim.")
-            trim_log = trim_file_prefix + "log"
-
-            # Use adapter FASTA in config file if any, else create it from readset file
-            adapter_fasta = config.param('trimmomatic', 'adapter_fasta', required=False, type='filepath')
-            adapter_job = None
-            if not adapter_fasta:
-                adapter_fasta = trim_file_prefix + "adapters.fa"
-                if readset.run_type == "PAIRED_END":
-                    if readset.adapter1 and readset.adapter2:
-                        # WARNING: Reverse-complement and swap readset adapters for Trimmomatic Palindrome strategy
-                        adapter_job = Job(command="""\
+        return self.parallel_jobs(self.trimmomatic_readset_jobs, self.readsets)
+
+    def trimmomatic_readset_jobs(self, readset):
+        trim_directory = os.path.join("trim", readset.sample.name)
+        trim_file_prefix = os.path.join(trim_directory, readset.name + ".trim.")
+        trim_log = trim_file_prefix + "log"
+
+        # Use adapter FASTA in config file if any, else create it from readset file
+        adapter_fasta = config.param('trimmomatic', 'adapter_fasta', required=False, type='filepath')
+        adapter_job = None
+        if not adapter_fasta:
+            adapter_fasta = trim_file_prefix + "adapters.fa"
+            if readset.run_type == "PAIRED_END":
+                if readset.adapter1 and readset.adapter2:
+                    # WARNING: Reverse-complement and swap readset adapters for Trimmomatic Palindrome strategy
+                    adapter_job = Job(command="""\
 `cat > {adapter_fasta} << END
 >Prefix/1
 {sequence1}
@@ -185,67 +190,66 @@ class Illumina(MUGQICPipeline):
 {sequence2}
 END
 `""".format(adapter_fasta=adapter_fasta, sequence1=readset.adapter2.translate(string.maketrans("ACGTacgt","TGCAtgca"))[::-1], sequence2=readset.adapter1.translate(string.maketrans("ACGTacgt","TGCAtgca"))[::-1]))
-                    else:
-                        raise Exception("Error: missing adapter1 and/or adapter2 for PAIRED_END readset \"" + readset.name + "\", or missing adapter_fasta parameter in config file!")
-                elif readset.run_type == "SINGLE_END":
-                    if readset.adapter1:
-                        adapter_job = Job(command="""\
+                else:
+                    raise Exception("Error: missing adapter1 and/or adapter2 for PAIRED_END readset \"" + readset.name + "\", or missing adapter_fasta parameter in config file!")
+            elif readset.run_type == "SINGLE_END":
+                if readset.adapter1:
+                    adapter_job = Job(command="""\
 `cat > {adapter_fasta} << END
 >Single
 {sequence}
 END
 `""".format(adapter_fasta=adapter_fasta, sequence=readset.adapter1))
-                    else:
-                        raise Exception("Error: missing adapter1 for SINGLE_END readset \"" + readset.name + "\", or missing adapter_fasta parameter in config file!")
-
+                else:
+                    raise Exception("Error: missing adapter1 for SINGLE_END readset \"" + readset.name + "\", or missing adapter_fasta parameter in config file!")
+
+
+        trim_stats = trim_file_prefix + "stats.csv"
+        if readset.run_type == "PAIRED_END":
+            candidate_input_files = [[readset.fastq1, readset.fastq2]]
+            if readset.bam:
+                candidate_input_files.append([re.sub("\.bam$", ".pair1.fastq.gz", readset.bam), re.sub("\.bam$", ".pair2.fastq.gz", readset.bam)])
+            [fastq1, fastq2] = self.select_input_files(candidate_input_files)
+            job = trimmomatic.trimmomatic(
+                fastq1,
+                fastq2,
+                trim_file_prefix + "pair1.fastq.gz",
+                trim_file_prefix + "single1.fastq.gz",
+                trim_file_prefix + "pair2.fastq.gz",
+                trim_file_prefix + "single2.fastq.gz",
+                None,
+                readset.quality_offset,
+                adapter_fasta,
+                trim_log
+            )
+        elif readset.run_type == "SINGLE_END":
+            candidate_input_files = [[readset.fastq1]]
+            if readset.bam:
+                candidate_input_files.append([re.sub("\.bam$", ".single.fastq.gz", readset.bam)])
+            [fastq1] = self.select_input_files(candidate_input_files)
+            job = trimmomatic.trimmomatic(
+                fastq1,
+                None,
+                None,
+                None,
+                None,
+                None,
+                trim_file_prefix + "single.fastq.gz",
+                readset.quality_offset,
+                adapter_fasta,
+                trim_log
+            )
+        else:
+            raise Exception("Error: run type \"" + readset.run_type +
+            "\" is invalid for readset \"" + readset.name + "\" (should be PAIRED_END or SINGLE_END)!")
 
-            trim_stats = trim_file_prefix + "stats.csv"
-            if readset.run_type == "PAIRED_END":
-                candidate_input_files = [[readset.fastq1, readset.fastq2]]
-                if readset.bam:
-                    candidate_input_files.append([re.sub("\.bam$", ".pair1.fastq.gz", readset.bam), re.sub("\.bam$", ".pair2.fastq.gz", readset.bam)])
-                [fastq1, fastq2] = self.select_input_files(candidate_input_files)
-                job = trimmomatic.trimmomatic(
-                    fastq1,
-                    fastq2,
-                    trim_file_prefix + "pair1.fastq.gz",
-                    trim_file_prefix + "single1.fastq.gz",
-                    trim_file_prefix + "pair2.fastq.gz",
-                    trim_file_prefix + "single2.fastq.gz",
-                    None,
-                    readset.quality_offset,
-                    adapter_fasta,
-                    trim_log
-                )
-            elif readset.run_type == "SINGLE_END":
-                candidate_input_files = [[readset.fastq1]]
-                if readset.bam:
-                    candidate_input_files.append([re.sub("\.bam$", ".single.fastq.gz", readset.bam)])
-                [fastq1] = self.select_input_files(candidate_input_files)
-                job = trimmomatic.trimmomatic(
-                    fastq1,
-                    None,
-                    None,
-                    None,
-                    None,
-                    None,
-                    trim_file_prefix + "single.fastq.gz",
-                    readset.quality_offset,
-                    adapter_fasta,
-                    trim_log
-                )
-            else:
-                raise Exception("Error: run type \"" + readset.run_type +
-                "\" is invalid for readset \"" + readset.name + "\" (should be PAIRED_END or SINGLE_END)!")
-
-            if adapter_job:
-                job = concat_jobs([adapter_job, job])
-            jobs.append(concat_jobs([
-                # Trimmomatic does not create output directory by default
-                Job(command="mkdir -p " + trim_directory),
-                job
-            ], name="trimmomatic." + readset.name))
-        return jobs
+        if adapter_job:
+            job = concat_jobs([adapter_job, job])
+        return [concat_jobs([
+            # Trimmomatic does not create output directory by default
+            Job(command="mkdir -p " + trim_directory),
+            job
+        ], name="trimmomatic." + readset.name)]
 
     def merge_trimmomatic_stats(self):
         """
@@ -254,7 +258,7 @@ END
 
         read_type = "Paired" if self.run_type == 'PAIRED_END' else "Single"
         readset_merge_trim_stats = os.path.join("metrics", "trimReadsetTable.tsv")
-        job = concat_jobs([Job(command="mkdir -p metrics"), Job(command="echo 'Sample\tReadset\tRaw {read_type} Reads #\tSurviving {read_type} Reads #\tSurviving {read_type} Reads %' > ".format(read_type=read_type) + readset_merge_trim_stats)])
+        job_builder = ConcatJobBuilder([Job(command="mkdir -p metrics"), Job(command="echo 'Sample\tReadset\tRaw {read_type} Reads #\tSurviving {read_type} Reads #\tSurviving {read_type} Reads %' > ".format(read_type=read_type) + readset_merge_trim_stats)])
         for readset in self.readsets:
             trim_log = os.path.join("trim", readset.sample.name, readset.name + ".trim.log")
             if readset.run_type == "PAIRED_END":
@@ -263,8 +267,7 @@ END
             elif readset.run_type == "SINGLE_END":
                 perl_command = "perl -pe 's/^Input Reads: (\d+).*Surviving: (\d+).*$/{readset.sample.name}\t{readset.name}\t\\1\t\\2/'".format(readset=readset)
 
-            job = concat_jobs([
-                job,
+            job_builder.add(
                 Job(
                     [trim_log],
                     [readset_merge_trim_stats],
@@ -279,12 +282,12 @@ awk '{{OFS="\t"; print $0, $4 / $3 * 100}}' \\
                         readset_merge_trim_stats=readset_merge_trim_stats
                     )
                 )
-            ])
+            )
 
         sample_merge_trim_stats = os.path.join("metrics", "trimSampleTable.tsv")
         report_file = os.path.join("report", "Illumina.merge_trimmomatic_stats.md")
         return [concat_jobs([
-            job,
+            job_builder.build(),
             Job(
                 [readset_merge_trim_stats],
                 [sample_merge_trim_stats],
@@ -36,17 +36,19 @@ from core.pipeline import *
 from bfx.readset import *
 from bfx.sequence_dictionary import *
 
-from bfx import bvatools
-from bfx import bwa
-from bfx import gatk
-from bfx import gq_seq_utils
-from bfx import igvtools
-from bfx import metrics
-from bfx import picard
-from bfx import samtools
-from bfx import snpeff
-from bfx import tools
-from bfx import vcftools
+# bfx wrappers, imported when first used by a step
+from bfx import lazy_import
+bvatools = lazy_import("bvatools")
+bwa = lazy_import("bwa")
+gatk = lazy_import("gatk")
+gq_seq_utils = lazy_import("gq_seq_utils")
+igvtools = lazy_import("igvtools")
+metrics = lazy_import("metrics")
+picard = lazy_import("picard")
+samtools = lazy_import("samtools")
+snpeff = lazy_import("snpeff")
+tools = lazy_import("tools")
+vcftools = lazy_import("vcftools")
 from pipelines import common
 
 log = logging.getLogger(__name__)
@@ -99,56 +101,7 @@ class DnaSeq(common.Illumina):
         3. Else, FASTQ output files from previous picard_sam_to_fastq conversion of BAM files
         """
 
-        jobs = []
-        for readset in self.readsets:
-            trim_file_prefix = os.path.join("trim", readset.sample.name, readset.name + ".trim.")
-            alignment_directory = os.path.join("alignment", readset.sample.name)
-            readset_bam = os.path.join(alignment_directory, readset.name, readset.name + ".sorted.bam")
-
-            # Find input readset FASTQs first from previous trimmomatic job, then from original FASTQs in the readset sheet
-            if readset.run_type == "PAIRED_END":
-                candidate_input_files = [[trim_file_prefix + "pair1.fastq.gz", trim_file_prefix + "pair2.fastq.gz"]]
-                if readset.fastq1 and readset.fastq2:
-                    candidate_input_files.append([readset.fastq1, readset.fastq2])
-                if readset.bam:
-                    candidate_input_files.append([re.sub("\.bam$", ".pair1.fastq.gz", readset.bam), re.sub("\.bam$", ".pair2.fastq.gz", readset.bam)])
-                [fastq1, fastq2] = self.select_input_files(candidate_input_files)
-            elif readset.run_type == "SINGLE_END":
-                candidate_input_files = [[trim_file_prefix + "single.fastq.gz"]]
-                if readset.fastq1:
-                    candidate_input_files.append([readset.fastq1])
-                if readset.bam:
-                    candidate_input_files.append([re.sub("\.bam$", ".single.fastq.gz", readset.bam)])
-                [fastq1] = self.select_input_files(candidate_input_files)
-                fastq2 = None
-            else:
-                raise Exception("Error: run type \"" + readset.run_type +
-                "\" is invalid for readset \"" + readset.name + "\" (should be PAIRED_END or SINGLE_END)!")
-
-            job = concat_jobs([
-                Job(command="mkdir -p " + os.path.dirname(readset_bam)),
-                pipe_jobs([
-                    bwa.mem(
-                        fastq1,
-                        fastq2,
-                        read_group="'@RG" + \
-                            "\tID:" + readset.name + \
-                            "\tSM:" + readset.sample.name + \
-                            "\tLB:" + (readset.library if readset.library else readset.sample.name) + \
-                            ("\tPU:run" + readset.run + "_" + readset.lane if readset.run and readset.lane else "") + \
-                            ("\tCN:" + config.param('bwa_mem', 'sequencing_center') if config.param('bwa_mem', 'sequencing_center', required=False) else "") + \
-                            "\tPL:Illumina" + \
-                            "'"
-                    ),
-                    picard.sort_sam(
-                        "/dev/stdin",
-                        readset_bam,
-                        "coordinate"
-                    )
-                ])
-            ], name="bwa_mem_picard_sort_sam." + readset.name)
-
-            jobs.append(job)
+        jobs = self.parallel_jobs(self.bwa_mem_picard_sort_sam_readset_jobs, self.readsets)
 
         report_file = os.path.join("report", "DnaSeq.bwa_mem_picard_sort_sam.md")
         jobs.append(
@@ -176,6 +129,56 @@ pandoc --to=markdown \\
 
         return jobs
 
+    def bwa_mem_picard_sort_sam_readset_jobs(self, readset):
+        trim_file_prefix = os.path.join("trim", readset.sample.name, readset.name + ".trim.")
+        alignment_directory = os.path.join("alignment", readset.sample.name)
+        readset_bam = os.path.join(alignment_directory, readset.name, readset.name + ".sorted.bam")
+
+        # Find input readset FASTQs first from previous trimmomatic job, then from original FASTQs in the readset sheet
+        if readset.run_type == "PAIRED_END":
+            candidate_input_files = [[trim_file_prefix + "pair1.fastq.gz", trim_file_prefix + "pair2.fastq.gz"]]
+            if readset.fastq1 and readset.fastq2:
+                candidate_input_files.append([readset.fastq1, readset.fastq2])
+            if readset.bam:
+                candidate_input_files.append([re.sub("\.bam$", ".pair1.fastq.gz", readset.bam), re.sub("\.bam$", ".pair2.fastq.gz", readset.bam)])
+            [fastq1, fastq2] = self.select_input_files(candidate_input_files)
+        elif readset.run_type == "SINGLE_END":
+            candidate_input_files = [[trim_file_prefix + "single.fastq.gz"]]
+            if readset.fastq1:
+                candidate_input_files.append([readset.fastq1])
+            if readset.bam:
+                candidate_input_files.append([re.sub("\.bam$", ".single.fastq.gz", readset.bam)])
+            [fastq1] = self.select_input_files(candidate_input_files)
+            fastq2 = None
+        else:
+            raise Exception("Error: run type \"" + readset.run_type +
+            "\" is invalid for readset \"" + readset.name + "\" (should be PAIRED_END or SINGLE_END)!")
+
+        job = concat_jobs([
+            Job(command="mkdir -p " + os.path.dirname(readset_bam)),
+            pipe_jobs([
+                bwa.mem(
+                    fastq1,
+                    fastq2,
+                    read_group="'@RG" + \
+                        "\tID:" + readset.name + \
+                        "\tSM:" + readset.sample.name + \
+                        "\tLB:" + (readset.library if readset.library else readset.sample.name) + \
+                        ("\tPU:run" + readset.run + "_" + readset.lane if readset.run and readset.lane else "") + \
+                        ("\tCN:" + config.param('bwa_mem', 'sequencing_center') if config.param('bwa_mem', 'sequencing_center', required=False) else "") + \
+                        "\tPL:Illumina" + \
+                        "'"
+                ),
+                picard.sort_sam(
+                    "/dev/stdin",
+                    readset_bam,
+                    "coordinate"
+                )
+            ])
+        ], name="bwa_mem_picard_sort_sam." + readset.name)
+
+        return [job]
+
     def picard_merge_sam_files(self):
         """
         BAM readset files are merged into one file per sample. Merge is done using [Picard](http://broadinstitute.github.io/picard/).
@@ -858,7 +861,7 @@ pandoc \\
         ], name="dna_sample_metrics")
         job.input_files = [os.path.join("alignment", sample.name, sample.name + ".sorted.dup.metrics") for sample in self.samples]
         if library == "PAIRED_END" :
-            job.input_files += [os.path.join("alignment", sample.name, sample.name + ".sorted.dup.recal.all.metrics.insert_size_metrics") for sample in self.samples]
+            job.input_files = list(job.input_files) + [os.path.join("alignment", sample.name, sample.name + ".sorted.dup.recal.all.metrics.insert_size_metrics") for sample in self.samples]
         return [job]
 
     def generate_approximate_windows(self, nb_jobs):
@@ -35,18 +35,20 @@ from core.job import *
 from core.pipeline import *
 from bfx.sequence_dictionary import *
 
-from bfx import bvatools
-from bfx import gq_seq_utils
-from bfx import gatk
-from bfx import igvtools
-from bfx import picard
-from bfx import samtools
-from bfx import tools
-from bfx import varscan
-from bfx import htslib
-from bfx import vt
-from bfx import snpeff
-from bfx import gemini
+# bfx wrappers, imported when first used by a step
+from bfx import lazy_import
+bvatools = lazy_import("bvatools")
+gq_seq_utils = lazy_import("gq_seq_utils")
+gatk = lazy_import("gatk")
+igvtools = lazy_import("igvtools")
+picard = lazy_import("picard")
+samtools = lazy_import("samtools")
+tools = lazy_import("tools")
+varscan = lazy_import("varscan")
+htslib = lazy_import("htslib")
+vt = lazy_import("vt")
+snpeff = lazy_import("snpeff")
+gemini = lazy_import("gemini")
 from pipelines.dnaseq import dnaseq
 
 log = logging.getLogger(__name__)
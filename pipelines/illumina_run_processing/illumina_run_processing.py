@@ -33,8 +33,10 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 # MUGQIC Modules
 from bfx.readset import *
 
-from bfx import bvatools
-from bfx import picard
+# bfx wrappers, imported when first used by a step
+from bfx import lazy_import
+bvatools = lazy_import("bvatools")
+picard = lazy_import("picard")
 from pipelines import common
 
 log = logging.getLogger(__name__)
@@ -32,11 +32,13 @@ from core.config import *
 from core.job import *
 from bfx.readset import *
 
-from bfx import blast
-from bfx import gq_seq_utils
-from bfx import mummer
-from bfx import pacbio_tools
-from bfx import smrtanalysis
+# bfx wrappers, imported when first used by a step
+from bfx import lazy_import
+blast = lazy_import("blast")
+gq_seq_utils = lazy_import("gq_seq_utils")
+mummer = lazy_import("mummer")
+pacbio_tools = lazy_import("pacbio_tools")
+smrtanalysis = lazy_import("smrtanalysis")
 from pipelines import common
 
 log = logging.getLogger(__name__)
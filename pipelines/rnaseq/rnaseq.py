@@ -37,17 +37,19 @@ from core.pipeline import *
 from bfx.design import *
 from bfx.readset import *
 
-from bfx import bedtools
-from bfx import cufflinks
-from bfx import differential_expression
-from bfx import gq_seq_utils
-from bfx import htseq
-from bfx import metrics
-from bfx import picard
-from bfx import samtools
-from bfx import star
-from bfx import bvatools
-from bfx import rmarkdown
+# bfx wrappers, imported when first used by a step
+from bfx import lazy_import
+bedtools = lazy_import("bedtools")
+cufflinks = lazy_import("cufflinks")
+differential_expression = lazy_import("differential_expression")
+gq_seq_utils = lazy_import("gq_seq_utils")
+htseq = lazy_import("htseq")
+metrics = lazy_import("metrics")
+picard = lazy_import("picard")
+samtools = lazy_import("samtools")
+star = lazy_import("star")
+bvatools = lazy_import("bvatools")
+rmarkdown = lazy_import("rmarkdown")
 from pipelines import common
 import utils
 
@@ -211,7 +213,7 @@ class RnaSeq(common.Illumina):
                 cuff_follow=True,
                 sort_bam=True
             )
-            job.input_files.append(os.path.join(project_index_directory, "SAindex"))
+            job.input_files = list(job.input_files) + [os.path.join(project_index_directory, "SAindex")]
 
             # If this readset is unique for this sample, further BAM merging is not necessary.
             # Thus, create a sample BAM symlink to the readset BAM.
@@ -537,8 +539,7 @@ pandoc \\
                     Job(command="rm " + input_bam_f1 + " " + input_bam_f2)
                 ], name="wiggle." + sample.name + ".forward_strandspec")
                 # Remove temporary-then-deleted files from job output files, otherwise job is never up to date
-                bam_f_job.output_files.remove(input_bam_f1)
-                bam_f_job.output_files.remove(input_bam_f2)
+                bam_f_job.output_files = [output_file for output_file in bam_f_job.output_files if output_file not in [input_bam_f1, input_bam_f2]]
 
                 bam_r_job = concat_jobs([
                     Job(command="mkdir -p " + os.path.join("tracks", sample.name) + " " + os.path.join("tracks", "bigWig")),
@@ -548,8 +549,7 @@ pandoc \\
                     Job(command="rm " + input_bam_r1 + " " + input_bam_r2)
                 ], name="wiggle." + sample.name + ".reverse_strandspec")
                 # Remove temporary-then-deleted files from job output files, otherwise job is never up to date
-                bam_r_job.output_files.remove(input_bam_r1)
-                bam_r_job.output_files.remove(input_bam_r2)
+                bam_r_job.output_files = [output_file for output_file in bam_r_job.output_files if output_file not in [input_bam_r1, input_bam_r2]]
 
                 jobs.extend([bam_f_job, bam_r_job])
 
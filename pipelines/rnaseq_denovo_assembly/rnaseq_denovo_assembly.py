@@ -21,7 +21,6 @@
 
 # Python Standard Modules
 import argparse
-import glob
 import logging
 import os
 import re
@@ -35,16 +34,18 @@ from core.config import *
 from core.job import *
 from core.pipeline import *
 from bfx.readset import *
-from bfx import differential_expression
-from bfx import gq_seq_utils
+# bfx wrappers, imported when first used by a step
+from bfx import lazy_import
+differential_expression = lazy_import("differential_expression")
+gq_seq_utils = lazy_import("gq_seq_utils")
 from pipelines import common
-from bfx import rmarkdown
-from bfx import samtools
-from bfx import tools
-from bfx import trinity
-from bfx import trinotate
-from bfx import blast
-from bfx import exonerate
+rmarkdown = lazy_import("rmarkdown")
+samtools = lazy_import("samtools")
+tools = lazy_import("tools")
+trinity = lazy_import("trinity")
+trinotate = lazy_import("trinotate")
+blast = lazy_import("blast")
+exonerate = lazy_import("exonerate")
 
 
 log = logging.getLogger(__name__)
@@ -307,7 +308,7 @@ pandoc --to=markdown \\
 
         # (Removed blast on uniref_db since it's too long)
         for db in [swissprot_db]:
-            if not glob.glob(db + ".*phr"):
+            if not stat_cache.glob(db + ".*phr"):
                 raise Exception("Error: " + db + " BLAST db files do not exist!")
 
             for i in range(num_fasta_chunks):
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+
+# Python Standard Modules
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Append mugqic_pipelines to Python path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "core"))
+
+# MUGQIC Modules
+from job import *
+from job_state import *
+from pipeline import *
+
+class JobStateLedgerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        # Loading a ledger, even missing, enables it
+        job_state_ledger.load(os.path.join(self.output_dir, JOB_STATE_LEDGER))
+
+    def tearDown(self):
+        job_state_ledger.__init__()
+        shutil.rmtree(self.output_dir)
+
+    # Packed jobs of a bundle job each record their own runtime, and the bundle job runtime is not a job name prefix runtime
+    def test_bundle_job_runtimes(self):
+        jobs = []
+        for i, sleep_seconds in enumerate([1, 2, 3]):
+            job = Job(output_files=["sleep" + str(i) + ".txt"], name="sleep.readset" + str(i), command="sleep " + str(sleep_seconds) + " && touch sleep" + str(i) + ".txt")
+            job.done = os.path.join("job_output", "sleep", job.name + "." + hashlib.md5(job.command).hexdigest() + ".mugqic.done")
+            job.dependency_jobs = []
+            jobs.append(job)
+
+        pipeline = Pipeline.__new__(Pipeline)
+        pipeline._output_dir = self.output_dir
+        bundle_job = pipeline.bundle_job(collections.namedtuple('Step', ['name'])("sleep"), jobs, "sleep" + BUNDLE_JOB_NAME_INFIX + "1")
+
+        # Run the bundle job as job scheduler scripts do
+        os.makedirs(os.path.join(self.output_dir, "job_output", "sleep"))
+        self.assertFalse(job_state_ledger.records(bundle_job))
+        subprocess.check_call(["bash", "-c", "set -e\n" + bundle_job.command], cwd=self.output_dir)
+
+        # A bundle job record, as written by previous versions, is not a job name prefix runtime
+        with open(os.path.join(self.output_dir, JOB_STATE_LEDGER), 'a') as ledger_file:
+            ledger_file.write(bundle_job.done + "\t0\t600\t\n")
+
+        ledger = JobStateLedger()
+        ledger.load(os.path.join(self.output_dir, JOB_STATE_LEDGER))
+        runtimes = [ledger.runtime(job) for job in jobs]
+        for runtime, sleep_seconds in zip(runtimes, [1, 2, 3]):
+            self.assertTrue(sleep_seconds <= runtime <= sleep_seconds + 1, "runtimes: " + str(runtimes))
+        self.assertEqual(ledger.mean_runtime("sleep"), sum(runtimes) // 3)
+
+if __name__ == '__main__':
+    unittest.main()
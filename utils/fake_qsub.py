@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import argparse
+import fcntl
+import os
+import random
+import subprocess
+import sys
+import time
+
+# Local stand-in for PBS qsub, to test job submission without a cluster, e.g. with config:
+#   [DEFAULT]
+#   cluster_submit_cmd=python $MUGQIC_PIPELINES_HOME/utils/fake_qsub.py
+#   cluster_submit_cmd_suffix=
+# The job script is read on the standard input and saved in the spool directory with a new job ID.
+# Dependencies ("-W depend=afterok:<ID>:<ID>...") must be job IDs issued before, as on a real PBS server.
+# With --qstat, list the IDs and names of jobs still in the fake queue, e.g. with config:
+#   cluster_queue_cmd=python $MUGQIC_PIPELINES_HOME/utils/fake_qsub.py --qstat
+# Since submission options are qsub options, fake_qsub.py settings are environment variables:
+#   FAKE_QSUB_DIR: spool directory (default: /tmp/fake_qsub_$USER)
+#   FAKE_QSUB_FAILURE_RATE: probability of a transient submission failure (default: 0)
+#   FAKE_QSUB_LOST_RATE: probability of a submission failure after the job was queued e.g. a timeout (default: 0)
+#   FAKE_QSUB_LATENCY: submission latency in seconds (default: 0)
+#   FAKE_QSUB_RUN: if "true", run the job synchronously in its working directory, writing its output file
+#   FAKE_QSUB_DURATION: time in seconds a job stays in the fake queue after its submission (default: 0)
+
+def next_job_id(spool_dir):
+    with open(os.path.join(spool_dir, "job_id.lock"), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        counter_file = os.path.join(spool_dir, "job_id")
+        job_number = int(open(counter_file).read()) + 1 if os.path.isfile(counter_file) else 1
+        with open(counter_file, 'w') as counter:
+            counter.write(str(job_number))
+    return str(job_number) + ".fake"
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for PBS qsub")
+    parser.add_argument("-N", dest="name", default="STDIN")
+    parser.add_argument("-o", dest="output", default=None)
+    parser.add_argument("-d", dest="work_dir", default=os.getcwd())
+    parser.add_argument("-W", dest="attributes", action="append", default=[])
+    parser.add_argument("--qstat", help="list job IDs and names still in the fake queue", action="store_true")
+    args, other_args = parser.parse_known_args()
+
+    spool_dir = os.environ.get("FAKE_QSUB_DIR", "/tmp/fake_qsub_" + os.environ.get("USER", "user"))
+    if not os.path.isdir(spool_dir):
+        try:
+            os.makedirs(spool_dir)
+        except OSError:
+            pass
+
+    if args.qstat:
+        jobs_file = os.path.join(spool_dir, "jobs.tsv")
+        if os.path.isfile(jobs_file):
+            with open(jobs_file) as jobs:
+                for fields in [line.rstrip("\n").split("\t") for line in jobs]:
+                    if float(fields[4]) + float(os.environ.get("FAKE_QSUB_DURATION", 0)) > time.time():
+                        print(fields[0] + " " + fields[1])
+        return 0
+
+    time.sleep(float(os.environ.get("FAKE_QSUB_LATENCY", 0)))
+    job_script = sys.stdin.read()
+
+    if random.random() < float(os.environ.get("FAKE_QSUB_FAILURE_RATE", 0)):
+        sys.stderr.write("qsub: cannot connect to server fake (errno=111) Connection refused\n")
+        return 111
+
+    dependency_ids = []
+    for attribute in args.attributes:
+        if attribute.startswith("depend="):
+            dependency_ids.extend([dependency_id for dependency_id in attribute.split(":")[1:] if dependency_id])
+    for dependency_id in dependency_ids:
+        if not os.path.isfile(os.path.join(spool_dir, dependency_id + ".sh")):
+            sys.stderr.write("qsub: submit error (Unknown Job Id " + dependency_id + ")\n")
+            return 153
+
+    job_id = next_job_id(spool_dir)
+    with open(os.path.join(spool_dir, job_id + ".sh"), 'w') as job_script_file:
+        job_script_file.write(job_script)
+    with open(os.path.join(spool_dir, "jobs.tsv"), 'a') as jobs:
+        jobs.write("\t".join([job_id, args.name, ":".join(dependency_ids), str(args.output), str(time.time())]) + "\n")
+
+    if random.random() < float(os.environ.get("FAKE_QSUB_LOST_RATE", 0)):
+        sys.stderr.write("qsub: Timed out waiting for server reply\n")
+        return 1
+
+    if os.environ.get("FAKE_QSUB_RUN") == "true":
+        with open(args.output or os.devnull, 'w') as output:
+            subprocess.call(["bash", os.path.join(spool_dir, job_id + ".sh")], cwd=args.work_dir, stdout=output, stderr=subprocess.STDOUT)
+
+    print(job_id)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Job telemetry helper, run by job scripts on compute nodes when 'job_telemetry' is set in config:
+# only Python standard modules are used, with any Python version available on compute nodes.
+
+# Python Standard Modules
+import argparse
+import collections
+import datetime
+import errno
+import glob
+import json
+import os
+import socket
+import sys
+import time
+
+# Telemetry file suffix, appended to job output file names without ".o"
+TELEMETRY_SUFFIX = ".telemetry.json"
+
+# Return I/O counters of the current process from /proc/self/io, or None if not available.
+# Counters of child processes are added to their parent's ones when they are waited for.
+def io_counters():
+    try:
+        with open("/proc/self/io") as proc_io:
+            return dict([(name.strip(), int(value)) for name, value in [line.split(":") for line in proc_io if ":" in line]])
+    except (IOError, OSError, ValueError):
+        return None
+
+# Wait for a child process, retrying if interrupted by a signal
+def wait4(pid):
+    while True:
+        try:
+            return os.wait4(pid, 0)
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+
+def timestamp(seconds):
+    return datetime.datetime.fromtimestamp(seconds).strftime("%Y-%m-%dT%H:%M:%S")
+
+def run(args):
+    """
+    Run a job command with bash, write its telemetry in a JSON file, then exit with the command exit status.
+    Telemetry: start and end times, host, CPU time and I/O bytes of the command and its child processes,
+    and the largest resident set size of a single one of these processes.
+    """
+    io_start = io_counters()
+    start = time.time()
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            # Like job scripts, exit status is the one of the first command of the last pipeline
+            os.execvp("bash", ["bash", "-c", args.command + "\nexit ${PIPESTATUS[0]}"])
+        finally:
+            os._exit(127)
+    status, rusage = wait4(pid)[1:]
+
+    end = time.time()
+    io_end = io_counters()
+    exit_status = 128 + os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+
+    telemetry = collections.OrderedDict([
+        ("host", socket.gethostname()),
+        ("start", timestamp(start)),
+        ("end", timestamp(end)),
+        ("wall_seconds", round(end - start, 3)),
+        ("user_cpu_seconds", round(rusage.ru_utime, 3)),
+        ("system_cpu_seconds", round(rusage.ru_stime, 3)),
+        # Average number of busy cores
+        ("cpu_utilization", round((rusage.ru_utime + rusage.ru_stime) / (end - start), 3) if end > start else None),
+        # Largest resident set size of a single process among the command and its child processes (ru_maxrss is in KB on Linux),
+        # not the memory footprint of the whole job since processes running at the same time are not added up
+        ("max_process_rss_mb", round(rusage.ru_maxrss / 1024.0, 1)),
+        # Bytes read from and written to storage, then bytes read and written by system calls, including pipes and page cache
+        ("read_bytes", io_end['read_bytes'] - io_start['read_bytes'] if io_start and io_end else None),
+        ("write_bytes", io_end['write_bytes'] - io_start['write_bytes'] if io_start and io_end else None),
+        ("read_chars", io_end['rchar'] - io_start['rchar'] if io_start and io_end else None),
+        ("write_chars", io_end['wchar'] - io_start['wchar'] if io_start and io_end else None),
+        ("exit_status", exit_status)
+    ])
+
+    # Telemetry is optional: an unwritable file must not fail the job
+    try:
+        telemetry_dir = os.path.dirname(os.path.abspath(args.telemetry_file))
+        if not os.path.isdir(telemetry_dir):
+            os.makedirs(telemetry_dir)
+        with open(args.telemetry_file + ".tmp", 'w') as telemetry_json:
+            json.dump(telemetry, telemetry_json, indent=2)
+            telemetry_json.write("\n")
+        os.rename(args.telemetry_file + ".tmp", args.telemetry_file)
+    except (IOError, OSError) as e:
+        sys.stderr.write("Warning: job telemetry file " + args.telemetry_file + " could not be written: " + str(e) + "\n")
+
+    sys.exit(exit_status)
+
+def summary(args):
+    """
+    Summarize job telemetry files of a pipeline job output directory, per step.
+    CPU utilization is the total CPU time of step jobs divided by their total wall time.
+    Max process RSS is the largest resident set size of a single process among step jobs.
+    """
+    steps = collections.OrderedDict()
+    for telemetry_file in sorted(glob.glob(os.path.join(args.job_output_dir, "*", "*" + TELEMETRY_SUFFIX))):
+        with open(telemetry_file) as telemetry_json:
+            steps.setdefault(os.path.basename(os.path.dirname(telemetry_file)), []).append(json.load(telemetry_json))
+
+    print("\t".join(["Step", "Jobs", "Failed", "Wall (s)", "CPU (s)", "CPU utilization", "Max process RSS (MB)", "Read (MB)", "Written (MB)"]))
+    # Steps are listed by first job start
+    for step, telemetries in sorted(steps.items(), key=lambda step_telemetries: min([telemetry['start'] for telemetry in step_telemetries[1]])):
+        wall_seconds = sum([telemetry['wall_seconds'] for telemetry in telemetries])
+        cpu_seconds = sum([telemetry['user_cpu_seconds'] + telemetry['system_cpu_seconds'] for telemetry in telemetries])
+        print("\t".join([
+            step,
+            str(len(telemetries)),
+            str(len([telemetry for telemetry in telemetries if telemetry['exit_status'] != 0])),
+            "%.1f" % wall_seconds,
+            "%.1f" % cpu_seconds,
+            "%.2f" % (cpu_seconds / wall_seconds) if wall_seconds else "NA",
+            "%.1f" % max([telemetry['max_process_rss_mb'] for telemetry in telemetries])
+        ] + ["%.1f" % (sum([telemetry[name] or 0 for telemetry in telemetries]) / 1024.0 / 1024.0) for name in ['read_bytes', 'write_bytes']]))
+
+#-------------------------------------------------------------------------------
+# Main script
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description="Per-job runtime telemetry of MUGQIC pipelines")
+    subparsers = parser.add_subparsers(title="commands")
+
+    run_parser = subparsers.add_parser("run", help=run.__doc__.strip().split("\n")[0])
+    run_parser.add_argument("telemetry_file", help="JSON telemetry file")
+    run_parser.add_argument("command", help="job command")
+    run_parser.set_defaults(function=run)
+
+    summary_parser = subparsers.add_parser("summary", help=summary.__doc__.strip().split("\n")[0])
+    summary_parser.add_argument("job_output_dir", help="pipeline job output directory e.g. <output_dir>/job_output")
+    summary_parser.set_defaults(function=summary)
+
+    args = parser.parse_args()
+    args.function(args)
@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+
+################################################################################
+# Copyright (C) 2014, 2015 GenAP, McGill University and Genome Quebec Innovation Centre
+#
+# This file is part of MUGQIC Pipelines.
+#
+# MUGQIC Pipelines is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MUGQIC Pipelines is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MUGQIC Pipelines.  If not, see <http://www.gnu.org/licenses/>.
+################################################################################
+
+# Python Standard Modules
+import argparse
+import collections
+import ConfigParser
+import datetime
+import glob
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+# Append mugqic_pipelines directory to Python library path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(sys.argv[0]))))
+
+# MUGQIC Modules
+from core.job import *
+from core.pipeline import *
+from core.step import *
+
+log = logging.getLogger(__name__)
+
+# Synthetic pipeline with scattered per-sample steps, built without parsing command line arguments
+class SyntheticPipeline(Pipeline):
+
+    def __init__(self, output_dir, nb_samples, nb_scatter, command_size=0):
+        self._output_dir = output_dir
+        self._force_jobs = False
+        self.nb_samples = nb_samples
+        self.nb_scatter = nb_scatter
+        self.command_options = "".join([" \\\n  --option" + str(i) + "=" + str(i * 7919 % 10007) for i in range(command_size // 20 + 1)])[:command_size]
+        self._step_list = [Step(step) for step in self.steps]
+        self._step_range = self.step_list
+
+        # Only raw input files must exist on the file system
+        self.raw_file = os.path.join(output_dir, "raw.fastq.gz")
+        open(self.raw_file, 'w').close()
+
+    # Pad synthetic commands with tool options up to the requested size, like real tool commands
+    def command(self, command):
+        return command + self.command_options[len(command):]
+
+    def align(self):
+        return [Job([self.raw_file], ["align/" + str(sample) + ".bam"], name="align." + str(sample), command=self.command("align " + str(sample))) for sample in range(self.nb_samples)]
+
+    # Scattered jobs are created per sample, in parallel if 'planning_processes' > 1
+    def scatter_call(self):
+        return self.parallel_jobs(self.scatter_call_sample_jobs, range(self.nb_samples))
+
+    def scatter_call_sample_jobs(self, sample):
+        return [Job(["align/" + str(sample) + ".bam"], ["call/" + str(sample) + "." + str(chunk) + ".vcf"], name="scatter_call." + str(sample) + "." + str(chunk), command=self.command("call " + str(sample) + " " + str(chunk))) for chunk in range(self.nb_scatter)]
+
+    def gather_call(self):
+        return [Job(["call/" + str(sample) + "." + str(chunk) + ".vcf" for chunk in range(self.nb_scatter)], ["call/" + str(sample) + ".vcf"], name="gather_call." + str(sample), command=self.command("gather " + str(sample))) for sample in range(self.nb_samples)]
+
+    def select_calls(self):
+        # Exercise select_input_files with a first candidate which is never produced
+        jobs = []
+        for sample in range(self.nb_samples):
+            [vcf] = self.select_input_files([["call/" + str(sample) + ".missing.vcf"], ["call/" + str(sample) + ".vcf"]])
+            jobs.append(Job([vcf], ["select/" + str(sample) + ".vcf"], name="select_calls." + str(sample), command=self.command("select " + str(sample))))
+        return jobs
+
+    def annotate_calls(self):
+        # Dependency on align job is implied by the dependency on select_calls job
+        return [Job(["align/" + str(sample) + ".bam", "select/" + str(sample) + ".vcf"], ["annotate/" + str(sample) + ".vcf"], name="annotate_calls." + str(sample), command=self.command("annotate " + str(sample))) for sample in range(self.nb_samples)]
+
+    @property
+    def steps(self):
+        return [
+            self.align,
+            self.scatter_call,
+            self.gather_call,
+            self.select_calls,
+            self.annotate_calls
+        ]
+
+# Maximum resident set size of the current process in MB (ru_maxrss is in KB on Linux)
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def benchmark_dependencies(args):
+    """
+    Time Pipeline.create_jobs with an increasing number of samples.
+    With the output file index, time per job must stay roughly constant.
+    Peak memory is the maximum resident set size of the benchmark process so far.
+    """
+    if args.processes > 1:
+        config.set('DEFAULT', 'planning_processes', str(args.processes))
+    print("\t".join(["Samples", "Jobs", "Seconds", "Microseconds/job", "Peak RSS (MB)"]))
+    for nb_samples in args.samples:
+        output_dir = tempfile.mkdtemp(prefix="mugqic_planning_benchmark.")
+        try:
+            pipeline = SyntheticPipeline(output_dir, nb_samples, args.scatter, args.command_size)
+            start = time.time()
+            pipeline.create_jobs()
+            seconds = time.time() - start
+            nb_jobs = len(pipeline.jobs)
+            print("\t".join([str(nb_samples), str(nb_jobs), "%.3f" % seconds, "%.1f" % (seconds * 1000000 / nb_jobs), "%.1f" % peak_rss_mb()]))
+        finally:
+            shutil.rmtree(output_dir)
+
+def benchmark_concat(args):
+    """
+    Time job composition with concat_jobs, ConcatJobBuilder and pipe_jobs.
+    Each job reads the previous job output file, plus a shared and an own input file.
+    """
+    print("\t".join(["Jobs", "concat_jobs", "ConcatJobBuilder", "pipe_jobs"]))
+    for nb_jobs in args.elements:
+        jobs = [Job(["shared.txt", "input." + str(i) + ".txt", "output." + str(i - 1) + ".txt"], ["output." + str(i) + ".txt"], command="step " + str(i), report_files=["report." + str(i) + ".md"], removable_files=["output." + str(i) + ".txt"]) for i in range(nb_jobs)]
+        for job in jobs:
+            job.modules = ["module_" + str(len(job.command) % 10)]
+
+        times = []
+
+        start = time.time()
+        concat_jobs(jobs, name="concat")
+        times.append(time.time() - start)
+
+        # Append jobs one by one, as done in per-readset loops
+        start = time.time()
+        job_builder = ConcatJobBuilder()
+        for job in jobs:
+            job_builder.add(job)
+        job_builder.build(name="concat")
+        times.append(time.time() - start)
+
+        start = time.time()
+        pipe_jobs(jobs, name="pipe")
+        times.append(time.time() - start)
+
+        print("\t".join([str(nb_jobs)] + ["%.3f" % seconds for seconds in times]))
+
+def benchmark_reduction(args):
+    """
+    Time transitive reduction of job dependencies with an increasing number of samples.
+    """
+    print("\t".join(["Samples", "Jobs", "Edges", "Removed edges", "Seconds", "Peak RSS (MB)"]))
+    for nb_samples in args.samples:
+        output_dir = tempfile.mkdtemp(prefix="mugqic_planning_benchmark.")
+        try:
+            pipeline = SyntheticPipeline(output_dir, nb_samples, args.scatter)
+            pipeline.create_jobs()
+            nb_edges = sum([len(job.dependency_jobs) for job in pipeline.jobs])
+            start = time.time()
+            pipeline.reduce_dependencies()
+            seconds = time.time() - start
+            nb_removed_edges = nb_edges - sum([len(job.dependency_jobs) for job in pipeline.jobs])
+            print("\t".join([str(nb_samples), str(len(pipeline.jobs)), str(nb_edges), str(nb_removed_edges), "%.3f" % seconds, "%.1f" % peak_rss_mb()]))
+        finally:
+            shutil.rmtree(output_dir)
+
+def benchmark_daemon(args):
+    """
+    Time DaemonScheduler job description output with an increasing number of samples.
+    Peak memory is the maximum resident set size of the benchmark process so far.
+    """
+    for name, value in [("cluster_submit_cmd", "qsub"), ("cluster_other_arg", "-m ae"), ("cluster_work_dir_arg", "-d"), ("cluster_output_dir_arg", "-j oe -o"), ("cluster_job_name_arg", "-N"), ("cluster_walltime", "-l walltime=24:00:0"), ("cluster_queue", "-q sw"), ("cluster_cpu", "-l nodes=1:ppn=1")]:
+        config.set('DEFAULT', name, value)
+    print("\t".join(["Samples", "Jobs", "Format", "Seconds", "Peak RSS (MB)"]))
+    for nb_samples in args.samples:
+        output_dir = tempfile.mkdtemp(prefix="mugqic_planning_benchmark.")
+        try:
+            pipeline = SyntheticPipeline(output_dir, nb_samples, args.scatter, args.command_size)
+            pipeline.create_jobs()
+            with open(os.devnull, 'w') as devnull:
+                for daemon_format in ["json", "jsonl"]:
+                    start = time.time()
+                    getattr(DaemonScheduler(), "write_" + daemon_format)(pipeline, devnull)
+                    seconds = time.time() - start
+                    print("\t".join([str(nb_samples), str(len(pipeline.jobs)), daemon_format, "%.3f" % seconds, "%.1f" % peak_rss_mb()]))
+        finally:
+            shutil.rmtree(output_dir)
+
+# Run a pipeline script with arguments, then report the number of bfx modules imported on its standard error
+STARTUP_CODE = """
+import atexit, runpy, sys
+atexit.register(lambda: sys.stderr.write("BFX_MODULES=%d\\n" % len([module for module in sys.modules if module.startswith("bfx.") and sys.modules[module]])))
+sys.argv = sys.argv[1:]
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+def benchmark_startup(args):
+    """
+    Time the startup of each pipeline script in pipelines/, e.g. with --help.
+    Each script is run several times in a new Python process and the shortest time is kept.
+    """
+    source_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    pipeline_scripts = [script for script in sorted(glob.glob(os.path.join(source_dir, "pipelines", "*", "*.py"))) if os.path.basename(script) == os.path.basename(os.path.dirname(script)) + ".py"]
+    print("\t".join(["Pipeline", "Seconds (min)", "Seconds (mean)", "bfx modules"]))
+    with open(os.devnull, 'w') as devnull:
+        for pipeline_script in pipeline_scripts:
+            times = []
+            for i in range(args.repeats):
+                start = time.time()
+                process = subprocess.Popen([sys.executable, "-c", STARTUP_CODE, pipeline_script] + (args.arguments or ["--help"]), stdout=devnull, stderr=subprocess.PIPE)
+                stderr = process.communicate()[1]
+                times.append(time.time() - start)
+            bfx_modules = [line.split("=")[1] for line in stderr.splitlines() if line.startswith("BFX_MODULES=")]
+            print("\t".join([os.path.basename(pipeline_script)[:-3], "%.3f" % min(times), "%.3f" % (sum(times) / len(times)), bfx_modules[-1] if bfx_modules else "NA"]))
+
+# Pipelines of the synthetic benchmark suite, with the contrast name format of their design file, if any
+SUITE_PIPELINES = collections.OrderedDict([
+    ("dnaseq", None),
+    ("rnaseq", "contrast{0}"),
+    ("chipseq", "contrast{0},N"),
+    ("ampliconseq", None),
+    ("rnaseq_denovo_assembly", "contrast{0}")
+])
+
+# GRCh37 chromosome lengths; genome .dict and .fai files are completed with unplaced scaffolds
+GRCH37_CHROMOSOMES = [("1", 249250621), ("2", 243199373), ("3", 198022430), ("4", 191154276), ("5", 180915260),
+    ("6", 171115067), ("7", 159138663), ("8", 146364022), ("9", 141213431), ("10", 135534747), ("11", 135006516),
+    ("12", 133851895), ("13", 115169878), ("14", 107349540), ("15", 102531392), ("16", 90354753), ("17", 81195210),
+    ("18", 78077248), ("19", 59128983), ("20", 63025520), ("21", 48129895), ("22", 51304566), ("X", 155270560),
+    ("Y", 59373566), ("MT", 16569)]
+
+# Run a pipeline script with module check disabled, timing create_jobs and submit_jobs, then write timings in a JSON file
+SUITE_PIPELINE_CODE = """
+import imp, json, os, resource, sys, time
+result_file, pipeline_script = sys.argv[1:3]
+sys.argv = [pipeline_script] + sys.argv[3:]
+sys.path.insert(0, os.path.dirname(pipeline_script))
+pipeline_module = imp.load_source("mugqic_planning_benchmark", pipeline_script)
+
+from core.config import Config
+from core.pipeline import Pipeline
+Config.check_modules = lambda self: None
+[pipeline_class] = [value for value in vars(pipeline_module).values() if isinstance(value, type) and issubclass(value, Pipeline) and value.__module__ == "mugqic_planning_benchmark"]
+sys.argv.extend(["-s", "1-" + str(len(pipeline_class.steps.fget(pipeline_class.__new__(pipeline_class))))])
+
+result = {}
+def timed(method):
+    def timed_method(self):
+        start = time.time()
+        method(self)
+        result[method.__name__ + "_seconds"] = time.time() - start
+        result["jobs"] = len(self.jobs)
+    return timed_method
+pipeline_class.create_jobs = timed(pipeline_class.create_jobs)
+pipeline_class.submit_jobs = timed(pipeline_class.submit_jobs)
+
+start = time.time()
+pipeline_class()
+result["pipeline_seconds"] = time.time() - start
+result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+with open(result_file, 'w') as result_json:
+    json.dump(result, result_json)
+"""
+
+# Genome contigs: GRCh37 chromosomes first, then unplaced scaffolds of decreasing length
+def synthetic_contigs(nb_contigs):
+    return GRCH37_CHROMOSOMES[:nb_contigs] + [("GL%06d.1" % (191 + i), 250000 - i * 2500) for i in range(max(0, nb_contigs - len(GRCH37_CHROMOSOMES)))]
+
+# Create placeholder reference files for all config paths in install directory, with genome contigs in .dict and .fai files
+# and a protein sequence file for BLAST databases
+def write_synthetic_references(install_dir, config_files, nb_contigs):
+    contigs = synthetic_contigs(nb_contigs)
+    reference_config = ConfigParser.SafeConfigParser()
+    reference_config.optionxform = str
+    reference_config.read(config_files)
+    for section in ['DEFAULT'] + reference_config.sections():
+        for name, value in reference_config.items(section):
+            path = os.path.normpath(os.path.expandvars(value))
+            if not path.startswith(install_dir + os.sep):
+                continue
+            elif name.endswith("_dir") or name.endswith("folder"):
+                if not os.path.isdir(path):
+                    os.makedirs(path)
+            elif not os.path.exists(path):
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                with open(path, 'w') as reference_file:
+                    if path.endswith(".dict"):
+                        reference_file.write("@HD\tVN:1.0\tSO:unsorted\n" + "".join(["@SQ\tSN:" + contig + "\tLN:" + str(length) + "\n" for contig, length in contigs]))
+                    elif path.endswith(".fai"):
+                        reference_file.write("".join([contig + "\t" + str(length) + "\t0\t60\t61\n" for contig, length in contigs]))
+                # FASTA index, read by some pipelines without a config parameter
+                if path.endswith(".fa"):
+                    with open(path + ".fai", 'w') as reference_file:
+                        reference_file.write("".join([contig + "\t" + str(length) + "\t0\t60\t61\n" for contig, length in contigs]))
+                if name.endswith("_db"):
+                    open(path + ".phr", 'w').close()
+
+# Create a readset file with empty paired-end FASTQ files, and a design file per contrast name format.
+# Return the number of samples.
+def write_synthetic_readsets(data_dir, nb_readsets, readsets_per_sample):
+    nb_samples = (nb_readsets + readsets_per_sample - 1) // readsets_per_sample
+    with open(os.path.join(data_dir, "readsets.tsv"), 'w') as readset_file:
+        readset_file.write("\t".join(["Sample", "Readset", "Library", "RunType", "Run", "Lane", "Adapter1", "Adapter2", "QualityOffset", "BED", "FASTQ1", "FASTQ2", "BAM"]) + "\n")
+        for i in range(nb_readsets):
+            sample = "sample" + str(i // readsets_per_sample + 1)
+            readset = sample + ".readset" + str(i % readsets_per_sample + 1)
+            fastqs = [os.path.join("raw_reads", sample, readset + ".R" + str(read) + ".fastq.gz") for read in [1, 2]]
+            if not os.path.isdir(os.path.join(data_dir, "raw_reads", sample)):
+                os.makedirs(os.path.join(data_dir, "raw_reads", sample))
+            for fastq in fastqs:
+                open(os.path.join(data_dir, fastq), 'w').close()
+            readset_file.write("\t".join([sample, readset, "lib" + str(i // readsets_per_sample + 1), "PAIRED_END", "run" + str(i // 8 + 1), str(i % 8 + 1), "AGATCGGAAGAGCACACGTCTGAACTCCAGTCA", "AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGT", "33", ""] + fastqs + [""]) + "\n")
+
+    # First contrast alternates controls and treatments, second one compares both halves of samples
+    for contrast_format in set(filter(None, SUITE_PIPELINES.values())):
+        with open(os.path.join(data_dir, "design." + contrast_format.format("") + ".tsv"), 'w') as design_file:
+            design_file.write("\t".join(["Sample"] + [contrast_format.format(contrast) for contrast in [1, 2]]) + "\n")
+            for i in range(nb_samples):
+                design_file.write("\t".join(["sample" + str(i + 1), "1" if i % 2 == 0 else "2", "1" if i < nb_samples // 2 else "2"]) + "\n")
+
+    return nb_samples
+
+# Append a benchmark record to a JSON history file, which contains a list of records
+def append_history(history_file, record):
+    history = []
+    if os.path.exists(history_file):
+        with open(history_file) as history_json:
+            history = json.load(history_json, object_pairs_hook=collections.OrderedDict)
+    history.append(record)
+    with open(history_file + ".tmp", 'w') as history_json:
+        json.dump(history, history_json, indent=2)
+        history_json.write("\n")
+    os.rename(history_file + ".tmp", history_file)
+
+def benchmark_pipelines(args):
+    """
+    Time create_jobs and submit_jobs of MUGQIC pipelines with synthetic readsets, designs and reference files.
+    Each pipeline runs all its steps in a new Python process, with module check disabled.
+    Peak memory is the maximum resident set size of the pipeline process; results are appended to a JSON history file.
+    """
+    source_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    pipeline_inis = dict([(pipeline, os.path.join(source_dir, "pipelines", pipeline, pipeline + ".base.ini")) for pipeline in args.pipelines])
+    extra_inis = [os.path.abspath(config_file) for config_file in args.config or []]
+    git = subprocess.Popen(["git", "rev-parse", "HEAD"], cwd=source_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    commit = git.communicate()[0].strip() or None
+
+    results = []
+    install_dir = tempfile.mkdtemp(prefix="mugqic_planning_benchmark.install.")
+    environment = dict(os.environ, MUGQIC_INSTALL_HOME=install_dir, MUGQIC_INSTALL_HOME_DEV=install_dir)
+    environment.setdefault("JOB_MAIL", "planning.benchmark@localhost")
+    environment.setdefault("RAP_ID", "planning_benchmark")
+    os.environ.update(environment)
+    print("\t".join(["Pipeline", "Readsets", "Samples", "Jobs", "create_jobs (s)", "submit_jobs (s)", "Process (s)", "Peak RSS (MB)"]))
+    try:
+        # Config files of different pipelines may define the same parameters with different values
+        for pipeline in args.pipelines:
+            write_synthetic_references(install_dir, [pipeline_inis[pipeline]] + extra_inis, args.contigs)
+        for nb_readsets in args.readsets:
+            data_dir = tempfile.mkdtemp(prefix="mugqic_planning_benchmark.")
+            try:
+                nb_samples = write_synthetic_readsets(data_dir, nb_readsets, args.readsets_per_sample)
+                for pipeline in args.pipelines:
+                    output_dir = os.path.join(data_dir, pipeline)
+                    os.makedirs(output_dir)
+                    result_file = os.path.join(output_dir, "benchmark.json")
+                    pipeline_args = ["-c", pipeline_inis[pipeline]] + extra_inis + ["-r", os.path.join(data_dir, "readsets.tsv"), "-o", output_dir, "-j", args.job_scheduler, "-l", "warning"]
+                    if SUITE_PIPELINES[pipeline]:
+                        pipeline_args.extend(["-d", os.path.join(data_dir, "design." + SUITE_PIPELINES[pipeline].format("") + ".tsv")])
+
+                    start = time.time()
+                    with open(os.devnull, 'w') as devnull:
+                        process = subprocess.Popen([sys.executable, "-c", SUITE_PIPELINE_CODE, result_file, os.path.join(source_dir, "pipelines", pipeline, pipeline + ".py")] + pipeline_args, cwd=output_dir, stdout=devnull, stderr=subprocess.PIPE, env=environment)
+                        stderr = process.communicate()[1]
+                    result = collections.OrderedDict([("pipeline", pipeline), ("readsets", nb_readsets), ("samples", nb_samples), ("process_seconds", time.time() - start)])
+
+                    if process.returncode == 0 and os.path.exists(result_file):
+                        with open(result_file) as result_json:
+                            result.update(sorted(json.load(result_json).items()))
+                        print("\t".join([pipeline, str(nb_readsets), str(nb_samples), str(result['jobs'])] + ["%.3f" % result[name] for name in ["create_jobs_seconds", "submit_jobs_seconds", "process_seconds"]] + ["%.1f" % result['peak_rss_mb']]))
+                    else:
+                        result['error'] = "\n".join(stderr.strip().splitlines()[-5:])
+                        log.error("Pipeline " + pipeline + " failed with " + str(nb_readsets) + " readsets:\n" + result['error'])
+                        print("\t".join([pipeline, str(nb_readsets), str(nb_samples), "failed", "NA", "NA", "%.3f" % result['process_seconds'], "NA"]))
+                    results.append(result)
+                    sys.stdout.flush()
+            finally:
+                shutil.rmtree(data_dir)
+    finally:
+        shutil.rmtree(install_dir)
+
+        append_history(args.history, collections.OrderedDict([
+            ("date", datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")),
+            ("commit", commit),
+            ("host", socket.gethostname()),
+            ("python", platform.python_version()),
+            ("job_scheduler", args.job_scheduler),
+            ("contigs", args.contigs),
+            ("readsets_per_sample", args.readsets_per_sample),
+            ("config", extra_inis),
+            ("results", results)
+        ]))
+        log.info("Benchmark results appended to " + args.history)
+
+#-------------------------------------------------------------------------------
+# Main script
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter, description="Planning benchmarks of MUGQIC pipelines core")
+    parser.add_argument("-l", "--log", help="log level (default: warning)", choices=["debug", "info", "warning", "error", "critical"], default="warning")
+    subparsers = parser.add_subparsers(title="benchmarks")
+
+    dependencies_parser = subparsers.add_parser("dependencies", help=benchmark_dependencies.__doc__.strip().split("\n")[0])
+    dependencies_parser.add_argument("-n", "--samples", help="list of sample numbers (default: 100 200 400 800)", nargs="+", type=int, default=[100, 200, 400, 800])
+    dependencies_parser.add_argument("-c", "--scatter", help="number of scattered jobs per sample (default: 20)", type=int, default=20)
+    dependencies_parser.add_argument("-s", "--command-size", help="size of job commands in characters (default: 1500)", type=int, default=1500)
+    dependencies_parser.add_argument("-p", "--processes", help="number of planning processes (default: 1)", type=int, default=1)
+    dependencies_parser.set_defaults(benchmark=benchmark_dependencies)
+
+    concat_parser = subparsers.add_parser("concat", help=benchmark_concat.__doc__.strip().split("\n")[0])
+    concat_parser.add_argument("-n", "--elements", help="list of job numbers (default: 1000 10000)", nargs="+", type=int, default=[1000, 10000])
+    concat_parser.set_defaults(benchmark=benchmark_concat)
+
+    reduction_parser = subparsers.add_parser("reduction", help=benchmark_reduction.__doc__.strip().split("\n")[0])
+    reduction_parser.add_argument("-n", "--samples", help="list of sample numbers (default: 100 1000 4000)", nargs="+", type=int, default=[100, 1000, 4000])
+    reduction_parser.add_argument("-c", "--scatter", help="number of scattered jobs per sample (default: 20)", type=int, default=20)
+    reduction_parser.set_defaults(benchmark=benchmark_reduction)
+
+    daemon_parser = subparsers.add_parser("daemon", help=benchmark_daemon.__doc__.strip().split("\n")[0])
+    daemon_parser.add_argument("-n", "--samples", help="list of sample numbers (default: 100 400)", nargs="+", type=int, default=[100, 400])
+    daemon_parser.add_argument("-c", "--scatter", help="number of scattered jobs per sample (default: 20)", type=int, default=20)
+    daemon_parser.add_argument("-s", "--command-size", help="size of job commands in characters (default: 1500)", type=int, default=1500)
+    daemon_parser.set_defaults(benchmark=benchmark_daemon)
+
+    startup_parser = subparsers.add_parser("startup", help=benchmark_startup.__doc__.strip().split("\n")[0])
+    startup_parser.add_argument("-r", "--repeats", help="number of runs of each pipeline (default: 5)", type=int, default=5)
+    startup_parser.add_argument("arguments", help="pipeline arguments, after \"--\" if they start with \"-\" (default: --help)", nargs=argparse.REMAINDER)
+    startup_parser.set_defaults(benchmark=benchmark_startup)
+
+    pipelines_parser = subparsers.add_parser("pipelines", help=benchmark_pipelines.__doc__.strip().split("\n")[0])
+    pipelines_parser.add_argument("-n", "--readsets", help="list of readset numbers (default: 10 1000 10000 100000)", nargs="+", type=int, default=[10, 1000, 10000, 100000])
+    pipelines_parser.add_argument("-p", "--pipelines", help="list of pipelines (default: " + " ".join(SUITE_PIPELINES) + ")", nargs="+", choices=SUITE_PIPELINES.keys(), default=SUITE_PIPELINES.keys())
+    pipelines_parser.add_argument("-r", "--readsets-per-sample", help="number of readsets per sample (default: 2)", type=int, default=2)
+    pipelines_parser.add_argument("-g", "--contigs", help="number of genome contigs, GRCh37 chromosomes first (default: 84)", type=int, default=84)
+    pipelines_parser.add_argument("-c", "--config", help="additional config files, e.g. to benchmark planning options", nargs="+")
+    # Only schedulers writing a submission script: 'direct' would submit jobs to the cluster and 'local' would run them
+    pipelines_parser.add_argument("-j", "--job-scheduler", help="job scheduler type, among those writing a submission script (default: pbs)", choices=["pbs", "batch", "slurm"], default="pbs")
+    pipelines_parser.add_argument("-H", "--history", help="JSON history file which benchmark results are appended to (default: planning_benchmark.history.json)", default="planning_benchmark.history.json")
+    pipelines_parser.set_defaults(benchmark=benchmark_pipelines)
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.log.upper()))
+
+    args.benchmark(args)